@@ -0,0 +1,137 @@
+"""
+Contrôle d'admission des scans
+Un nombre borné de scans s'exécute en même temps (FLIGHTWATCHER_SCAN_SLOTS) ; les autres
+attendent dans une file ordonnée par classe de priorité (interactif, puis auto-vérification,
+puis tâches de fond), chacun avec une échéance. Une requête dont l'attente prévue ou
+réelle dépasse son échéance est refusée tout de suite (Overloaded) : l'appelant répond
+depuis le cache ou renvoie 503, au lieu de laisser toutes les requêtes expirer.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+INTERACTIVE = 0
+AUTO_CHECK = 1
+BACKGROUND = 2
+CLASS_NAMES = {INTERACTIVE: "interactive", AUTO_CHECK: "auto_check", BACKGROUND: "background"}
+
+# Scans exécutés simultanément
+SCAN_SLOTS = int(os.getenv("FLIGHTWATCHER_SCAN_SLOTS", "4"))
+# Requêtes en attente au-delà desquelles tout nouvel arrivant est refusé
+MAX_QUEUE = int(os.getenv("FLIGHTWATCHER_ADMISSION_MAX_QUEUE", "50"))
+# Attente max en file (secondes) : interactif, auto-vérification (tâches de fond : sans limite)
+INTERACTIVE_QUEUE_TARGET = float(os.getenv("FLIGHTWATCHER_ADMISSION_QUEUE_TARGET", "5"))
+AUTO_CHECK_QUEUE_TARGET = float(os.getenv("FLIGHTWATCHER_ADMISSION_AUTO_CHECK_TARGET", "2"))
+QUEUE_TARGETS = {INTERACTIVE: INTERACTIVE_QUEUE_TARGET, AUTO_CHECK: AUTO_CHECK_QUEUE_TARGET, BACKGROUND: None}
+
+
+class Overloaded(Exception):
+    """Pas de créneau dans les délais ; retry_after : attente estimée (secondes)"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Service surchargé ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, slots: int = SCAN_SLOTS, max_queue: int = MAX_QUEUE):
+        self.slots = max(1, slots)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting: list = []  # tas de tickets (priorité, ordre d'arrivée)
+        self._order = itertools.count()
+        self._run_times: deque = deque(maxlen=200)
+        self._queue_times = {cls: deque(maxlen=500) for cls in CLASS_NAMES}
+        self._counters = {
+            cls: {"admitted": 0, "shed": 0, "timed_out": 0, "degraded": 0} for cls in CLASS_NAMES
+        }
+
+    def _typical_run_time(self) -> float:
+        if not self._run_times:
+            return 1.0
+        ordered = sorted(self._run_times)
+        return ordered[len(ordered) // 2]
+
+    def _expected_wait(self, ahead: int) -> float:
+        """Attente prévue avec `ahead` requêtes prioritaires devant (tous les créneaux occupés)"""
+        return (ahead // self.slots + 1) * self._typical_run_time()
+
+    def acquire(self, priority: int, timeout: Optional[float] = None) -> None:
+        """Attend un créneau (timeout None : sans limite) ; lève Overloaded sinon"""
+        counters = self._counters[priority]
+        started = time.monotonic()
+        with self._cond:
+            if self._active >= self.slots and len(self._waiting) >= self.max_queue:
+                counters["shed"] += 1
+                raise Overloaded("file pleine", self._expected_wait(len(self._waiting)))
+            ticket = (priority, next(self._order))
+            ahead = sum(1 for waiting in self._waiting if waiting < ticket)
+            if timeout is not None and self._active >= self.slots and self._expected_wait(ahead) > timeout:
+                counters["shed"] += 1
+                raise Overloaded("attente prévue trop longue", self._expected_wait(ahead))
+
+            heapq.heappush(self._waiting, ticket)
+            deadline = None if timeout is None else started + timeout
+            while self._active >= self.slots or self._waiting[0] != ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    counters["timed_out"] += 1
+                    raise Overloaded("délai d'attente dépassé", self._expected_wait(len(self._waiting)))
+                self._cond.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            counters["admitted"] += 1
+            self._queue_times[priority].append(time.monotonic() - started)
+            # Le suivant dans la file peut avoir un créneau libre lui aussi
+            self._cond.notify_all()
+
+    def release(self, run_time: float) -> None:
+        with self._cond:
+            self._active -= 1
+            self._run_times.append(run_time)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int, timeout: Optional[float] = None):
+        """Créneau de scan : with admission.slot(INTERACTIVE, 5): ..."""
+        self.acquire(priority, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def record_degraded(self, priority: int) -> None:
+        """Requête refusée servie en mode dégradé (cache uniquement)"""
+        self._counters[priority]["degraded"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            active, waiting = self._active, len(self._waiting)
+        classes = {}
+        for cls, name in CLASS_NAMES.items():
+            times = sorted(self._queue_times[cls])
+            classes[name] = {
+                **self._counters[cls],
+                "queue_target_s": QUEUE_TARGETS[cls],
+                "queue_time_p50_ms": round(times[len(times) // 2] * 1000, 1) if times else None,
+                "queue_time_p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 1) if times else None,
+            }
+        return {
+            "slots": self.slots,
+            "active": active,
+            "waiting": waiting,
+            "typical_run_time_s": round(self._typical_run_time(), 3),
+            "classes": classes,
+        }
@@ -0,0 +1,151 @@
+"""
+Index des aéroports construit une seule fois depuis airports.csv
+Évite de re-parser le CSV à chaque appel de /api/airports
+"""
+import csv
+import os
+import threading
+from typing import Dict, List, Optional
+
+AIRPORTS_FILE = os.path.join(os.path.dirname(__file__), '..', 'ryanair-py', 'ryanair', 'airports.csv')
+
+# Mapping des codes pays ISO vers noms de pays (les plus courants)
+# Pour une solution complète, on pourrait utiliser pycountry
+COUNTRY_NAMES = {
+    'FR': 'France', 'GB': 'Royaume-Uni', 'ES': 'Espagne', 'IT': 'Italie',
+    'DE': 'Allemagne', 'PT': 'Portugal', 'GR': 'Grèce', 'IE': 'Irlande',
+    'BE': 'Belgique', 'NL': 'Pays-Bas', 'CH': 'Suisse', 'AT': 'Autriche',
+    'PL': 'Pologne', 'CZ': 'République tchèque', 'HU': 'Hongrie', 'RO': 'Roumanie',
+    'BG': 'Bulgarie', 'HR': 'Croatie', 'SI': 'Slovénie', 'SK': 'Slovaquie',
+    'DK': 'Danemark', 'SE': 'Suède', 'NO': 'Norvège', 'FI': 'Finlande',
+    'US': 'États-Unis', 'CA': 'Canada', 'MX': 'Mexique', 'BR': 'Brésil',
+    'AR': 'Argentine', 'CL': 'Chili', 'CO': 'Colombie', 'PE': 'Pérou',
+    'AU': 'Australie', 'NZ': 'Nouvelle-Zélande', 'JP': 'Japon', 'CN': 'Chine',
+    'IN': 'Inde', 'TH': 'Thaïlande', 'VN': 'Vietnam', 'PH': 'Philippines',
+    'ID': 'Indonésie', 'MY': 'Malaisie', 'SG': 'Singapour', 'AE': 'Émirats arabes unis',
+    'TR': 'Turquie', 'EG': 'Égypte', 'MA': 'Maroc', 'ZA': 'Afrique du Sud',
+    'IL': 'Israël', 'JO': 'Jordanie', 'LB': 'Liban', 'SA': 'Arabie saoudite',
+}
+
+# Codes ville IATA regroupant plusieurs aéroports (scan multi-départs)
+CITY_GROUPS = {
+    'PAR': ['BVA', 'CDG', 'ORY'],
+    'LON': ['STN', 'LTN', 'LGW', 'LHR', 'SEN'],
+    'MIL': ['BGY', 'MXP', 'LIN'],
+    'ROM': ['CIA', 'FCO'],
+    'STO': ['ARN', 'NYO'],
+    'BUH': ['OTP', 'BBU'],
+}
+
+_airports: Optional[List[Dict[str, str]]] = None
+_search_keys: List[str] = []
+_by_code: Dict[str, Dict[str, str]] = {}
+_lock = threading.Lock()
+
+
+def _build_index() -> None:
+    global _airports, _search_keys, _by_code
+
+    if not os.path.exists(AIRPORTS_FILE):
+        raise FileNotFoundError("Fichier airports.csv introuvable")
+
+    airports = []
+    with open(AIRPORTS_FILE, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            iata_code = row.get('iata_code', '').strip()
+            municipality = row.get('municipality', '').strip()
+            iso_country = row.get('iso_country', '').strip()
+            airport_name = row.get('name', '').strip()
+
+            # Ne garder que les aéroports avec un code IATA valide
+            if not iata_code or len(iata_code) != 3:
+                continue
+
+            airports.append({
+                'code': iata_code,
+                'name': airport_name or 'N/A',
+                'city': municipality or 'N/A',
+                'country': COUNTRY_NAMES.get(iso_country, iso_country),
+                # Champs bruts utilisés pour la recherche (non exposés)
+                '_name': airport_name,
+                '_city': municipality,
+            })
+
+    # Trier par code IATA
+    airports.sort(key=lambda x: x['code'])
+
+    # Pré-calculer une clé de recherche en minuscules par aéroport
+    _search_keys = [
+        '\n'.join((a['code'], a['_name'], a['_city'], a['country'])).lower()
+        for a in airports
+    ]
+    _airports = [{k: v for k, v in a.items() if not k.startswith('_')} for a in airports]
+    _by_code = {a['code']: a for a in _airports}
+
+
+def load_airports() -> List[Dict[str, str]]:
+    """Retourne la liste complète des aéroports (construit l'index au premier appel)"""
+    if _airports is None:
+        with _lock:
+            if _airports is None:
+                _build_index()
+    return _airports
+
+
+def source_fingerprint() -> Optional[List[float]]:
+    """(taille, mtime) d'airports.csv : un snapshot construit depuis un autre fichier est ignoré"""
+    try:
+        st = os.stat(AIRPORTS_FILE)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def export_snapshot() -> Optional[Dict[str, list]]:
+    """Index construit pour le snapshot (None s'il n'a pas encore été construit)"""
+    if _airports is None:
+        return None
+    return {"airports": _airports, "search_keys": _search_keys}
+
+
+def restore_snapshot(data: Dict[str, list]) -> int:
+    """Reprend l'index d'un snapshot sans re-parser le CSV ; retourne le nombre d'aéroports"""
+    global _airports, _search_keys, _by_code
+    airports, search_keys = data["airports"], data["search_keys"]
+    if len(airports) != len(search_keys):
+        raise ValueError("index des aéroports incohérent")
+    with _lock:
+        if _airports is not None:
+            return 0
+        _search_keys = search_keys
+        _by_code = {a['code']: a for a in airports}
+        _airports = airports
+    return len(airports)
+
+
+def search_airports(query: Optional[str] = None) -> List[Dict[str, str]]:
+    """Filtre les aéroports par code, nom, ville ou pays"""
+    airports = load_airports()
+    if not query:
+        return list(airports)
+
+    query_lower = query.lower()
+    return [a for a, key in zip(airports, _search_keys) if query_lower in key]
+
+
+def get_airport(code: str) -> Optional[Dict[str, str]]:
+    """Retourne un aéroport par code IATA"""
+    load_airports()
+    return _by_code.get(code)
+
+
+def expand_origins(codes: List[str]) -> List[str]:
+    """Remplace les codes ville (PAR, LON...) par leurs aéroports, sans doublons, dans l'ordre"""
+    origins: List[str] = []
+    for code in codes:
+        code = code.strip().upper()
+        for airport in CITY_GROUPS.get(code, [code]):
+            if airport and airport not in origins:
+                origins.append(airport)
+    return origins
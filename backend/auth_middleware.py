@@ -1,78 +1,224 @@
 """
 Middleware d'authentification pour FastAPI
 Valide les tokens JWT Supabase et extrait le user_id
+- Signature vérifiée avec le jeu de clés publiques (JWKS) du projet, mis en cache
+  et rafraîchi périodiquement ; secret HS256 (SUPABASE_JWT_SECRET) pour les projets
+  qui signent encore avec le secret partagé
+- Claims validés mis en cache (clé : hash du token) jusqu'à leur expiration
+- user_id résolu une seule fois par requête (request.state.user_id) ; dans les endpoints
+  async, une vérification non mise en cache (téléchargement JWKS possible) part dans un thread
 """
 from fastapi import Request, HTTPException, status
-from typing import Optional
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
 import jwt
 import os
+import threading
+import time
 from functools import wraps
 
-# Clé publique Supabase pour valider les tokens JWT
-# Récupérée depuis https://your-project.supabase.co/.well-known/jwks.json
-# Pour simplifier, on utilise la validation via Supabase directement
+from ttl_cache import TTLCache
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
+# Secret partagé (projets Supabase signant en HS256)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+# Clés publiques : endpoint JWKS du projet par défaut (file:// accepté pour un jeu de clés local)
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else ""
+)
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+# Durée de vie du jeu de clés en cache avant rafraîchissement (secondes)
+JWKS_REFRESH_SECONDS = int(os.getenv("FLIGHTWATCHER_JWKS_REFRESH", "600"))
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+# Claims des tokens valides : hash du token -> claims (expire avec le token)
+_verified_tokens = TTLCache(max_size=10000, ttl_seconds=3600)
+# Tokens rejetés récemment (évite de re-vérifier en boucle un token invalide) ; seules les
+# erreurs de validation définitives y entrent, pas une indisponibilité du JWKS
+_rejected_tokens = TTLCache(max_size=10000, ttl_seconds=60)
+
+_jwks_client: Optional[jwt.PyJWKClient] = None
+_jwks_lock = threading.Lock()
+_counters = {"verifications": 0, "rejections": 0, "jwks_errors": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    # verify_token tourne dans des threads (asyncio.to_thread) : += n'est pas atomique
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _get_jwks_client() -> Optional[jwt.PyJWKClient]:
+    global _jwks_client
+    if not SUPABASE_JWKS_URL:
+        return None
+    if _jwks_client is None:
+        with _jwks_lock:
+            if _jwks_client is None:
+                _jwks_client = jwt.PyJWKClient(
+                    SUPABASE_JWKS_URL, cache_keys=True, lifespan=JWKS_REFRESH_SECONDS, timeout=5
+                )
+    return _jwks_client
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _decode(token: str) -> Dict[str, Any]:
+    """Vérifie signature, expiration et audience ; lève une exception si invalide"""
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    options = {"require": ["exp", "sub"]}
+
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise jwt.InvalidTokenError("SUPABASE_JWT_SECRET requis pour les tokens HS256")
+        return jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=["HS256"],
+                          audience=JWT_AUDIENCE, options=options)
+
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise jwt.InvalidAlgorithmError(f"Algorithme non accepté: {algorithm}")
+    client = _get_jwks_client()
+    if client is None:
+        raise jwt.InvalidTokenError("SUPABASE_URL ou SUPABASE_JWKS_URL requis pour vérifier le token")
+    # Un kid inconnu déclenche un rechargement du jeu de clés (rotation)
+    signing_key = client.get_signing_key_from_jwt(token)
+    return jwt.decode(token, signing_key.key, algorithms=[algorithm],
+                      audience=JWT_AUDIENCE, options=options)
+
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Retourne les claims d'un token valide, None sinon.
+    Les résultats sont mis en cache : un token déjà vérifié ne coûte qu'une lecture.
+    """
+    key = _token_hash(token)
+    claims = _verified_tokens.get(key)
+    if claims is not None:
+        if claims["exp"] > time.time():
+            return claims
+        _verified_tokens.delete(key)
+    if _rejected_tokens.get(key) is not None:
+        return None
+
+    try:
+        claims = _decode(token)
+    except jwt.PyJWKClientConnectionError as e:
+        # JWKS injoignable : erreur passagère, le token sera re-vérifié à la prochaine requête
+        _count("jwks_errors")
+        print(f"⚠️ Jeu de clés JWKS indisponible: {e}")
+        return None
+    except (jwt.InvalidTokenError, jwt.PyJWKClientError) as e:
+        # Token invalide, expiré ou signé par une clé inconnue (après rechargement du JWKS)
+        _count("rejections")
+        _rejected_tokens.set(key, True)
+        print(f"Erreur décodage token: {e}")
+        return None
+    except Exception as e:
+        _count("rejections")
+        print(f"Erreur décodage token: {e}")
+        return None
+
+    _count("verifications")
+    _verified_tokens.set(key, claims, ttl_seconds=max(claims["exp"] - time.time(), 1))
+    return claims
+
 
 def get_user_id_from_token(request: Request) -> Optional[str]:
     """
     Extrait le user_id depuis le token JWT dans les headers Authorization
     Retourne None si pas de token ou token invalide
+    Le résultat est attaché à la requête : les appels suivants ne refont rien.
     """
+    if hasattr(request.state, "user_id"):
+        return request.state.user_id
+
+    user_id = None
+    # Format: "Bearer <token>"
+    token = _bearer_token(request)
+    if token:
+        claims = verify_token(token)
+        # Le user_id est dans le champ "sub" du token
+        user_id = claims.get("sub") if claims else None
+
+    request.state.user_id = user_id
+    return user_id
+
+
+def _bearer_token(request: Request) -> Optional[str]:
     auth_header = request.headers.get("Authorization")
-    
     if not auth_header:
         return None
-    
-    try:
-        # Format: "Bearer <token>"
-        token = auth_header.replace("Bearer ", "").strip()
-        
-        if not token:
-            return None
-        
-        # Décoder le token JWT (sans vérification pour l'instant)
-        # En production, il faudrait vérifier la signature avec la clé publique Supabase
-        decoded = jwt.decode(token, options={"verify_signature": False})
-        
-        # Le user_id est dans le champ "sub" du token
-        user_id = decoded.get("sub")
-        
-        return user_id
-    except Exception as e:
-        print(f"Erreur décodage token: {e}")
-        return None
+    return auth_header.replace("Bearer ", "").strip() or None
+
+
+async def resolve_user_id(request: Request) -> Optional[str]:
+    """
+    Équivalent de get_user_id_from_token pour le code async : hors cache, la vérification
+    (qui peut télécharger le JWKS, jusqu'à 5 s) tourne dans un thread et ne bloque pas la boucle.
+    """
+    if hasattr(request.state, "user_id"):
+        return request.state.user_id
+    token = _bearer_token(request)
+    if token is None or _verified_tokens.get(_token_hash(token)) is not None:
+        return get_user_id_from_token(request)
+    return await asyncio.to_thread(get_user_id_from_token, request)
+
+
+def _find_request(args, kwargs) -> Optional[Request]:
+    """Retrouve la requête HTTP parmi les arguments de l'endpoint"""
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, Request):
+            return value
+    return None
+
 
 def require_auth(func):
     """
     Décorateur pour protéger les endpoints qui nécessitent une authentification
     """
     @wraps(func)
-    async def wrapper(request: Request, *args, **kwargs):
-        user_id = get_user_id_from_token(request)
-        
+    async def wrapper(*args, **kwargs):
+        request = _find_request(args, kwargs)
+        user_id = await resolve_user_id(request) if request is not None else None
+
         if not user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Authentification requise"
             )
-        
-        # Ajouter user_id au request state pour utilisation dans la fonction
-        request.state.user_id = user_id
-        
-        return await func(request, *args, **kwargs)
-    
+
+        return await func(*args, **kwargs)
+
     return wrapper
 
+
 def optional_auth(func):
     """
     Décorateur pour les endpoints qui fonctionnent avec ou sans authentification
     """
     @wraps(func)
-    async def wrapper(request: Request, *args, **kwargs):
-        user_id = get_user_id_from_token(request)
-        request.state.user_id = user_id  # Peut être None
-        return await func(request, *args, **kwargs)
-    
+    async def wrapper(*args, **kwargs):
+        request = _find_request(args, kwargs)
+        if request is not None:
+            await resolve_user_id(request)  # request.state.user_id, peut être None
+        return await func(*args, **kwargs)
+
     return wrapper
 
+
+def auth_stats() -> Dict[str, Any]:
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        **counters,
+        "verified_cache": _verified_tokens.stats(),
+        "rejected_cache_size": len(_rejected_tokens),
+        "jwks_url": SUPABASE_JWKS_URL or None,
+        "hs256_secret_configured": bool(SUPABASE_JWT_SECRET),
+    }
@@ -0,0 +1,209 @@
+"""
+Intervalle adaptatif des auto-vérifications
+Le client vérifie à intervalle fixe (interval_seconds, choisi par l'utilisateur) ;
+l'intervalle effectif s'allonge tant que les résultats d'une recherche ne changent
+pas (taux de changement lissé sur les vérifications successives), revient au minimum
+dès qu'un changement est observé et reste court à l'approche du départ. Une
+vérification arrivée avant l'échéance est servie avec les derniers résultats, sans
+appel à l'API. L'état est conservé dans auto_checks.json (derniers résultats encodés
+par result_codec) ; il est réécrit à chaque vérification réelle, pas à chaque passage
+ignoré (compteurs tenus en mémoire jusqu'à la prochaine écriture ou flush()).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from result_codec import decode_results, encode_results_text
+
+AUTO_CHECKS_FILE = os.getenv(
+    "FLIGHTWATCHER_AUTO_CHECKS_FILE",
+    os.path.join(os.path.dirname(__file__), "auto_checks.json")
+)
+# Intervalle max par défaut = interval_seconds x ce facteur (borné par MAX_INTERVAL_SECONDS) :
+# avec l'intervalle du client (300 s par défaut, jusqu'à 3600 s), 20 min à 3 h au plus
+DEFAULT_MAX_FACTOR = int(os.getenv("FLIGHTWATCHER_AUTO_CHECK_MAX_FACTOR", "4"))
+MAX_INTERVAL_SECONDS = int(os.getenv("FLIGHTWATCHER_AUTO_CHECK_MAX_INTERVAL", "10800"))
+# Lissage du taux de changement (poids de la dernière vérification)
+CHANGE_RATE_ALPHA = 0.3
+# Marge sur l'échéance : un client en avance de quelques secondes n'est pas ignoré
+DUE_TOLERANCE = 0.05
+
+
+def results_signature(results: List[Dict[str, Any]]) -> str:
+    """Empreinte des résultats : un voyage ajouté, retiré ou un prix modifié la change"""
+    trips = sorted(
+        (r["destination_code"], r["aller"]["departureTime"], r["retour"]["departureTime"], round(r["prix_total"], 2))
+        for r in results
+    )
+    return hashlib.md5(json.dumps(trips).encode()).hexdigest()
+
+
+def request_signature(search_request: Dict[str, Any]) -> str:
+    return hashlib.md5(json.dumps(search_request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _days_to_departure(search_request: Dict[str, Any]) -> Optional[int]:
+    days = []
+    for d in search_request.get("dates_depart") or []:
+        try:
+            days.append((date.fromisoformat(str(d["date"])[:10]) - date.today()).days)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return min(days) if days else None
+
+
+def interval_bounds(interval_seconds: int, interval_max_seconds: Optional[int],
+                    search_request: Dict[str, Any]) -> Tuple[int, int]:
+    """(min, max) de l'intervalle effectif ; le max se resserre à l'approche du départ"""
+    minimum = max(int(interval_seconds), 1)
+    maximum = interval_max_seconds or min(minimum * DEFAULT_MAX_FACTOR, MAX_INTERVAL_SECONDS)
+    days = _days_to_departure(search_request)
+    if days is not None:
+        if days <= 2:
+            maximum = minimum
+        elif days <= 7:
+            maximum = min(maximum, minimum * 4)
+        elif days <= 30:
+            maximum = min(maximum, minimum * 8)
+    return minimum, max(minimum, int(maximum))
+
+
+class AutoCheckPolicy:
+    """État par recherche (search_id) : taux de changement, dernière vérification, économies"""
+
+    def __init__(self, path: str = AUTO_CHECKS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checks: Optional[Dict[str, Dict[str, Any]]] = None
+        # Compteurs de passages ignorés modifiés depuis la dernière écriture
+        self._dirty = False
+
+    # ---------- Persistance ----------
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._checks is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._checks = json.load(f)
+            except FileNotFoundError:
+                self._checks = {}
+            except Exception as e:
+                print(f"⚠️ Erreur lecture {self.path}: {e}")
+                self._checks = {}
+        return self._checks
+
+    def _save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._checks, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            print(f"⚠️ Erreur écriture {self.path}: {e}")
+
+    def flush(self) -> None:
+        """Écrit les compteurs de passages ignorés encore en mémoire (arrêt du processus)"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    # ---------- Décision ----------
+
+    def due(self, search_id: Optional[str], search_request: Dict[str, Any], interval_seconds: int,
+            interval_max_seconds: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        None si la vérification doit interroger l'API ; sinon la réponse à servir
+        ({"results", "next_check_seconds"}) tirée de la dernière vérification réelle.
+        """
+        if not search_id:
+            return None
+        with self._lock:
+            state = self._load().get(search_id)
+            if not state or state.get("request_signature") != request_signature(search_request):
+                return None
+            minimum, maximum = interval_bounds(interval_seconds, interval_max_seconds, search_request)
+            effective = min(max(state.get("effective_interval_seconds", minimum), minimum), maximum)
+            elapsed = time.time() - state.get("last_check_ts", 0)
+            if elapsed >= effective * (1 - DUE_TOLERANCE):
+                return None
+            state["skipped"] = state.get("skipped", 0) + 1
+            # Estimation : la vérification évitée aurait coûté autant que la dernière
+            state["queries_saved"] = state.get("queries_saved", 0) + state.get("nombre_requetes", 0)
+            # Pas d'écriture ici : persistés avec la prochaine vérification réelle (ou flush)
+            self._dirty = True
+            return {
+                "results": decode_results(state.get("last_results")),
+                "next_check_seconds": int(effective - elapsed),
+            }
+
+    def record(self, search_id: Optional[str], search_request: Dict[str, Any], interval_seconds: int,
+               interval_max_seconds: Optional[int], results: List[Dict[str, Any]], num_queries: int) -> int:
+        """Enregistre une vérification réelle ; retourne l'intervalle effectif suivant (secondes)"""
+        minimum, maximum = interval_bounds(interval_seconds, interval_max_seconds, search_request)
+        if not search_id:
+            return minimum
+        with self._lock:
+            checks = self._load()
+            state = checks.get(search_id, {})
+            signature = results_signature(results)
+            same_request = state.get("request_signature") == request_signature(search_request)
+            changed = not same_request or state.get("results_signature") != signature
+
+            # Sans historique, on considère que tout change (intervalle minimal)
+            rate = state.get("change_rate", 1.0) if same_request else 1.0
+            rate = CHANGE_RATE_ALPHA * (1.0 if changed else 0.0) + (1 - CHANGE_RATE_ALPHA) * rate
+            if changed:
+                effective = minimum
+            else:
+                effective = min(maximum, int(minimum / max(rate, minimum / maximum)))
+
+            state.update({
+                "enabled": True,
+                "interval_seconds": minimum,
+                "interval_max_seconds": maximum,
+                "effective_interval_seconds": effective,
+                "change_rate": round(rate, 4),
+                "search_request": search_request,
+                "request_signature": request_signature(search_request),
+                "results_signature": signature,
+                "last_check": datetime.now().isoformat(),
+                "last_check_ts": time.time(),
+                "last_results": encode_results_text(results),
+                "current_results_count": len(results),
+                "nombre_requetes": num_queries,
+                "checks": state.get("checks", 0) + 1,
+                "changes": state.get("changes", 0) + (1 if changed else 0),
+                "queries_used": state.get("queries_used", 0) + num_queries,
+            })
+            checks[search_id] = state
+            self._save()
+            return effective
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checks = dict(self._load())
+        searches = {
+            search_id: {
+                "interval_seconds": state.get("interval_seconds"),
+                "effective_interval_seconds": state.get("effective_interval_seconds"),
+                "change_rate": state.get("change_rate"),
+                "checks": state.get("checks", 0),
+                "changes": state.get("changes", 0),
+                "skipped": state.get("skipped", 0),
+                "queries_used": state.get("queries_used", 0),
+                "queries_saved": state.get("queries_saved", 0),
+            }
+            for search_id, state in checks.items()
+        }
+        return {
+            "searches": searches,
+            "checks": sum(s["checks"] for s in searches.values()),
+            "skipped": sum(s["skipped"] for s in searches.values()),
+            "queries_used": sum(s["queries_used"] for s in searches.values()),
+            "queries_saved": sum(s["queries_saved"] for s in searches.values()),
+        }
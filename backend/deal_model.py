@@ -0,0 +1,302 @@
+"""
+Modèle de score des bonnes affaires construit sur price_history
+Pour chaque route : histogrammes de prix par tranche d'anticipation (jours avant le vol)
+et jour de semaine du vol. Le rang percentile d'un tarif se lit en O(1) dans la
+distribution cumulée ; le modèle est ajusté hors-ligne depuis l'export colonnaire
+(price_analytics) puis mis à jour à chaque nouvelle observation.
+
+Usage :
+    python deal_model.py fit      # ajuste depuis l'export colonnaire et sauvegarde
+"""
+import os
+import sys
+import threading
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'data', 'deal_model.npz')
+
+# Tranches d'anticipation (jours avant le vol) : [0-6], [7-13], [14-29], [30-59], [60-119], [120+]
+LEAD_EDGES = np.array([0, 7, 14, 30, 60, 120])
+PRICE_BIN_WIDTH = 5.0
+PRICE_BINS = 100  # 0-500€ par pas de 5€, + une case de débordement
+# Observations minimales pour utiliser une cellule (sinon agrégation plus large)
+MIN_SAMPLES = 20
+# Percentile en dessous duquel un tarif est une bonne affaire
+GOOD_DEAL_PERCENTILE = 20.0
+# Baisse attendue (fraction) au-delà de laquelle on conseille d'attendre
+WAIT_THRESHOLD = 0.10
+# Fenêtre du prix moyen récent (jours d'observation), même définition que get_avg_price_last_30_days
+RECENT_DAYS = 30
+
+_EPOCH = date(1970, 1, 1)
+
+
+def _lead_bucket(lead_days):
+    return np.clip(np.searchsorted(LEAD_EDGES, lead_days, side="right") - 1, 0, len(LEAD_EDGES) - 1)
+
+
+def _price_bin(price):
+    return np.clip((np.asarray(price) // PRICE_BIN_WIDTH).astype(np.int64), 0, PRICE_BINS)
+
+
+class RouteModel:
+    """
+    Histogrammes d'une route : counts[tranche, jour de semaine, case de prix], et sommes
+    exactes des prix par jour d'observation sur les RECENT_DAYS derniers jours (prix moyen récent)
+    """
+
+    def __init__(self, counts: Optional[np.ndarray] = None, recent: Optional[Dict[int, List[float]]] = None):
+        self.counts = counts if counts is not None else np.zeros(
+            (len(LEAD_EDGES), 7, PRICE_BINS + 1), dtype=np.int32
+        )
+        # Jour d'observation -> [somme des prix, nombre]
+        self.recent: Dict[int, List[float]] = recent or {}
+        self._cdf: Optional[Dict[str, np.ndarray]] = None
+
+    def add(self, lead: np.ndarray, weekday: np.ndarray, prices: np.ndarray,
+            recorded_days: Optional[np.ndarray] = None, today_day: Optional[int] = None) -> None:
+        np.add.at(self.counts, (_lead_bucket(lead), weekday, _price_bin(prices)), 1)
+        self._cdf = None
+        if recorded_days is None:
+            return
+        today_day = today_day if today_day is not None else (date.today() - _EPOCH).days
+        oldest = today_day - RECENT_DAYS
+        mask = recorded_days > oldest
+        if mask.any():
+            days, inverse = np.unique(recorded_days[mask], return_inverse=True)
+            sums = np.bincount(inverse, weights=prices[mask])
+            counts = np.bincount(inverse)
+            for day, total, n in zip(days.tolist(), sums.tolist(), counts.tolist()):
+                entry = self.recent.setdefault(day, [0.0, 0])
+                entry[0] += total
+                entry[1] += n
+        for day in [d for d in self.recent if d <= oldest]:
+            del self.recent[day]
+
+    def _tables(self) -> Dict[str, np.ndarray]:
+        """Distributions cumulées (cellule, tranche seule, route entière), recalculées si modifiées"""
+        if self._cdf is None:
+            by_lead = self.counts.sum(axis=1)
+            self._cdf = {
+                "cell": np.cumsum(self.counts, axis=2),
+                "lead": np.cumsum(by_lead, axis=1),
+                "route": np.cumsum(by_lead.sum(axis=0)),
+            }
+        return self._cdf
+
+    def _distribution(self, lead_bucket: int, weekday: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(histogramme, cumul) le plus précis disposant d'assez d'observations"""
+        tables = self._tables()
+        cell = tables["cell"][lead_bucket, weekday]
+        if cell[-1] >= MIN_SAMPLES:
+            return self.counts[lead_bucket, weekday], cell
+        lead = tables["lead"][lead_bucket]
+        if lead[-1] >= MIN_SAMPLES:
+            return self.counts[lead_bucket].sum(axis=0), lead
+        return self.counts.sum(axis=(0, 1)), tables["route"]
+
+    @property
+    def observations(self) -> int:
+        return int(self._tables()["route"][-1])
+
+    def percentile(self, lead_days: int, weekday: int, price: float) -> Optional[float]:
+        hist, cdf = self._distribution(int(_lead_bucket(lead_days)), weekday)
+        total = cdf[-1]
+        if total < MIN_SAMPLES:
+            return None
+        b = int(_price_bin(price))
+        below = cdf[b - 1] if b > 0 else 0
+        return round(float((below + 0.5 * hist[b]) / total * 100), 1)
+
+    def median(self, lead_bucket: int, weekday: int) -> Optional[float]:
+        _, cdf = self._distribution(lead_bucket, weekday)
+        if cdf[-1] < MIN_SAMPLES:
+            return None
+        b = int(np.searchsorted(cdf, cdf[-1] / 2))
+        return (b + 0.5) * PRICE_BIN_WIDTH
+
+    def recent_mean(self, today_day: int, min_samples: int = 1) -> Optional[float]:
+        """Moyenne exacte des prix observés sur les RECENT_DAYS derniers jours"""
+        total, n = 0.0, 0
+        for day, (day_total, day_n) in self.recent.items():
+            if day > today_day - RECENT_DAYS:
+                total += day_total
+                n += day_n
+        if n < min_samples:
+            return None
+        return round(total / n, 2)
+
+
+class DealModel:
+    """Ensemble des modèles par route, avec verrou pour les mises à jour concurrentes"""
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteModel] = {}
+        self._lock = threading.Lock()
+
+    # ---------- Ajustement ----------
+
+    def observe(self, departure: str, destination: str, flight_days: np.ndarray,
+                recorded_days: np.ndarray, prices: np.ndarray) -> None:
+        """Ajoute des observations (jours depuis 1970-01-01) à une route"""
+        flight_days = np.asarray(flight_days, dtype=np.int64)
+        recorded_days = np.asarray(recorded_days, dtype=np.int64)
+        lead = flight_days - recorded_days
+        mask = lead >= 0
+        if not mask.any():
+            return
+        with self._lock:
+            model = self.routes.setdefault((departure, destination), RouteModel())
+            model.add(lead[mask], (flight_days[mask] + 3) % 7, np.asarray(prices, dtype=np.float64)[mask],
+                      recorded_days[mask])
+
+    def observe_records(self, price_records: List[Dict[str, Any]], today: Optional[date] = None) -> None:
+        """Mise à jour incrémentale depuis des lignes au format price_history"""
+        recorded_day = ((today or date.today()) - _EPOCH).days
+        grouped: Dict[Tuple[str, str], Tuple[List[int], List[float]]] = {}
+        for record in price_records:
+            try:
+                flight_day = (date.fromisoformat(record["flight_date"][:10]) - _EPOCH).days
+            except (KeyError, ValueError):
+                continue
+            days, prices = grouped.setdefault((record["departure_airport"], record["destination_code"]), ([], []))
+            days.append(flight_day)
+            prices.append(float(record["price"]))
+        for (departure, destination), (days, prices) in grouped.items():
+            self.observe(departure, destination, np.array(days), np.full(len(days), recorded_day), np.array(prices))
+
+    def fit_from_columns(self, root: Optional[str] = None) -> int:
+        """Ré-ajuste entièrement le modèle depuis l'export colonnaire de price_history"""
+        import price_analytics
+
+        fresh = DealModel()
+        rows = 0
+        for route in price_analytics.list_routes(root):
+            columns = price_analytics.load_route(route["departure_airport"], route["destination_code"], root=root)
+            fresh.observe(route["departure_airport"], route["destination_code"],
+                          columns["flight_day"], columns["recorded_day"], columns["price"])
+            rows += len(columns["price"])
+        with self._lock:
+            self.routes = fresh.routes
+        return rows
+
+    # ---------- Persistance ----------
+
+    def save(self, path: str = DEFAULT_MODEL_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            arrays = {f"{dep}-{dest}": model.counts for (dep, dest), model in self.routes.items()}
+            # Sommes récentes : [[jour, somme, nombre]] par route (clé "DEP-DEST.recent")
+            for (dep, dest), model in self.routes.items():
+                if model.recent:
+                    arrays[f"{dep}-{dest}.recent"] = np.array(
+                        [[day, total, n] for day, (total, n) in model.recent.items()], dtype=np.float64
+                    )
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str = DEFAULT_MODEL_PATH) -> bool:
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            routes = {
+                tuple(name.split("-", 1)): RouteModel(data[name].astype(np.int32))
+                for name in data.files if not name.endswith(".recent")
+            }
+            for name in data.files:
+                route = tuple(name[:-len(".recent")].split("-", 1))
+                if name.endswith(".recent") and route in routes:
+                    routes[route].recent = {int(day): [float(total), int(n)] for day, total, n in data[name]}
+        with self._lock:
+            self.routes = routes
+        return True
+
+    # ---------- Score ----------
+
+    def score_fare(self, departure: str, destination: str, flight_date: str, price: float,
+                   today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """
+        Rang percentile d'un tarif (0 = le moins cher jamais vu à cette anticipation)
+        et conseil acheter / attendre. None si la route n'a pas assez d'historique.
+        """
+        model = self.routes.get((departure, destination))
+        if model is None:
+            return None
+        flight_day = date.fromisoformat(flight_date[:10])
+        lead_days = max((flight_day - (today or date.today())).days, 0)
+        weekday = flight_day.weekday()
+
+        percentile = model.percentile(lead_days, weekday, price)
+        if percentile is None:
+            return None
+
+        # Les tranches plus proches du départ sont celles qui restent à venir
+        current_bucket = int(_lead_bucket(lead_days))
+        future_medians = [m for m in (model.median(b, weekday) for b in range(current_bucket)) if m is not None]
+        expected_price = min(future_medians) if future_medians else None
+        wait = expected_price is not None and expected_price < price * (1 - WAIT_THRESHOLD)
+        return {
+            "percentile": percentile,
+            "recommendation": "wait" if wait else "buy_now",
+            "expected_price": expected_price if wait else None,
+        }
+
+    def score_trip(self, trip: Dict[str, Any], today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """Score d'un aller-retour : percentile pondéré par le prix de chaque segment"""
+        scores = []
+        for leg in (trip["aller"], trip["retour"]):
+            score = self.score_fare(leg["origin"], leg["destination"], leg["departureTime"], leg["price"], today)
+            if score is None:
+                return None
+            scores.append((leg["price"], score))
+
+        total = sum(price for price, _ in scores) or 1.0
+        percentile = round(sum(price * s["percentile"] for price, s in scores) / total, 1)
+        expected_saving = sum(price - s["expected_price"] for price, s in scores if s["expected_price"] is not None)
+        wait = expected_saving > total * WAIT_THRESHOLD
+        return {
+            "percentile": percentile,
+            "is_good_deal": percentile <= GOOD_DEAL_PERCENTILE,
+            "recommendation": "wait" if wait else "buy_now",
+        }
+
+    def recent_mean(self, departure: str, destination: str, today: Optional[date] = None) -> Optional[float]:
+        """
+        Prix moyen des observations des RECENT_DAYS derniers jours (prix exacts, lecture en
+        mémoire), comme get_avg_price_last_30_days ; None sans assez d'observations récentes
+        """
+        model = self.routes.get((departure, destination))
+        if model is None:
+            return None
+        return model.recent_mean(((today or date.today()) - _EPOCH).days, MIN_SAMPLES)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "routes": len(self.routes),
+            "observations": sum(model.observations for model in self.routes.values()),
+        }
+
+
+# Instance partagée par le processus
+deal_model = DealModel()
+
+
+def load_or_fit(path: str = DEFAULT_MODEL_PATH) -> Dict[str, Any]:
+    """Charge le modèle sauvegardé, sinon l'ajuste depuis l'export colonnaire"""
+    if deal_model.load(path):
+        return {"loaded": path, **deal_model.stats()}
+    rows = deal_model.fit_from_columns()
+    return {"fitted_rows": rows, **deal_model.stats()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "fit":
+        rows = deal_model.fit_from_columns()
+        deal_model.save()
+        print(f"✅ Modèle ajusté sur {rows} observation(s) : {deal_model.stats()}")
+    else:
+        print(__doc__)
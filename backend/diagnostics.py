@@ -0,0 +1,398 @@
+"""
+Diagnostics du processus à chaud (endpoints /api/admin/diagnostics, FLIGHTWATCHER_DIAGNOSTICS=1)
+- Profileur CPU par échantillonnage : un thread relève la pile de tous les threads
+  (sys._current_frames) à intervalle fixe pendant N secondes. Sortie au format « folded »
+  (une ligne « thread;f1;f2;f3 N » par pile) lisible par flamegraph.pl, speedscope ou
+  inferno, et résumé des fonctions les plus présentes (inclusif et propre)
+- Mémoire : tracemalloc démarré à la demande (coût non nul tant qu'il est actif),
+  allocations groupées par module et différence avec un instantané de référence. Une
+  allocation est attribuée au module du backend le plus proche dans sa pile (une liste
+  construite via json ou functools compte pour le module qui l'a demandée)
+- Tailles des structures en mémoire (caches, files) enregistrées par register_structure :
+  nombre d'entrées et taille approximative (taille profonde d'un échantillon d'entrées)
+"""
+import gc
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+DIAGNOSTICS_ENABLED = os.getenv("FLIGHTWATCHER_DIAGNOSTICS", "0") == "1"
+# Accès : en-tête X-Admin-Token égal à ce jeton, ou utilisateur authentifié de la liste
+ADMIN_TOKEN = os.getenv("FLIGHTWATCHER_ADMIN_TOKEN", "")
+ADMIN_USER_IDS = {value.strip() for value in os.getenv("FLIGHTWATCHER_ADMIN_USER_IDS", "").split(",") if value.strip()}
+
+MAX_PROFILE_SECONDS = 300
+# Profondeur des piles tracemalloc par défaut (attribution au module du backend appelant)
+DEFAULT_TRACE_FRAMES = 10
+DEFAULT_INTERVAL_MS = 10
+# Entrées mesurées par structure pour estimer sa taille
+SIZE_SAMPLE = 50
+
+
+def is_admin(token: Optional[str], user_id: Optional[str]) -> bool:
+    if ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN):
+        return True
+    return bool(user_id) and user_id in ADMIN_USER_IDS
+
+
+def _short_path(filename: str) -> str:
+    """Chemin lisible : relatif au backend ou au site-packages"""
+    for root in sorted({os.path.dirname(__file__)} | {p for p in sys.path if p.endswith("-packages")},
+                       key=len, reverse=True):
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return os.path.basename(filename)
+
+
+# ==================== Profileur CPU ====================
+
+class SamplingProfiler:
+    """Un seul profilage à la fois ; le résultat reste lisible jusqu'au suivant"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self._stacks_lock = threading.Lock()
+        self._labels: Dict[Any, str] = {}
+        self._info: Dict[str, Any] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval_ms: float = DEFAULT_INTERVAL_MS) -> Dict[str, Any]:
+        """Démarre un profilage de seconds secondes ; ValueError si un profilage est en cours"""
+        with self._lock:
+            if self.running:
+                raise ValueError("Un profilage est déjà en cours")
+            seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+            interval = max(interval_ms, 1) / 1000
+            self._stop.clear()
+            with self._stacks_lock:
+                self._stacks = Counter()
+            self._info = {
+                "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+                "seconds": seconds,
+                "interval_ms": interval * 1000,
+                "samples": 0,
+                "sampling_overhead_ms": 0.0,
+            }
+            self._thread = threading.Thread(target=self._run, args=(seconds, interval),
+                                            name="diagnostics-profiler", daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(5)
+        return self.status()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self, seconds: float, interval: float) -> None:
+        own = threading.get_ident()
+        started = time.monotonic()
+        deadline = started + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            tick = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(stack)))
+            with self._stacks_lock:
+                self._stacks.update(stacks)
+            self._info["samples"] += 1
+            elapsed = time.perf_counter() - tick
+            self._info["sampling_overhead_ms"] += elapsed * 1000
+            self._stop.wait(max(0.0, interval - elapsed))
+        self._info["duration_s"] = round(time.monotonic() - started, 2)
+        self._info["finished_at"] = datetime.now().astimezone().isoformat(timespec="seconds")
+
+    def _filtered(self, focus: Optional[str]) -> Counter:
+        with self._stacks_lock:
+            stacks = Counter(self._stacks)
+        if not focus:
+            return stacks
+        return Counter({stack: count for stack, count in stacks.items() if focus in stack})
+
+    def folded(self, focus: Optional[str] = None) -> str:
+        """Piles au format folded (flamegraph.pl, speedscope, inferno) ; focus : sous-chaîne requise"""
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self._filtered(focus).items())) + "\n"
+
+    def summary(self, focus: Optional[str] = None, limit: int = 30) -> Dict[str, Any]:
+        """Fonctions les plus présentes : inclusif (dans la pile) et propre (en haut de pile)"""
+        stacks = self._filtered(focus)
+        inclusive: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        total = sum(stacks.values())
+
+        def top(counter: Counter) -> List[Dict[str, Any]]:
+            return [
+                {"function": function, "samples": count, "ratio": round(count / total, 3)}
+                for function, count in counter.most_common(limit)
+            ]
+
+        threads = Counter()
+        for stack, count in stacks.items():
+            threads[stack.split(";", 1)[0]] += count
+        return {
+            **self.status(),
+            "focus": focus,
+            "stack_samples": total,
+            "threads": dict(threads.most_common()),
+            "inclusive": top(inclusive),
+            "self": top(own),
+        }
+
+    def status(self) -> Dict[str, Any]:
+        info = dict(self._info)
+        if "sampling_overhead_ms" in info:
+            info["sampling_overhead_ms"] = round(info["sampling_overhead_ms"], 1)
+        return {"running": self.running, **info}
+
+
+# ==================== Mémoire ====================
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def _module_index() -> Dict[str, str]:
+    index = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, "__file__", None)
+        if filename:
+            index[os.path.abspath(filename)] = name
+    return index
+
+
+class MemoryTracker:
+    """tracemalloc à la demande, avec un instantané de référence pour les différences"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[str] = None
+
+    def start(self, frames: int = DEFAULT_TRACE_FRAMES) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+            self._set_baseline()
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+            self._baseline_at = None
+        return self.status()
+
+    def reset_baseline(self) -> Dict[str, Any]:
+        """L'instantané courant devient la référence ; ValueError si tracemalloc est arrêté"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise ValueError("tracemalloc n'est pas démarré")
+            self._set_baseline()
+        return self.status()
+
+    def _set_baseline(self) -> None:
+        self._baseline = self._take()
+        self._baseline_at = datetime.now().astimezone().isoformat(timespec="seconds")
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def snapshot(self, limit: int = 30) -> Dict[str, Any]:
+        """Allocations vivantes par module (taille, nombre) et écart avec la référence"""
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc n'est pas démarré")
+        snapshot = self._take()
+        index = _module_index()
+        owners: Dict[tracemalloc.Traceback, str] = {}
+
+        def owner(traceback: tracemalloc.Traceback) -> str:
+            # Frames du plus ancien au plus récent : le module du backend le plus proche de l'allocation
+            name = owners.get(traceback)
+            if name is None:
+                frames = list(traceback)
+                frame = next((f for f in reversed(frames) if os.path.abspath(f.filename).startswith(_BACKEND_DIR)),
+                             frames[-1])
+                name = index.get(os.path.abspath(frame.filename)) or _short_path(frame.filename)
+                owners[traceback] = name
+            return name
+
+        modules: Dict[str, Dict[str, int]] = {}
+        for stat in snapshot.statistics("traceback"):
+            entry = modules.setdefault(owner(stat.traceback), {"size": 0, "count": 0, "size_diff": 0, "count_diff": 0})
+            entry["size"] += stat.size
+            entry["count"] += stat.count
+        baseline = self._baseline
+        if baseline is not None:
+            for stat in snapshot.compare_to(baseline, "traceback"):
+                entry = modules.setdefault(owner(stat.traceback),
+                                           {"size": 0, "count": 0, "size_diff": 0, "count_diff": 0})
+                entry["size_diff"] += stat.size_diff
+                entry["count_diff"] += stat.count_diff
+
+        def row(name: str, entry: Dict[str, int]) -> Dict[str, Any]:
+            return {
+                "module": name,
+                "size_kb": round(entry["size"] / 1024, 1),
+                "count": entry["count"],
+                "size_diff_kb": round(entry["size_diff"] / 1024, 1) if baseline is not None else None,
+                "count_diff": entry["count_diff"] if baseline is not None else None,
+            }
+
+        by_size = sorted(modules.items(), key=lambda item: item[1]["size"], reverse=True)
+        by_growth = sorted(modules.items(), key=lambda item: item[1]["size_diff"], reverse=True)
+        return {
+            **self.status(),
+            "modules": [row(name, entry) for name, entry in by_size[:limit]],
+            # Modules dont la mémoire a le plus augmenté depuis la référence (fuites)
+            "growth": [row(name, entry) for name, entry in by_growth[:limit] if entry["size_diff"] > 0]
+            if baseline is not None else [],
+        }
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_current_mb": round(current / 1024 / 1024, 2),
+            "traced_peak_mb": round(peak / 1024 / 1024, 2),
+            "baseline_at": self._baseline_at,
+        }
+
+
+# ==================== Structures en mémoire ====================
+
+_structures: Dict[str, Callable[[], Any]] = {}
+# Objets partagés par tout le processus : jamais comptés dans la taille d'une structure
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def register_structure(name: str, getter: Callable[[], Any]) -> None:
+    """getter() retourne la structure (dict, liste, file, TTLCache...) ; None si absente"""
+    _structures[name] = getter
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Taille approximative (octets) d'un objet et de ce qu'il référence (conteneurs, attributs)"""
+    seen = set() if seen is None else seen
+    pending = [obj]
+    size = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            pending.extend(item)
+        elif hasattr(item, "__dict__"):
+            pending.append(vars(item))
+        elif hasattr(item, "__slots__"):
+            pending.extend(getattr(item, slot) for slot in item.__slots__ if hasattr(item, slot))
+    return size
+
+
+def _entries(structure: Any) -> Any:
+    """Conteneur des entrées (TTLCache -> OrderedDict, queue.Queue -> deque)"""
+    for attribute in ("_data", "queue"):
+        inner = getattr(structure, attribute, None)
+        if isinstance(inner, (dict, deque, list)):
+            return inner
+    return structure
+
+
+def _structure_size(structure: Any) -> Dict[str, Any]:
+    entries = _entries(structure)
+    if not hasattr(entries, "__len__"):
+        qsize = getattr(entries, "qsize", None)
+        return {"type": type(structure).__name__, "entries": qsize() if qsize else None, "approx_kb": None}
+    count = len(entries)
+    items = list(entries.items()) if isinstance(entries, dict) else list(entries)
+    if count <= SIZE_SAMPLE:
+        size = deep_sizeof(entries)
+    else:
+        # Entrées réparties sur tout le conteneur, taille moyenne extrapolée
+        step = count / SIZE_SAMPLE
+        sample = [items[int(i * step)] for i in range(SIZE_SAMPLE)]
+        size = sys.getsizeof(entries) + int(sum(deep_sizeof(item) for item in sample) / SIZE_SAMPLE * count)
+    return {"type": type(structure).__name__, "entries": count, "approx_kb": round(size / 1024, 1)}
+
+
+def _process_memory_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        # Pic (et non courant) : seule valeur disponible hors Linux ; ko sous Linux, octets sous macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except (ImportError, OSError):
+        return None
+
+
+def structure_sizes() -> Dict[str, Any]:
+    structures = {}
+    for name, getter in sorted(_structures.items()):
+        try:
+            structure = getter()
+            structures[name] = _structure_size(structure) if structure is not None else None
+        except Exception as e:
+            structures[name] = {"error": str(e)}
+    return {
+        "process_rss_mb": _process_memory_mb(),
+        "threads": threading.active_count(),
+        "gc_counts": gc.get_count(),
+        "structures": structures,
+    }
+
+
+profiler = SamplingProfiler()
+memory = MemoryTracker()
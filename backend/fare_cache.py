@@ -0,0 +1,474 @@
+"""
+Cache des tarifs par segment (appels get_cheapest_flights)
+L1 mémoire -> L2 stockage local SQLite -> API Ryanair
+Les appels à l'API respectent l'échéance du scan (segment ignoré au-delà) et peuvent
+être doublés par une requête de couverture quand la réponse tarde (au-delà du p95).
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from ryanair import Ryanair
+from ryanair.types import Flight
+
+from fare_store import get_fare_store
+from ryanair_client import new_client
+from ttl_cache import TTLCache
+
+# Durée de vie d'un tarif en cache (les prix bougent : 15 min par défaut)
+FARE_TTL_SECONDS = int(os.getenv("FLIGHTWATCHER_FARE_TTL", "900"))
+
+# Clé: leg_key -> (max_price utilisé, [Flight])
+_l1_fares = TTLCache(max_size=20000, ttl_seconds=FARE_TTL_SECONDS)
+
+_counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0,
+             "deadline_skips": 0, "upstream_errors": 0, "hedged": 0, "hedge_wins": 0}
+# Compteurs incrémentés depuis les threads des scans et de _upstream_pool
+_counters_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        _counters[name] += 1
+
+# Requêtes de couverture : un second appel part si le premier dépasse le p95 observé
+HEDGE_REQUESTS = os.getenv("FLIGHTWATCHER_HEDGE_REQUESTS", "0") == "1"
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("FLIGHTWATCHER_HEDGE_MIN_DELAY_MS", "200")) / 1000
+HEDGE_MIN_SAMPLES = 20
+# Threads des appels avec échéance ou couverture (un appel abandonné termine en arrière-plan
+# et alimente quand même le cache)
+_upstream_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FLIGHTWATCHER_UPSTREAM_WORKERS", "32")), thread_name_prefix="upstream"
+)
+# Latences des appels réussis (secondes)
+_latencies: deque = deque(maxlen=500)
+
+# Calendrier des prix (tarif le moins cher par jour, un mois par requête)
+CALENDAR_URL = Ryanair.BASE_SERVICES_API_URL + "oneWayFares/{}/{}/cheapestPerDay"
+
+
+def flight_to_dict(flight: Flight) -> Dict[str, Any]:
+    return {
+        "departureTime": flight.departureTime.isoformat(),
+        "flightNumber": flight.flightNumber,
+        "price": flight.price,
+        "currency": flight.currency,
+        "origin": flight.origin,
+        "originFull": flight.originFull,
+        "destination": flight.destination,
+        "destinationFull": flight.destinationFull,
+    }
+
+
+def flight_from_dict(data: Dict[str, Any]) -> Flight:
+    return Flight(**{**data, "departureTime": datetime.fromisoformat(data["departureTime"])})
+
+
+def _format(value: Union[date, datetime, str]) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def make_leg_key(airport: str, date_from, date_to, destination_airport: Optional[str] = None,
+                 departure_time_from: str = "00:00", departure_time_to: str = "23:59") -> str:
+    """
+    Clé canonique d'un segment. Le prix max n'en fait pas partie : un résultat obtenu
+    avec un plafond plus haut (ou sans plafond) sert aussi les plafonds plus bas.
+    """
+    return "|".join((
+        airport, destination_airport or "*", _format(date_from), _format(date_to),
+        departure_time_from, departure_time_to,
+    ))
+
+
+class DeadlineExceeded(Exception):
+    """Échéance du scan atteinte avant la réponse de l'API : le segment est ignoré"""
+
+
+def hedge_delay() -> Optional[float]:
+    """Délai avant requête de couverture (p95 des latences), None sans assez de mesures"""
+    if len(_latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_latencies)
+    return max(ordered[int(len(ordered) * 0.95)], HEDGE_MIN_DELAY_SECONDS)
+
+
+def _covers(cached_max: Optional[float], requested_max: Optional[float]) -> bool:
+    if cached_max is None:
+        return True
+    return requested_max is not None and requested_max <= cached_max
+
+
+def _filter_price(flights: List[Flight], max_price: Optional[float]) -> List[Flight]:
+    if max_price is None:
+        return list(flights)
+    return [f for f in flights if f.price <= max_price]
+
+
+class FareFetcher:
+    """
+    Point d'accès aux tarifs pour un scan. L'API Ryanair n'est instanciée
+    qu'au premier appel réellement envoyé (un scan servi par le cache n'en crée pas).
+    refresh=True ignore les tarifs en cache (rafraîchissement) tout en les mettant à jour.
+    cache_only=True n'interroge jamais l'API : les segments absents du cache sont
+    notés dans self.missing (estimation du coût d'un scan) et retournent [].
+    deadline (time.monotonic()) : échéance du scan ; un segment non obtenu à temps lève
+    DeadlineExceeded. Les segments ignorés (échéance, erreur) sont listés dans skipped_legs.
+    """
+
+    def __init__(self, api_factory: Optional[Callable[[], Ryanair]] = None, refresh: bool = False,
+                 cache_only: bool = False, deadline: Optional[float] = None, hedge: bool = HEDGE_REQUESTS):
+        self._api_factory = api_factory or (lambda: new_client(currency="EUR"))
+        self._api: Optional[Ryanair] = None
+        self.refresh = refresh
+        self.cache_only = cache_only
+        self.missing = LegPlan() if cache_only else None
+        self.deadline = deadline
+        self.hedge = hedge
+        self.skipped_legs: List[Dict[str, str]] = []
+        self.num_queries = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    @property
+    def api(self) -> Ryanair:
+        if self._api is None:
+            self._api = self._api_factory()
+        return self._api
+
+    def get_cheapest_flights(self, airport: str, date_from, date_to,
+                             destination_airport: Optional[str] = None,
+                             departure_time_from: str = "00:00",
+                             departure_time_to: str = "23:59",
+                             max_price: Optional[int] = None) -> List[Flight]:
+        leg_key = make_leg_key(airport, date_from, date_to, destination_airport,
+                               departure_time_from, departure_time_to)
+
+        cached = None if self.refresh else self._lookup(leg_key, max_price)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        if self.cache_only:
+            return self.missing.get_cheapest_flights(airport, date_from, date_to, destination_airport,
+                                                     departure_time_from, departure_time_to, max_price)
+
+        _count("misses")
+
+        def call(api: Ryanair) -> List[Flight]:
+            flights = api.get_cheapest_flights(
+                airport=airport,
+                date_from=date_from,
+                date_to=date_to,
+                destination_airport=destination_airport,
+                departure_time_from=departure_time_from,
+                departure_time_to=departure_time_to,
+                max_price=max_price
+            )
+            store_fares(leg_key, max_price, flights)
+            return flights
+
+        return self._upstream(leg_key, call)
+
+    def get_fare_calendar(self, airport: str, destination_airport: str, month: date) -> List[Dict[str, Any]]:
+        """
+        Tarif le moins cher par jour d'une route pour un mois :
+        [{"day", "departureTime", "price", "currency"}] (jours sans vol exclus).
+        """
+        month_start = month.replace(day=1)
+        key = f"calendar|{airport}|{destination_airport}|{month_start.isoformat()[:7]}"
+
+        cached = None if self.refresh else self._lookup_raw(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        _count("misses")
+
+        def call(api: Ryanair) -> List[Dict[str, Any]]:
+            # ryanair-py n'expose pas ce endpoint : requête via sa session (retries et compteur inclus)
+            data = api._retryable_query(
+                CALENDAR_URL.format(airport, destination_airport),
+                {"outboundMonthOfDate": month_start.isoformat(), "currency": api.currency or "EUR"}
+            )
+            days = [
+                {
+                    "day": fare["day"],
+                    "departureTime": fare.get("departureDate") or fare["day"],
+                    "price": fare["price"]["value"],
+                    "currency": fare["price"]["currencyCode"],
+                }
+                for fare in (data.get("outbound") or {}).get("fares") or []
+                if fare.get("price") and not fare.get("unavailable") and not fare.get("soldOut")
+            ]
+            _l1_fares.set(key, (None, days))
+            store = get_fare_store()
+            if store is not None:
+                try:
+                    store.put_fares(key, None, days, FARE_TTL_SECONDS)
+                except Exception as e:
+                    print(f"⚠️ Erreur écriture tarifs locaux: {e}")
+            return days
+
+        return self._upstream(key, call)
+
+    def cached_leg(self, leg_key: str) -> Optional[Tuple[Optional[float], List[Flight]]]:
+        """
+        (plafond de prix utilisé, vols) d'un segment en cache, quel que soit le plafond :
+        permet de relire un segment récupéré par un scan (plafond = budget) sans requête.
+        """
+        if self.refresh:
+            return None
+        entry = _l1_fares.get(leg_key)
+        if entry is not None:
+            _count("l1_hits")
+            return entry
+        store = get_fare_store()
+        if store is None:
+            return None
+        try:
+            stored = store.get_fares(leg_key)
+        except Exception as e:
+            print(f"⚠️ Erreur lecture tarifs locaux: {e}")
+            return None
+        if stored is None:
+            return None
+        entry = (stored[0], [flight_from_dict(f) for f in stored[1]])
+        _l1_fares.set(leg_key, entry)
+        _count("l2_hits")
+        return entry
+
+    # ---------- Appels à l'API ----------
+
+    def _remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def _upstream(self, key: str, call: Callable[[Ryanair], Any]) -> Any:
+        """Appel à l'API (mise en cache comprise dans call) ; le segment est noté s'il échoue"""
+        try:
+            if self.deadline is None and not self.hedge:
+                return self._attempt(call, self.api)
+            return self._upstream_with_deadline(call)
+        except DeadlineExceeded:
+            _count("deadline_skips")
+            self.skipped_legs.append({"segment": key, "raison": "échéance"})
+            raise
+        except Exception as e:
+            _count("upstream_errors")
+            self.skipped_legs.append({"segment": key, "raison": str(e)})
+            raise
+
+    def _charge(self, queries: int) -> None:
+        with self._lock:
+            self.num_queries += queries
+
+    def _attempt(self, call: Callable[[Ryanair], Any], api: Optional[Ryanair] = None, charged: int = 0) -> Any:
+        """Un appel à l'API ; charged : requêtes déjà comptées à la soumission"""
+        api = api or self._api_factory()
+        before = api.num_queries
+        started = time.monotonic()
+        try:
+            result = call(api)
+        finally:
+            # Seuls les réessais au-delà de la requête déjà comptée s'ajoutent ici
+            self._charge(max(0, api.num_queries - before - charged))
+        _latencies.append(time.monotonic() - started)
+        return result
+
+    def _submit(self, call: Callable[[Ryanair], Any]):
+        """
+        Lance un appel dans _upstream_pool et le compte tout de suite : un appel abandonné
+        (échéance, couverture perdante) peut finir après le règlement du budget du scan.
+        L'appel garde le contexte de l'appelant (rattachement à la trace de la requête).
+        """
+        self._charge(1)
+        return _upstream_pool.submit(contextvars.copy_context().run, self._attempt, call, None, 1)
+
+    def _upstream_with_deadline(self, call: Callable[[Ryanair], Any]) -> Any:
+        remaining = self._remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("échéance du scan atteinte")
+
+        first = self._submit(call)
+        pending = {first}
+        delay = hedge_delay() if self.hedge else None
+        hedged = False
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = self._remaining()
+            if remaining is not None and remaining <= 0:
+                break
+            timeout = remaining
+            if delay is not None and not hedged:
+                timeout = delay if timeout is None else min(timeout, delay)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        _count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+            if not done and delay is not None and not hedged and (remaining is None or remaining > delay):
+                # Pas de réponse après le p95 : requête de couverture, la première réponse gagne
+                pending.add(self._submit(call))
+                hedged = True
+                _count("hedged")
+
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded("pas de réponse de l'API avant l'échéance du scan")
+
+    def _lookup_raw(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Entrée brute (déjà sérialisée) en L1 puis L2"""
+        entry = _l1_fares.get(key)
+        if entry is not None:
+            _count("l1_hits")
+            return entry[1]
+        store = get_fare_store()
+        if store is None:
+            return None
+        try:
+            stored = store.get_fares(key)
+        except Exception as e:
+            print(f"⚠️ Erreur lecture tarifs locaux: {e}")
+            return None
+        if stored is None:
+            return None
+        _l1_fares.set(key, stored)
+        _count("l2_hits")
+        return stored[1]
+
+    def _lookup(self, leg_key: str, max_price: Optional[float]) -> Optional[List[Flight]]:
+        entry: Optional[Tuple[Optional[float], List[Flight]]] = _l1_fares.get(leg_key)
+        if entry is not None and _covers(entry[0], max_price):
+            _count("l1_hits")
+            return _filter_price(entry[1], max_price)
+
+        store = get_fare_store()
+        if store is None:
+            return None
+        try:
+            stored = store.get_fares(leg_key)
+        except Exception as e:
+            print(f"⚠️ Erreur lecture tarifs locaux: {e}")
+            return None
+        if stored is None or not _covers(stored[0], max_price):
+            return None
+
+        flights = [flight_from_dict(f) for f in stored[1]]
+        _l1_fares.set(leg_key, (stored[0], flights))
+        _count("l2_hits")
+        return _filter_price(flights, max_price)
+
+
+class LegPlan:
+    """
+    Collecte les segments qu'un ou plusieurs scans vont demander, sans les exécuter :
+    même interface que FareFetcher.get_cheapest_flights (retourne []). Les segments
+    identiques sont dédupliqués en gardant le plafond de prix le plus large, puis
+    execute() les récupère une seule fois dans le cache.
+    """
+
+    def __init__(self):
+        self.legs: Dict[str, Dict[str, Any]] = {}
+
+    def get_cheapest_flights(self, airport: str, date_from, date_to,
+                             destination_airport: Optional[str] = None,
+                             departure_time_from: str = "00:00",
+                             departure_time_to: str = "23:59",
+                             max_price: Optional[int] = None) -> List[Flight]:
+        leg_key = make_leg_key(airport, date_from, date_to, destination_airport,
+                               departure_time_from, departure_time_to)
+        current = self.legs.get(leg_key)
+        if current is None or (current["max_price"] is not None and (max_price is None or max_price > current["max_price"])):
+            self.legs[leg_key] = {
+                "airport": airport, "date_from": date_from, "date_to": date_to,
+                "destination_airport": destination_airport,
+                "departure_time_from": departure_time_from, "departure_time_to": departure_time_to,
+                "max_price": max_price,
+            }
+        return []
+
+    def execute(self, workers: int = 4, refresh: bool = False) -> int:
+        """Récupère les segments (en parallèle, un FareFetcher par thread) ; retourne le nombre de requêtes API"""
+        legs = list(self.legs.values())
+        if not legs:
+            return 0
+        chunks = [legs[i::workers] for i in range(min(workers, len(legs)))]
+        fetchers = [FareFetcher(refresh=refresh) for _ in chunks]
+
+        def run(index: int) -> None:
+            for leg in chunks[index]:
+                try:
+                    fetchers[index].get_cheapest_flights(**leg)
+                except Exception as e:
+                    print(f"  Erreur segment {leg['airport']} {leg['date_from']}: {e}")
+
+        # Un contexte copié par tâche : les appels restent rattachés à la trace de la requête
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run, i) for i in range(len(chunks))]
+            for future in futures:
+                future.result()
+        return sum(f.num_queries for f in fetchers)
+
+
+def store_fares(leg_key: str, max_price: Optional[float], flights: List[Flight]) -> None:
+    """Enregistre un résultat de segment en L1 et L2"""
+    _l1_fares.set(leg_key, (max_price, list(flights)))
+    store = get_fare_store()
+    if store is None:
+        return
+    try:
+        store.put_fares(leg_key, max_price, [flight_to_dict(f) for f in flights], FARE_TTL_SECONDS)
+    except Exception as e:
+        print(f"⚠️ Erreur écriture tarifs locaux: {e}")
+
+
+# Colonnes d'un vol dans le snapshot (liste compacte plutôt qu'un dict par vol)
+_SNAPSHOT_FLIGHT_FIELDS = ("departureTime", "flightNumber", "price", "currency",
+                           "origin", "originFull", "destination", "destinationFull")
+
+
+def export_snapshot() -> List[list]:
+    """
+    Entrées L1 pour le snapshot : [[leg_key, plafond, lignes, expires_at]]
+    (vols en listes de _SNAPSHOT_FLIGHT_FIELDS ; jours du calendrier tels quels)
+    """
+    entries = []
+    for key, (max_price, items), expires_at in _l1_fares.items():
+        if key.startswith("calendar|"):
+            rows = items
+        else:
+            rows = [[f.departureTime.isoformat(), f.flightNumber, f.price, f.currency,
+                     f.origin, f.originFull, f.destination, f.destinationFull] for f in items]
+        entries.append([key, max_price, rows, expires_at])
+    return entries
+
+
+def restore_snapshot(entries: List[list]) -> int:
+    """Réinsère en L1 les segments d'un snapshot encore valides ; retourne le nombre restauré"""
+    now = time.time()
+    restored = 0
+    for key, max_price, rows, expires_at in entries:
+        if expires_at < now:
+            continue
+        if key.startswith("calendar|"):
+            items = rows
+        else:
+            items = [flight_from_dict(dict(zip(_SNAPSHOT_FLIGHT_FIELDS, row))) for row in rows]
+        restored += _l1_fares.restore(key, (max_price, items), expires_at)
+    return restored
+
+
+def stats() -> Dict[str, Any]:
+    with _counters_lock:
+        counters = dict(_counters)
+    return {**counters, "hedge_delay_ms": round(hedge_delay() * 1000, 1) if hedge_delay() else None,
+            "l1": _l1_fares.stats()}
@@ -0,0 +1,535 @@
+"""
+Stockage local persistant (SQLite en mode WAL) pour FlightWatcher
+Cache L2 des tarifs et des résultats de scan + tampon d'historique des prix.
+L'historique brut ne garde que les derniers jours (table courte, index compacts) :
+la compaction le réduit en agrégats quotidiens par route (price_history_daily).
+Fonctionne sans aucun service externe (Supabase optionnel) et survit aux redémarrages.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from result_codec import decode_results, encode_results
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'fare_store.sqlite3')
+# Historique local conservé (jours, agrégats quotidiens) lors de la compaction
+DEFAULT_HISTORY_RETENTION_DAYS = 730
+# Observations brutes conservées (jours) avant réduction en agrégats quotidiens
+DEFAULT_RAW_HISTORY_DAYS = 14
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_results (
+    cache_key TEXT PRIMARY KEY,
+    departure_airport TEXT NOT NULL,
+    request TEXT NOT NULL,
+    results TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    fresh_until REAL,
+    expires_at REAL NOT NULL,
+    hit_count INTEGER DEFAULT 0,
+    last_hit_at REAL,
+    family_key TEXT,
+    scan_meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scan_results_expires ON scan_results(expires_at);
+
+CREATE TABLE IF NOT EXISTS fares (
+    leg_key TEXT PRIMARY KEY,
+    max_price REAL,
+    flights TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fares_expires ON fares(expires_at);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    departure_airport TEXT NOT NULL,
+    destination_code TEXT NOT NULL,
+    flight_date TEXT NOT NULL,
+    price REAL NOT NULL,
+    currency TEXT DEFAULT 'EUR',
+    airline TEXT DEFAULT 'Ryanair',
+    source TEXT DEFAULT 'api_scan',
+    flight_number TEXT,
+    synced INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_local_price_route ON price_history(departure_airport, destination_code, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_local_price_synced ON price_history(synced) WHERE synced = 0;
+
+CREATE TABLE IF NOT EXISTS price_history_daily (
+    departure_airport TEXT NOT NULL,
+    destination_code TEXT NOT NULL,
+    flight_date TEXT NOT NULL,
+    recorded_day TEXT NOT NULL,
+    min_price REAL NOT NULL,
+    max_price REAL NOT NULL,
+    sum_price REAL NOT NULL,
+    observations INTEGER NOT NULL,
+    PRIMARY KEY (departure_airport, destination_code, recorded_day, flight_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_local_price_daily_day ON price_history_daily(recorded_day);
+
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    results TEXT,
+    progress TEXT,
+    error TEXT,
+    num_queries INTEGER DEFAULT 0,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs(status);
+"""
+
+# Durée de conservation des jobs terminés (secondes)
+DEFAULT_JOB_RETENTION_SECONDS = 24 * 3600
+
+
+class FareStore:
+    """
+    Accès au fichier SQLite local. Une seule connexion protégée par un verrou :
+    les écritures sont courtes et le mode WAL laisse les lectures concurrentes.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Ajoute les colonnes apparues après la création d'un fichier existant"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(scan_results)")}
+        if "fresh_until" not in columns:
+            self._conn.execute("ALTER TABLE scan_results ADD COLUMN fresh_until REAL")
+        if "family_key" not in columns:
+            self._conn.execute("ALTER TABLE scan_results ADD COLUMN family_key TEXT")
+            self._conn.execute("ALTER TABLE scan_results ADD COLUMN scan_meta TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_scan_results_family ON scan_results(family_key, expires_at)"
+        )
+        job_columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(scan_jobs)")}
+        if "owner" not in job_columns:
+            self._conn.execute("ALTER TABLE scan_jobs ADD COLUMN owner TEXT")
+
+    def _execute(self, sql: str, params: Tuple = ()) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _fetchone(self, sql: str, params: Tuple = ()) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ==================== RÉSULTATS DE SCAN ====================
+
+    def get_scan_results(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Retourne l'entrée d'un scan en cache si elle n'est pas expirée :
+        {"results", "created_at", "fresh_until", "expires_at"} (horodatages epoch).
+        Entre fresh_until et expires_at, l'entrée est périmée mais encore servable.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created_at, fresh_until, expires_at FROM scan_results "
+                "WHERE cache_key = ? AND expires_at > ?",
+                (cache_key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE scan_results SET hit_count = hit_count + 1, last_hit_at = ? WHERE cache_key = ?",
+                (now, cache_key)
+            )
+        return self._scan_entry(row)
+
+    @staticmethod
+    def _scan_entry(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "results": decode_results(row["results"]),
+            "created_at": row["created_at"],
+            "fresh_until": row["fresh_until"] or row["expires_at"],
+            "expires_at": row["expires_at"],
+        }
+
+    def find_scan_family(self, family_key: str) -> List[Dict[str, Any]]:
+        """
+        Entrées non expirées d'une même famille (même aéroport et mêmes fenêtres de dates),
+        avec leurs métadonnées de scan, pour servir une requête plus restrictive.
+        """
+        rows = self._fetchall(
+            "SELECT cache_key, results, created_at, fresh_until, expires_at, scan_meta FROM scan_results "
+            "WHERE family_key = ? AND expires_at > ? AND scan_meta IS NOT NULL",
+            (family_key, time.time())
+        )
+        return [
+            {**self._scan_entry(row), "cache_key": row["cache_key"], "meta": json.loads(row["scan_meta"])}
+            for row in rows
+        ]
+
+    def put_scan_results(self, cache_key: str, departure_airport: str, request: Dict[str, Any],
+                         results: List[Dict[str, Any]], ttl_seconds: float,
+                         stale_seconds: float = 0, family_key: Optional[str] = None,
+                         meta: Optional[Dict[str, Any]] = None) -> None:
+        """Frais pendant ttl_seconds, puis servable (périmé) pendant stale_seconds (résultats encodés)"""
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO scan_results "
+            "(cache_key, departure_airport, request, results, created_at, fresh_until, expires_at, hit_count, "
+            "family_key, scan_meta) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+            (cache_key, departure_airport, json.dumps(request), encode_results(results),
+             now, now + ttl_seconds, now + ttl_seconds + stale_seconds,
+             family_key, json.dumps(meta) if meta is not None else None)
+        )
+
+    # ==================== TARIFS PAR SEGMENT ====================
+
+    def get_fares(self, leg_key: str) -> Optional[Tuple[Optional[float], List[Dict[str, Any]]]]:
+        """Retourne (max_price utilisé, vols) pour un segment en cache non expiré"""
+        row = self._fetchone(
+            "SELECT max_price, flights FROM fares WHERE leg_key = ? AND expires_at > ?",
+            (leg_key, time.time())
+        )
+        if row is None:
+            return None
+        return row["max_price"], json.loads(row["flights"])
+
+    def put_fares(self, leg_key: str, max_price: Optional[float], flights: List[Dict[str, Any]],
+                  ttl_seconds: float) -> None:
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO fares (leg_key, max_price, flights, fetched_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (leg_key, max_price, json.dumps(flights), now, now + ttl_seconds)
+        )
+
+    # ==================== HISTORIQUE DES PRIX ====================
+
+    def record_prices(self, price_records: List[Dict[str, Any]], synced: bool = False) -> None:
+        """Ajoute des observations de prix (même format que la table Supabase price_history)"""
+        if not price_records:
+            return
+        now = time.time()
+        rows = [
+            (
+                now,
+                r.get("departure_airport", ""),
+                r.get("destination_code", ""),
+                r.get("flight_date", ""),
+                r.get("price", 0),
+                r.get("currency", "EUR"),
+                r.get("airline", "Ryanair"),
+                r.get("source", "api_scan"),
+                r.get("flight_number", ""),
+                1 if synced else 0,
+            )
+            for r in price_records
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO price_history (recorded_at, departure_airport, destination_code, flight_date, "
+                "price, currency, airline, source, flight_number, synced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def get_unsynced_prices(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Observations pas encore poussées vers Supabase (tampon hors-ligne)"""
+        rows = self._fetchall(
+            "SELECT * FROM price_history WHERE synced = 0 ORDER BY id LIMIT ?", (limit,)
+        )
+        return [dict(row) for row in rows]
+
+    def mark_synced(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE price_history SET synced = 1 WHERE id = ?", [(i,) for i in ids])
+
+    def get_price_history_after(self, after_id: int, limit: int = 5000) -> List[Dict[str, Any]]:
+        """Observations d'id supérieur à after_id, dans l'ordre d'insertion (export incrémental)"""
+        rows = self._fetchall(
+            "SELECT id, recorded_at, departure_airport, destination_code, flight_date, price "
+            "FROM price_history WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def get_price_change_rate(self, departure_airport: str, days: int = 7,
+                              min_change: float = 0.02) -> Optional[float]:
+        """
+        Fréquence des changements de prix (changements par heure) observée sur les vols
+        au départ d'un aéroport : compare les observations successives d'un même vol.
+        None si pas assez d'observations répétées.
+        """
+        rows = self._fetchall(
+            "SELECT destination_code, flight_date, flight_number, price, recorded_at FROM price_history "
+            "WHERE departure_airport = ? AND recorded_at > ? "
+            "ORDER BY destination_code, flight_date, flight_number, recorded_at",
+            (departure_airport, time.time() - days * 86400)
+        )
+        changes = 0
+        hours = 0.0
+        previous = None
+        for row in rows:
+            flight = (row["destination_code"], row["flight_date"], row["flight_number"])
+            if previous is not None and previous[0] == flight and row["recorded_at"] > previous[2]:
+                hours += (row["recorded_at"] - previous[2]) / 3600
+                if previous[1] and abs(row["price"] - previous[1]) / previous[1] > min_change:
+                    changes += 1
+            previous = (flight, row["price"], row["recorded_at"])
+        if hours < 1:
+            return None
+        return changes / hours
+
+    def get_avg_price(self, departure_airport: str, destination_code: str, days: int = 30) -> Optional[float]:
+        """Équivalent local de get_avg_price_last_30_days (observations brutes + agrégats)"""
+        since = time.time() - days * 86400
+        row = self._fetchone(
+            "SELECT SUM(total) AS total, SUM(n) AS n FROM ("
+            "SELECT SUM(price) AS total, COUNT(*) AS n FROM price_history "
+            "WHERE departure_airport = ? AND destination_code = ? AND recorded_at > ? "
+            "UNION ALL "
+            "SELECT SUM(sum_price), SUM(observations) FROM price_history_daily "
+            "WHERE departure_airport = ? AND destination_code = ? AND recorded_day > date(?, 'unixepoch'))",
+            (departure_airport, destination_code, since, departure_airport, destination_code, since)
+        )
+        if row is None or not row["n"]:
+            return None
+        return round(float(row["total"]) / row["n"], 2)
+
+    def get_daily_prices(self, departure_airport: str, destination_code: str,
+                         days: int = 365) -> List[Dict[str, Any]]:
+        """Tendance d'une route : min, max, moyenne et nombre d'observations par jour"""
+        since = time.time() - days * 86400
+        rows = self._fetchall(
+            "SELECT day, MIN(lo) AS min_price, MAX(hi) AS max_price, SUM(total) AS total, SUM(n) AS n FROM ("
+            "SELECT date(recorded_at, 'unixepoch') AS day, MIN(price) AS lo, MAX(price) AS hi, "
+            "SUM(price) AS total, COUNT(*) AS n FROM price_history "
+            "WHERE departure_airport = ? AND destination_code = ? AND recorded_at > ? GROUP BY day "
+            "UNION ALL "
+            "SELECT recorded_day, MIN(min_price), MAX(max_price), SUM(sum_price), SUM(observations) "
+            "FROM price_history_daily "
+            "WHERE departure_airport = ? AND destination_code = ? AND recorded_day > date(?, 'unixepoch') "
+            "GROUP BY recorded_day) GROUP BY day ORDER BY day",
+            (departure_airport, destination_code, since, departure_airport, destination_code, since)
+        )
+        return [
+            {
+                "day": row["day"],
+                "min_price": round(row["min_price"], 2),
+                "max_price": round(row["max_price"], 2),
+                "avg_price": round(row["total"] / row["n"], 2),
+                "observations": row["n"],
+            }
+            for row in rows
+        ]
+
+    def _rollup_price_history(self, before: float, keep_unsynced: bool,
+                              keep_after_id: Optional[int] = None) -> int:
+        """
+        Réduit les observations antérieures à before en agrégats quotidiens puis les supprime.
+        keep_unsynced : garde les lignes pas encore poussées vers Supabase.
+        keep_after_id : garde les lignes d'id supérieur (pas encore exportées en colonnes).
+        Appelé sous verrou ; retourne le nombre de lignes brutes agrégées.
+        """
+        condition = "recorded_at < ?" + (" AND synced = 1" if keep_unsynced else "")
+        params: Tuple = (before,)
+        if keep_after_id is not None:
+            condition += " AND id <= ?"
+            params = (before, int(keep_after_id))
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.execute(
+                "INSERT INTO price_history_daily (departure_airport, destination_code, flight_date, recorded_day, "
+                "min_price, max_price, sum_price, observations) "
+                "SELECT departure_airport, destination_code, flight_date, date(recorded_at, 'unixepoch'), "
+                "MIN(price), MAX(price), SUM(price), COUNT(*) "
+                f"FROM price_history WHERE {condition} "
+                "GROUP BY departure_airport, destination_code, flight_date, date(recorded_at, 'unixepoch') "
+                "ON CONFLICT (departure_airport, destination_code, recorded_day, flight_date) DO UPDATE SET "
+                "min_price = MIN(min_price, excluded.min_price), "
+                "max_price = MAX(max_price, excluded.max_price), "
+                "sum_price = sum_price + excluded.sum_price, "
+                "observations = observations + excluded.observations",
+                params
+            )
+            rolled = self._conn.execute(f"DELETE FROM price_history WHERE {condition}", params).rowcount
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return rolled
+
+    # ==================== MAINTENANCE ====================
+
+    def compact(self, history_retention_days: int = DEFAULT_HISTORY_RETENTION_DAYS,
+                raw_history_days: int = DEFAULT_RAW_HISTORY_DAYS, keep_unsynced: bool = False,
+                keep_after_id: Optional[int] = None) -> Dict[str, int]:
+        """
+        Supprime les entrées expirées, réduit l'historique brut plus ancien que
+        raw_history_days en agrégats quotidiens, supprime les agrégats au-delà de la
+        rétention, puis tronque le WAL pour récupérer l'espace disque.
+        keep_unsynced (Supabase configuré) : les lignes non synchronisées restent brutes
+        jusqu'à leur envoi, sauf au-delà de la rétention. keep_after_id (filigrane de l'export
+        colonnaire local) : de même pour les lignes pas encore exportées.
+        """
+        now = time.time()
+        retention_cutoff = now - history_retention_days * 86400
+        with self._lock:
+            scans = self._conn.execute("DELETE FROM scan_results WHERE expires_at <= ?", (now,)).rowcount
+            fares = self._conn.execute("DELETE FROM fares WHERE expires_at <= ?", (now,)).rowcount
+            history = self._conn.execute(
+                "DELETE FROM price_history WHERE recorded_at < ?", (retention_cutoff,)
+            ).rowcount
+            rolled_up = self._rollup_price_history(now - raw_history_days * 86400, keep_unsynced, keep_after_id)
+            daily = self._conn.execute(
+                "DELETE FROM price_history_daily WHERE recorded_day < date(?, 'unixepoch')", (retention_cutoff,)
+            ).rowcount
+            jobs = self._conn.execute(
+                "DELETE FROM scan_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (now - DEFAULT_JOB_RETENTION_SECONDS,)
+            ).rowcount
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"scan_results": scans, "fares": fares, "price_history": history,
+                "price_history_rolled_up": rolled_up, "price_history_daily": daily, "scan_jobs": jobs}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {
+                table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("scan_results", "fares", "price_history", "price_history_daily", "scan_jobs")
+            }
+            counts["price_history_unsynced"] = self._conn.execute(
+                "SELECT COUNT(*) FROM price_history WHERE synced = 0"
+            ).fetchone()[0]
+        counts["path"] = self.path
+        counts["size_bytes"] = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return counts
+
+    # ==================== JOBS DE SCAN ====================
+
+    _JOB_FIELDS = ("job_id", "status", "request", "results", "progress", "error",
+                   "num_queries", "submitted_at", "started_at", "finished_at", "owner")
+
+    def put_job(self, job: Dict[str, Any]) -> None:
+        """Enregistre l'état complet d'un job (request, results et progress en JSON)"""
+        values = [job.get(field) for field in self._JOB_FIELDS]
+        for index, field in enumerate(self._JOB_FIELDS):
+            if field in ("request", "results", "progress") and values[index] is not None:
+                values[index] = json.dumps(values[index])
+        self._execute(
+            f"INSERT OR REPLACE INTO scan_jobs ({', '.join(self._JOB_FIELDS)}) "
+            f"VALUES ({', '.join('?' for _ in self._JOB_FIELDS)})",
+            tuple(values)
+        )
+
+    @staticmethod
+    def _job_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for field in ("request", "results", "progress"):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._fetchone("SELECT * FROM scan_jobs WHERE job_id = ?", (job_id,))
+        return self._job_from_row(row) if row else None
+
+    def get_jobs_by_status(self, statuses: List[str]) -> List[Dict[str, Any]]:
+        rows = self._fetchall(
+            f"SELECT * FROM scan_jobs WHERE status IN ({', '.join('?' for _ in statuses)}) ORDER BY submitted_at",
+            tuple(statuses)
+        )
+        return [self._job_from_row(row) for row in rows]
+
+
+_store: Optional[FareStore] = None
+_store_lock = threading.Lock()
+_store_disabled = False
+_maintenance_started = False
+
+
+def get_fare_store() -> Optional[FareStore]:
+    """
+    Retourne le stockage local (créé au premier appel).
+    FLIGHTWATCHER_LOCAL_STORE=none le désactive ; sinon chemin du fichier SQLite.
+    """
+    global _store, _store_disabled
+    if _store is not None or _store_disabled:
+        return _store
+
+    path = os.getenv("FLIGHTWATCHER_LOCAL_STORE", DEFAULT_STORE_PATH)
+    if path.lower() in ("none", "off", "0", "false"):
+        _store_disabled = True
+        return None
+
+    with _store_lock:
+        if _store is None and not _store_disabled:
+            try:
+                _store = FareStore(path)
+            except Exception as e:
+                print(f"⚠️ Stockage local indisponible ({path}): {e}")
+                _store_disabled = True
+    return _store
+
+
+def _columnar_export_watermark() -> Optional[int]:
+    """Dernier id exporté en colonnes depuis le stockage local ; None si l'export n'est pas utilisé"""
+    try:
+        import price_analytics
+    except ImportError:
+        return None
+    return price_analytics.export_watermark("local")
+
+
+def start_maintenance() -> None:
+    """
+    Lance la compaction périodique du stockage local en arrière-plan
+    (FLIGHTWATCHER_LOCAL_STORE_COMPACT_SECONDS, 1h par défaut).
+    Historique : FLIGHTWATCHER_LOCAL_HISTORY_RAW_DAYS jours d'observations brutes,
+    FLIGHTWATCHER_LOCAL_HISTORY_DAYS jours d'agrégats quotidiens.
+    """
+    global _maintenance_started
+    store = get_fare_store()
+    if store is None or _maintenance_started:
+        return
+    _maintenance_started = True
+
+    interval = int(os.getenv("FLIGHTWATCHER_LOCAL_STORE_COMPACT_SECONDS", "3600"))
+    retention = int(os.getenv("FLIGHTWATCHER_LOCAL_HISTORY_DAYS", str(DEFAULT_HISTORY_RETENTION_DAYS)))
+    raw_days = int(os.getenv("FLIGHTWATCHER_LOCAL_HISTORY_RAW_DAYS", str(DEFAULT_RAW_HISTORY_DAYS)))
+    # Avec Supabase, le tampon local garde les lignes brutes jusqu'à leur synchronisation
+    keep_unsynced = bool(os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+
+    def loop():
+        while True:
+            try:
+                removed = store.compact(retention, raw_days, keep_unsynced, _columnar_export_watermark())
+                if any(removed.values()):
+                    print(f"🧹 Stockage local compacté: {removed}")
+            except Exception as e:
+                print(f"⚠️ Erreur compaction stockage local: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="fare-store-maintenance", daemon=True).start()
@@ -0,0 +1,258 @@
+"""
+Revalidation groupée des favoris (favorites.is_available, current_price)
+Vérifier chaque favori par un scan coûterait un scan par favori. Ici, tous les favoris
+actifs sont regroupés par segment : une requête « vols les moins chers au départ de X
+le jour J » (toutes destinations) couvre tous les favoris qui partent de X ce jour-là,
+et un segment déjà en cache (scan récent) ne coûte rien. Pour chaque segment d'un favori :
+- le vol le moins cher vers sa destination est le vol du favori : valide, prix courant
+- aucun vol vers cette destination (réponse sans plafond de prix) : plus disponible
+- un autre vol est moins cher : requête ciblée sur l'horaire exact du vol du favori
+  (partagée par les favoris du même vol)
+Les résultats sont écrits en une seule fois (write_updates reçoit toutes les lignes).
+"""
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fare_cache import FareFetcher, LegPlan, make_leg_key
+
+# Période de revalidation (secondes, 0 = désactivée)
+REVALIDATE_SECONDS = int(os.getenv("FLIGHTWATCHER_FAVORITES_REVALIDATE_SECONDS", "3600"))
+# Segments récupérés en parallèle
+FETCH_WORKERS = 4
+
+VALID = "valid"
+UNAVAILABLE = "unavailable"
+UNKNOWN = "unknown"
+
+
+def _leg(flight: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Segment d'un vol de favori (FlightResponse sérialisé) ; None si inexploitable"""
+    try:
+        departure = datetime.fromisoformat(str(flight["departureTime"]))
+        return {
+            "origin": flight["origin"],
+            "destination": flight["destination"],
+            "day": departure.date(),
+            "time": departure.strftime("%H:%M"),
+            "departureTime": departure,
+            "flightNumber": flight.get("flightNumber"),
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _day_key(leg: Dict[str, Any]) -> str:
+    return make_leg_key(leg["origin"], leg["day"], leg["day"])
+
+
+def _flight_key(leg: Dict[str, Any]) -> str:
+    return make_leg_key(leg["origin"], leg["day"], leg["day"], leg["destination"], leg["time"], leg["time"])
+
+
+def _match(flights: List[Any], leg: Dict[str, Any]) -> Optional[Any]:
+    for flight in flights:
+        if flight.flightNumber == leg["flightNumber"] and flight.departureTime == leg["departureTime"]:
+            return flight
+    return None
+
+
+class FavoriteRevalidator:
+    """
+    load_favorites() -> [{"id", "user_id", "outbound_flight", "return_flight", ...}] (favoris actifs)
+    write_updates([{"id", "is_available", "current_price", "last_availability_check"}]) : écriture groupée
+    on_updated(user_ids) : appelé après écriture (invalidation des listes, ...)
+    reserve_queries(estimation) -> bool : réserve les requêtes d'un lot (refus : lot ignoré,
+    segments laissés indéterminés) ; settle_queries(estimation, réel) : corrige la réservation
+    """
+
+    def __init__(self, load_favorites: Callable[[], List[Dict[str, Any]]],
+                 write_updates: Callable[[List[Dict[str, Any]]], None],
+                 on_updated: Optional[Callable[[set], None]] = None,
+                 fetcher_factory: Callable[[], FareFetcher] = FareFetcher,
+                 reserve_queries: Optional[Callable[[int], bool]] = None,
+                 settle_queries: Optional[Callable[[int, int], None]] = None):
+        self.load_favorites = load_favorites
+        self.write_updates = write_updates
+        self.on_updated = on_updated
+        self.fetcher_factory = fetcher_factory
+        self.reserve_queries = reserve_queries
+        self.settle_queries = settle_queries
+        self._lock = threading.Lock()
+        self._started = False
+        self._last_run: Optional[Dict[str, Any]] = None
+        self._counters = {"runs": 0, "favorites_checked": 0, "queries": 0, "errors": 0, "budget_skipped": 0}
+
+    # ---------- Résolution des segments ----------
+
+    def _resolve_from_day(self, fetcher: FareFetcher, legs: List[Dict[str, Any]],
+                          results: Dict[int, Tuple[str, Optional[float]]]) -> List[Dict[str, Any]]:
+        """
+        Résout les segments depuis les réponses « toutes destinations » en cache.
+        Retourne les segments encore indéterminés (segment absent ou plafonné).
+        """
+        pending = []
+        for leg in legs:
+            entry = fetcher.cached_leg(_day_key(leg))
+            if entry is None:
+                pending.append(leg)
+                continue
+            max_price, flights = entry
+            to_destination = [f for f in flights if f.destination == leg["destination"]]
+            matched = _match(to_destination, leg)
+            if matched is not None:
+                results[id(leg)] = (VALID, matched.price)
+            elif to_destination:
+                # Un autre vol est moins cher ce jour-là : il faut viser l'horaire du favori
+                results[id(leg)] = (UNKNOWN, None)
+                leg["targeted"] = True
+            elif max_price is None:
+                results[id(leg)] = (UNAVAILABLE, None)
+            else:
+                # Réponse d'un scan plafonnée au budget : l'absence ne prouve rien
+                pending.append(leg)
+        return pending
+
+    def _resolve_targeted(self, fetcher: FareFetcher, legs: List[Dict[str, Any]],
+                          results: Dict[int, Tuple[str, Optional[float]]]) -> None:
+        for leg in legs:
+            entry = fetcher.cached_leg(_flight_key(leg))
+            if entry is None:
+                continue
+            matched = _match(entry[1], leg)
+            results[id(leg)] = (VALID, matched.price) if matched is not None else (UNAVAILABLE, None)
+
+    def _execute(self, plan: LegPlan) -> int:
+        """Récupère les segments du plan si le budget le permet ; retourne les requêtes API"""
+        # Segments absents du cache : au plus une requête chacun
+        estimated = len(plan.legs)
+        if self.reserve_queries is not None and not self.reserve_queries(estimated):
+            self._counters["budget_skipped"] += 1
+            return 0
+        queries = 0
+        try:
+            queries = plan.execute(workers=FETCH_WORKERS)
+        finally:
+            if self.settle_queries is not None:
+                self.settle_queries(estimated, queries)
+        return queries
+
+    def _check_legs(self, legs: List[Dict[str, Any]]) -> Tuple[Dict[int, Tuple[str, Optional[float]]], int]:
+        """Statut de chaque segment ; retourne (résultats par id(segment), requêtes API)"""
+        results: Dict[int, Tuple[str, Optional[float]]] = {}
+        queries = 0
+        fetcher = self.fetcher_factory()
+
+        # 1. Réponses « toutes destinations » par (origine, jour), cache d'abord
+        pending = self._resolve_from_day(fetcher, legs, results)
+        if pending:
+            plan = LegPlan()
+            for leg in pending:
+                plan.get_cheapest_flights(leg["origin"], leg["day"], leg["day"])
+            queries += self._execute(plan)
+            self._resolve_from_day(fetcher, pending, results)
+
+        # 2. Requêtes ciblées (horaire exact) pour les vols masqués par un vol moins cher
+        targeted = [leg for leg in legs if leg.get("targeted")]
+        self._resolve_targeted(fetcher, targeted, results)
+        missing = [leg for leg in targeted if results.get(id(leg), (UNKNOWN,))[0] == UNKNOWN]
+        if missing:
+            plan = LegPlan()
+            for leg in missing:
+                plan.get_cheapest_flights(leg["origin"], leg["day"], leg["day"], leg["destination"],
+                                          leg["time"], leg["time"])
+            queries += self._execute(plan)
+            self._resolve_targeted(fetcher, missing, results)
+        return results, queries
+
+    # ---------- Passe complète ----------
+
+    def run(self) -> Dict[str, Any]:
+        """Revalide tous les favoris actifs ; retourne le bilan de la passe"""
+        started = time.time()
+        favorites = self.load_favorites()
+        today = date.today()
+
+        per_favorite: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]] = []
+        legs: List[Dict[str, Any]] = []
+        for favorite in favorites:
+            favorite_legs = [_leg(favorite.get("outbound_flight") or {}), _leg(favorite.get("return_flight") or {})]
+            if any(leg is None for leg in favorite_legs):
+                continue
+            per_favorite.append((favorite, favorite_legs))
+            legs.extend(favorite_legs)
+
+        # Vol déjà parti : plus disponible sans requête
+        upcoming = [leg for leg in legs if leg["day"] >= today]
+        results, queries = self._check_legs(upcoming)
+
+        checked_at = datetime.now().astimezone().isoformat()
+        updates = []
+        summary = {VALID: 0, UNAVAILABLE: 0, UNKNOWN: 0}
+        for favorite, (outbound, inbound) in per_favorite:
+            statuses = [
+                results.get(id(leg), (UNKNOWN, None)) if leg["day"] >= today else (UNAVAILABLE, None)
+                for leg in (outbound, inbound)
+            ]
+            if any(status == UNAVAILABLE for status, _ in statuses):
+                status, price = UNAVAILABLE, None
+            elif all(status == VALID for status, _ in statuses):
+                status, price = VALID, round(statuses[0][1] + statuses[1][1], 2)
+            else:
+                status, price = UNKNOWN, None
+            summary[status] += 1
+            if status == UNKNOWN:
+                continue
+            updates.append({
+                "id": favorite["id"],
+                "is_available": status == VALID,
+                "current_price": price,
+                "last_availability_check": checked_at,
+            })
+
+        if updates:
+            self.write_updates(updates)
+            if self.on_updated:
+                self.on_updated({favorite.get("user_id") for favorite, _ in per_favorite} - {None})
+
+        report = {
+            "favorites": len(favorites),
+            "legs": len(upcoming),
+            "distinct_day_legs": len({_day_key(leg) for leg in upcoming}),
+            "queries": queries,
+            "updated": len(updates),
+            "valid": summary[VALID],
+            "unavailable": summary[UNAVAILABLE],
+            "unknown": summary[UNKNOWN],
+            "duration_s": round(time.time() - started, 2),
+            "finished_at": checked_at,
+        }
+        self._counters["runs"] += 1
+        self._counters["favorites_checked"] += len(per_favorite)
+        self._counters["queries"] += queries
+        self._last_run = report
+        return report
+
+    def _loop(self, run: Callable[[], Any]) -> None:
+        while True:
+            try:
+                report = run()
+                print(f"✅ Favoris revalidés: {report}")
+            except Exception as e:
+                self._counters["errors"] += 1
+                print(f"⚠️ Erreur revalidation des favoris: {e}")
+            time.sleep(REVALIDATE_SECONDS)
+
+    def start(self, run: Optional[Callable[[], Any]] = None) -> None:
+        """Revalidation périodique (run : passe complète, ex: run() dans un créneau d'admission)"""
+        with self._lock:
+            if self._started or REVALIDATE_SECONDS <= 0:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, args=(run or self.run,), name="favorite-revalidator",
+                         daemon=True).start()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"interval_seconds": REVALIDATE_SECONDS, **self._counters, "last_run": self._last_run}
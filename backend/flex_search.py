@@ -0,0 +1,167 @@
+"""
+Recherche sur fenêtre flexible : plage de dates de départ + nombre de nuits min/max
+Au lieu d'un scan par couple de dates, chaque route est lue une fois dans le
+calendrier des prix (un tarif par jour et par mois), puis les meilleures combinaisons
+aller / retour sont trouvées par balayage avec minimum glissant sur les retours.
+"""
+import heapq
+from collections import deque
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fare_cache import FareFetcher
+
+# Au-delà, le calendrier devient trop coûteux à parcourir (et les tarifs peu fiables)
+MAX_RANGE_DAYS = 120
+# Routes lues au plus dans le calendrier par recherche (limite_destinations)
+MAX_DESTINATIONS = 30
+
+
+def months_between(start: date, end: date) -> List[date]:
+    """Premier jour de chaque mois couvert par [start, end]"""
+    months = []
+    current = start.replace(day=1)
+    while current <= end:
+        months.append(current)
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def estimate_queries(date_from: date, date_to: date, nights_min: int, nights_max: int,
+                     nb_destinations: int, discovery: bool) -> int:
+    """
+    Requêtes API au plus d'une recherche (sans tenir compte du cache) : la requête de
+    découverte, puis par route les mois des allers et ceux des retours
+    """
+    per_route = (len(months_between(date_from, date_to))
+                 + len(months_between(date_from + timedelta(days=nights_min), date_to + timedelta(days=nights_max))))
+    return int(discovery) + nb_destinations * per_route
+
+
+def daily_fares(fetcher: FareFetcher, airport: str, destination: str,
+                 start: date, end: date) -> Dict[date, Dict[str, Any]]:
+    """Tarif le moins cher par jour entre start et end (calendrier lu mois par mois)"""
+    fares = {}
+    for month in months_between(start, end):
+        for fare in fetcher.get_fare_calendar(airport, destination, month):
+            day = date.fromisoformat(fare["day"][:10])
+            if start <= day <= end:
+                fares[day] = fare
+    return fares
+
+
+def best_combinations(outbound: List[float], inbound: List[float], nights_min: int, nights_max: int,
+                      limit: int = 1) -> List[Tuple[float, int, int]]:
+    """
+    Meilleures combinaisons (prix total, index aller, index retour) avec
+    nights_min <= retour - aller <= nights_max. Les listes sont indexées par jour
+    depuis le même jour 0 (inf si pas de vol). Minimum glissant : O(n).
+    """
+    window: deque = deque()  # indices de retour, prix croissants
+    candidates = []
+    next_inbound = 0
+    for i, out_price in enumerate(outbound):
+        # Faire entrer les retours jusqu'à i + nights_max
+        while next_inbound <= min(i + nights_max, len(inbound) - 1):
+            while window and inbound[window[-1]] >= inbound[next_inbound]:
+                window.pop()
+            window.append(next_inbound)
+            next_inbound += 1
+        # Sortir ceux avant i + nights_min
+        while window and window[0] < i + nights_min:
+            window.popleft()
+        if window and out_price != float("inf") and inbound[window[0]] != float("inf"):
+            candidates.append((out_price + inbound[window[0]], i, window[0]))
+    return heapq.nsmallest(limit, candidates)
+
+
+def search_route(fetcher: FareFetcher, origin: str, destination: str, date_from: date, date_to: date,
+                 nights_min: int, nights_max: int, limit: int = 1) -> List[Dict[str, Any]]:
+    """Meilleurs allers-retours d'une route sur la fenêtre (dict au format TripResponse)"""
+    return_from = date_from + timedelta(days=nights_min)
+    return_to = date_to + timedelta(days=nights_max)
+    outbound_fares = daily_fares(fetcher, origin, destination, date_from, date_to)
+    if not outbound_fares:
+        return []
+    inbound_fares = daily_fares(fetcher, destination, origin, return_from, return_to)
+    if not inbound_fares:
+        return []
+
+    # Jour 0 = date_from pour les deux séries
+    total_days = (return_to - date_from).days + 1
+    outbound = [float("inf")] * ((date_to - date_from).days + 1)
+    inbound = [float("inf")] * total_days
+    for day, fare in outbound_fares.items():
+        outbound[(day - date_from).days] = fare["price"]
+    for day, fare in inbound_fares.items():
+        inbound[(day - date_from).days] = fare["price"]
+
+    trips = []
+    for total, i, j in best_combinations(outbound, inbound, nights_min, nights_max, limit):
+        aller = outbound_fares[date_from + timedelta(days=i)]
+        retour = inbound_fares[date_from + timedelta(days=j)]
+        trips.append({
+            "aller": _leg(aller, origin, destination),
+            "retour": _leg(retour, destination, origin),
+            "prix_total": round(total, 2),
+            "destination_code": destination,
+        })
+    return trips
+
+
+def _leg(fare: Dict[str, Any], origin: str, destination: str) -> Dict[str, Any]:
+    # Le calendrier ne donne pas le numéro de vol ; noms complétés par search_nights_range
+    return {
+        "flightNumber": "",
+        "origin": origin,
+        "originFull": origin,
+        "destination": destination,
+        "destinationFull": destination,
+        "departureTime": fare["departureTime"],
+        "price": fare["price"],
+        "currency": fare["currency"],
+    }
+
+
+def search_nights_range(origin: str, date_from: date, date_to: date, nights_min: int, nights_max: int,
+                        budget_max: Optional[float] = None, destinations_incluses: Optional[List[str]] = None,
+                        destinations_exclues: Optional[List[str]] = None, limite_destinations: int = 10,
+                        par_destination: int = 1) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Recherche "N à M nuits entre date_from et date_to" depuis origin.
+    Sans liste de destinations, une requête sur toute la plage donne les destinations
+    desservies et leur aller le moins cher ; seules les limite_destinations moins chères
+    sont lues dans le calendrier. Retourne (voyages triés par prix total, requêtes API).
+    """
+    fetcher = FareFetcher()
+    destinations_exclues = destinations_exclues or []
+
+    # Noms complets des aéroports (absents du calendrier), connus via la requête de découverte
+    names: Dict[str, str] = {}
+    if destinations_incluses:
+        destinations = [d for d in destinations_incluses if d not in destinations_exclues]
+    else:
+        cheapest = fetcher.get_cheapest_flights(origin, date_from, date_to, max_price=budget_max)
+        cheapest.sort(key=lambda flight: flight.price)
+        destinations = [f.destination for f in cheapest if f.destination not in destinations_exclues]
+        for flight in cheapest:
+            names[flight.origin] = flight.originFull
+            names[flight.destination] = flight.destinationFull
+
+    trips = []
+    for destination in destinations[:limite_destinations]:
+        try:
+            route_trips = search_route(fetcher, origin, destination, date_from, date_to,
+                                       nights_min, nights_max, par_destination)
+        except Exception as e:
+            print(f"  Erreur calendrier {origin}-{destination}: {e}")
+            continue
+        trips.extend(t for t in route_trips if budget_max is None or t["prix_total"] <= budget_max)
+
+    for trip in trips:
+        for leg in (trip["aller"], trip["retour"]):
+            leg["originFull"] = names.get(leg["origin"], leg["origin"])
+            leg["destinationFull"] = names.get(leg["destination"], leg["destination"])
+
+    trips.sort(key=lambda trip: trip["prix_total"])
+    return trips, fetcher.num_queries
@@ -6,66 +6,97 @@ import sys
 import os
 from datetime import datetime, date, timedelta
 from collections import defaultdict
+from typing import Optional, Set
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ryanair-py'))
-from ryanair import Ryanair
+from ryanair_client import new_client
+from ttl_cache import TTLCache
+
+# Graphe des destinations par aéroport de départ (change rarement)
+DESTINATIONS_TTL_SECONDS = int(os.getenv("FLIGHTWATCHER_DESTINATIONS_TTL", "21600"))  # 6h
+_destinations_cache = TTLCache(max_size=256, ttl_seconds=DESTINATIONS_TTL_SECONDS)
+
+def load_destinations_by_country(airport_code: str) -> dict:
+    """
+    Version mise en cache de la récupération des destinations.
+    Lève une exception en cas d'erreur (aucun résultat n'est alors mis en cache).
+    """
+    return _destinations_cache.get_or_load(airport_code, lambda: _fetch_destinations_by_country(airport_code))
+
+def cached_destination_codes(airport_code: str) -> Optional[Set[str]]:
+    """Codes des destinations si le graphe est déjà en cache, None sinon (aucun appel à l'API)"""
+    by_country = _destinations_cache.get(airport_code)
+    if by_country is None:
+        return None
+    return {dest['code'] for dests in by_country.values() for dest in dests}
+
+def export_snapshot() -> list:
+    """Graphe en cache pour le snapshot : [[aéroport, destinations par pays, expires_at]]"""
+    return [[code, by_country, exp] for code, by_country, exp in _destinations_cache.items()]
+
+def restore_snapshot(entries: list) -> int:
+    """Réinsère les graphes d'un snapshot encore valides ; retourne le nombre restauré"""
+    return sum(_destinations_cache.restore(code, by_country, exp) for code, by_country, exp in entries)
 
 def get_destinations_by_country(airport_code: str) -> dict:
     """Récupère toutes les destinations depuis un aéroport et les groupe par pays"""
-    api = Ryanair(currency="EUR")
+    try:
+        return load_destinations_by_country(airport_code)
+    except Exception as e:
+        print(f"Erreur: {e}")
+        return {}
+
+def _fetch_destinations_by_country(airport_code: str) -> dict:
+    api = new_client(currency="EUR")
     
     # Chercher sur plusieurs dates pour obtenir TOUTES les destinations disponibles
     # Certaines destinations peuvent ne pas avoir de vols tous les jours
     date_debut = date.today() + timedelta(days=30)
     date_fin = date_debut + timedelta(days=60)  # Chercher sur 60 jours
     
-    try:
-        print(f"🔍 Recherche des destinations depuis {airport_code} du {date_debut} au {date_fin}...")
-        
-        # Récupérer tous les vols disponibles sur la plage de dates
-        vols = api.get_cheapest_flights(
-            airport=airport_code,
-            date_from=date_debut,
-            date_to=date_fin,
-            max_price=1000  # Prix élevé pour ne pas filtrer
-        )
-        
-        print(f"  ✓ {len(vols)} vol(s) trouvé(s)")
-        
-        # Grouper par pays et dédoublonner les destinations
-        destinations_par_pays = defaultdict(dict)  # Utiliser un dict pour dédoublonner par code
-        
-        for vol in vols:
-            dest_code = vol.destination
-            dest_full = vol.destinationFull
-            
-            # Extraire le pays depuis destinationFull (format: "City, Country")
-            if ', ' in dest_full:
-                country = dest_full.split(', ')[-1]
-            else:
-                country = "Autre"
-            
-            # Garder seulement la première occurrence de chaque destination
-            if dest_code not in destinations_par_pays[country]:
-                destinations_par_pays[country][dest_code] = {
-                    'code': dest_code,
-                    'nom': dest_full.split(',')[0].strip(),
-                    'pays': country,
-                    'destinationFull': dest_full
-                }
-        
-        # Convertir les dict en listes et trier
-        result = {}
-        for pays in sorted(destinations_par_pays.keys()):
-            result[pays] = sorted(destinations_par_pays[pays].values(), key=lambda x: x['nom'])
+    print(f"🔍 Recherche des destinations depuis {airport_code} du {date_debut} au {date_fin}...")
+    
+    # Récupérer tous les vols disponibles sur la plage de dates
+    vols = api.get_cheapest_flights(
+        airport=airport_code,
+        date_from=date_debut,
+        date_to=date_fin,
+        max_price=1000  # Prix élevé pour ne pas filtrer
+    )
+    
+    print(f"  ✓ {len(vols)} vol(s) trouvé(s)")
+    
+    # Grouper par pays et dédoublonner les destinations
+    destinations_par_pays = defaultdict(dict)  # Utiliser un dict pour dédoublonner par code
+    
+    for vol in vols:
+        dest_code = vol.destination
+        dest_full = vol.destinationFull
         
-        total_destinations = sum(len(dests) for dests in result.values())
-        print(f"  ✓ {total_destinations} destination(s) unique(s) trouvée(s) réparties sur {len(result)} pays")
+        # Extraire le pays depuis destinationFull (format: "City, Country")
+        if ', ' in dest_full:
+            country = dest_full.split(', ')[-1]
+        else:
+            country = "Autre"
         
-        return result
-    except Exception as e:
-        print(f"Erreur: {e}")
-        return {}
+        # Garder seulement la première occurrence de chaque destination
+        if dest_code not in destinations_par_pays[country]:
+            destinations_par_pays[country][dest_code] = {
+                'code': dest_code,
+                'nom': dest_full.split(',')[0].strip(),
+                'pays': country,
+                'destinationFull': dest_full
+            }
+    
+    # Convertir les dict en listes et trier
+    result = {}
+    for pays in sorted(destinations_par_pays.keys()):
+        result[pays] = sorted(destinations_par_pays[pays].values(), key=lambda x: x['nom'])
+    
+    total_destinations = sum(len(dests) for dests in result.values())
+    print(f"  ✓ {total_destinations} destination(s) unique(s) trouvée(s) réparties sur {len(result)} pays")
+    
+    return result
 
 if __name__ == "__main__":
     airport = sys.argv[1] if len(sys.argv) > 1 else "BVA"
@@ -0,0 +1,133 @@
+"""
+Matrice précalculée des allers-retours les moins chers pour le mode découverte
+Pour chaque aéroport chaud (FLIGHTWATCHER_INSPIRE_ORIGINS) et chaque preset de dates,
+un scan large (budget max, toutes destinations) est refait périodiquement en
+arrière-plan. /api/inspire est ensuite servi depuis la matrice : filtre budget,
+exclusions et limite_allers appliqués en mémoire, avec le même résultat qu'un scan.
+Origines ou dates non couvertes : scan en direct.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Aéroports précalculés (séparés par des virgules) ; vide = matrice désactivée
+ORIGINS = [code.strip().upper() for code in os.getenv("FLIGHTWATCHER_INSPIRE_ORIGINS", "").split(",") if code.strip()]
+# Période de rafraîchissement (secondes) ; au-delà de 2 périodes une entrée n'est plus servie
+REFRESH_SECONDS = int(os.getenv("FLIGHTWATCHER_INSPIRE_REFRESH", "1800"))
+# Budget du scan précalculé : les requêtes au-delà passent en direct
+MAX_BUDGET = int(os.getenv("FLIGHTWATCHER_INSPIRE_MAX_BUDGET", "1000"))
+# Nombre de destinations retenues par le scan précalculé (toutes en pratique)
+MAX_DESTINATIONS = 500
+
+
+def dates_key(dates_depart: List[Dict[str, Any]], dates_retour: List[Dict[str, Any]]) -> str:
+    return json.dumps({"depart": dates_depart, "retour": dates_retour}, sort_keys=True)
+
+
+class InspireMatrix:
+    """
+    builder(origine, dates_depart, dates_retour) -> (voyages, meilleur aller par destination, requêtes API)
+    presets() -> {nom: (dates_depart, dates_retour)} (dates sous forme de dict, recalculées à chaque passe)
+    """
+
+    def __init__(self, builder: Callable[[str, List[Dict], List[Dict]], Tuple[List[Dict], Dict[str, float], int]],
+                 presets: Callable[[], Dict[str, Tuple[List[Dict], List[Dict]]]],
+                 origins: Optional[List[str]] = None):
+        self.builder = builder
+        self.presets = presets
+        self.origins = ORIGINS if origins is None else origins
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._counters = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_queries": 0, "refresh_errors": 0}
+        self._last_refresh: Optional[float] = None
+
+    # ---------- Construction ----------
+
+    def refresh(self) -> int:
+        """Recalcule toutes les entrées (origines x presets) ; retourne le nombre de requêtes API"""
+        queries = 0
+        entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for origin in self.origins:
+            for preset, (dates_depart, dates_retour) in self.presets().items():
+                if not dates_depart or not dates_retour:
+                    continue
+                try:
+                    trips, allers, num_queries = self.builder(origin, dates_depart, dates_retour)
+                except Exception as e:
+                    self._counters["refresh_errors"] += 1
+                    print(f"⚠️ Erreur matrice découverte {origin} ({preset}): {e}")
+                    continue
+                queries += num_queries
+                entries[(origin, dates_key(dates_depart, dates_retour))] = {
+                    "preset": preset,
+                    "built_at": time.time(),
+                    "allers": allers,
+                    "voyages": {trip["destination_code"]: trip for trip in trips},
+                }
+        with self._lock:
+            # Les entrées des anciennes dates (preset qui a glissé) disparaissent ici
+            self._entries = entries
+        self._counters["refreshes"] += 1
+        self._counters["refresh_queries"] += queries
+        self._last_refresh = time.time()
+        print(f"✅ Matrice découverte: {len(entries)} entrée(s), {queries} requête(s)")
+        return queries
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Erreur rafraîchissement matrice découverte: {e}")
+            time.sleep(REFRESH_SECONDS)
+
+    def start(self) -> None:
+        """Lance le rafraîchissement périodique (aucun effet sans origine configurée)"""
+        with self._lock:
+            if self._started or not self.origins:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name="inspire-matrix", daemon=True).start()
+
+    # ---------- Lecture ----------
+
+    def lookup(self, origin: str, dates_depart: List[Dict[str, Any]], dates_retour: List[Dict[str, Any]],
+               budget: int, destinations_exclues: Optional[List[str]] = None,
+               limite_allers: int = 30) -> Optional[List[Dict[str, Any]]]:
+        """
+        Voyages (format TripResponse, triés par prix) pour une requête découverte,
+        None si la matrice ne la couvre pas. Même sélection qu'un scan : les limite_allers
+        destinations aux allers les moins chers, puis filtre sur le prix total.
+        """
+        with self._lock:
+            entry = self._entries.get((origin, dates_key(dates_depart, dates_retour)))
+        if entry is None or budget > MAX_BUDGET or time.time() - entry["built_at"] > 2 * REFRESH_SECONDS:
+            self._counters["misses"] += 1
+            return None
+
+        exclues = set(destinations_exclues or [])
+        candidates = sorted(
+            (price, destination) for destination, price in entry["allers"].items()
+            if price <= budget and destination not in exclues
+        )[:limite_allers]
+        trips = [
+            entry["voyages"][destination] for _, destination in candidates
+            if destination in entry["voyages"] and entry["voyages"][destination]["prix_total"] <= budget
+        ]
+        self._counters["hits"] += 1
+        return sorted(trips, key=lambda trip: trip["prix_total"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._entries.items())
+        return {
+            "origins": self.origins,
+            "entries": len(entries),
+            "presets": sorted({entry["preset"] for _, entry in entries}),
+            "oldest_entry_age_s": round(time.time() - min(e["built_at"] for _, e in entries), 1) if entries else None,
+            "last_refresh": self._last_refresh,
+            **self._counters,
+        }
@@ -0,0 +1,193 @@
+"""
+Cycle de vie du processus API FlightWatcher
+- Imports différés des modules lourds (chargés au premier usage)
+- Tâches de warm-up configurables exécutées au démarrage
+- Mesure de la latence à froid (premier appel) vs à chaud par endpoint
+"""
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+PROCESS_STARTED_AT = time.time()
+
+# Tâches exécutées au démarrage, dans l'ordre (ex: "airports,destinations,route_stats")
+# "none" désactive le warm-up
+DEFAULT_WARMUP_TASKS = "airports,deal_model,destinations,route_stats"
+# Aéroports de départ préchargés par le warm-up
+DEFAULT_POPULAR_ORIGINS = "BVA"
+
+
+class LazyModule(ModuleType):
+    """Proxy de module importé réellement au premier accès à un attribut"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_module: Optional[ModuleType] = None
+        self._lazy_lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    self._lazy_module = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._lazy_module is not None
+
+
+def lazy_import(module_name: str) -> LazyModule:
+    """Retourne un proxy qui n'importe module_name qu'au premier usage"""
+    return LazyModule(module_name)
+
+
+# ==================== WARM-UP ====================
+
+_warmup_tasks: Dict[str, Callable[[], Any]] = {}
+_warmup_report: Dict[str, Dict[str, Any]] = {}
+_warmup_state = {"status": "pending", "started_at": None, "finished_at": None}
+
+
+def warmup_task(name: str):
+    """Décorateur qui enregistre une tâche de warm-up sous un nom"""
+    def decorator(func: Callable[[], Any]):
+        _warmup_tasks[name] = func
+        return func
+    return decorator
+
+
+def get_enabled_warmup_tasks() -> List[str]:
+    """Tâches activées via FLIGHTWATCHER_WARMUP_TASKS (dans l'ordre d'exécution)"""
+    raw = os.getenv("FLIGHTWATCHER_WARMUP_TASKS", DEFAULT_WARMUP_TASKS).strip()
+    if raw.lower() in ("", "none", "0", "false"):
+        return []
+    return [name.strip() for name in raw.split(",") if name.strip()]
+
+
+def get_popular_origins() -> List[str]:
+    """Aéroports de départ populaires (FLIGHTWATCHER_POPULAR_ORIGINS, séparés par des virgules)"""
+    raw = os.getenv("FLIGHTWATCHER_POPULAR_ORIGINS", DEFAULT_POPULAR_ORIGINS)
+    return [code.strip().upper() for code in raw.split(",") if code.strip()]
+
+
+def run_warmup(task_names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Exécute les tâches de warm-up enregistrées.
+    Une tâche en échec n'empêche pas les suivantes : l'erreur est reportée.
+    """
+    names = get_enabled_warmup_tasks() if task_names is None else task_names
+    _warmup_state["status"] = "running"
+    _warmup_state["started_at"] = time.time()
+
+    for name in names:
+        func = _warmup_tasks.get(name)
+        if func is None:
+            _warmup_report[name] = {"status": "unknown", "duration_ms": 0}
+            print(f"⚠️ Warm-up: tâche inconnue '{name}'")
+            continue
+
+        start = time.perf_counter()
+        try:
+            detail = func()
+            _warmup_report[name] = {
+                "status": "ok",
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "detail": detail,
+            }
+            print(f"✅ Warm-up '{name}' terminé en {_warmup_report[name]['duration_ms']} ms")
+        except Exception as e:
+            _warmup_report[name] = {
+                "status": "error",
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "error": str(e),
+            }
+            print(f"⚠️ Warm-up '{name}' en échec: {e}")
+
+    _warmup_state["status"] = "done"
+    _warmup_state["finished_at"] = time.time()
+    return dict(_warmup_report)
+
+
+def start_warmup() -> None:
+    """
+    Lance le warm-up au démarrage.
+    Par défaut en arrière-plan ; FLIGHTWATCHER_WARMUP_BLOCKING=1 le rend bloquant
+    (le worker n'accepte alors de requêtes qu'une fois chaud).
+    """
+    if not get_enabled_warmup_tasks():
+        _warmup_state["status"] = "disabled"
+        return
+
+    if os.getenv("FLIGHTWATCHER_WARMUP_BLOCKING", "0") == "1":
+        run_warmup()
+    else:
+        threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+
+# ==================== LATENCE FROID / CHAUD ====================
+
+class LatencyTracker:
+    """
+    Enregistre la latence par endpoint : le premier appel est compté comme
+    démarrage à froid, les suivants comme appels à chaud.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._routes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, duration_ms: float) -> None:
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                self._routes[route] = {
+                    "cold_ms": round(duration_ms, 1),
+                    "cold_at_uptime_s": round(time.time() - PROCESS_STARTED_AT, 1),
+                    "warm": deque(maxlen=self.window),
+                    "warm_count": 0,
+                }
+                return
+            stats["warm"].append(duration_ms)
+            stats["warm_count"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for route, stats in self._routes.items():
+                warm = sorted(stats["warm"])
+                entry = {
+                    "cold_ms": stats["cold_ms"],
+                    "cold_at_uptime_s": stats["cold_at_uptime_s"],
+                    "warm_count": stats["warm_count"],
+                }
+                if warm:
+                    entry["warm_p50_ms"] = round(warm[len(warm) // 2], 1)
+                    entry["warm_p95_ms"] = round(warm[min(len(warm) - 1, int(len(warm) * 0.95))], 1)
+                    entry["cold_vs_warm_ratio"] = round(stats["cold_ms"] / max(entry["warm_p50_ms"], 0.1), 1)
+                result[route] = entry
+            return result
+
+
+latency_tracker = LatencyTracker()
+
+
+def lifecycle_status(lazy_modules: Optional[Dict[str, LazyModule]] = None) -> Dict[str, Any]:
+    """État du cycle de vie : uptime, warm-up, modules chargés et latences"""
+    return {
+        "uptime_seconds": round(time.time() - PROCESS_STARTED_AT, 1),
+        "warmup": {
+            **_warmup_state,
+            "tasks": dict(_warmup_report),
+        },
+        "lazy_modules": {name: mod.is_loaded for name, mod in (lazy_modules or {}).items()},
+        "latency": latency_tracker.snapshot(),
+    }
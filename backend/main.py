@@ -2,14 +2,20 @@
 API Backend pour le scanner de vols Ryanair
 """
 from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Tuple, Dict
+from typing import Any, Callable, List, Optional, Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 import sys
 import os
 import hashlib
+import importlib.util
+import asyncio
+import contextvars
 import json
+import time
 
 # Ajouter le chemin parent pour importer ryanair
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ryanair-py'))
@@ -17,12 +23,46 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ryanair-py'))
 from ryanair import Ryanair
 from ryanair.types import Flight
 
+import flex_search
+import lifecycle
+import reverse_search
+import route_stats
+from auto_check_policy import AutoCheckPolicy
+from airport_index import search_airports, expand_origins
+from get_destinations import load_destinations_by_country, cached_destination_codes
+import admission
+import airport_index
+import diagnostics
+import favorite_revalidator
+import fare_cache
+import get_destinations as destinations_graph
+import inspire_matrix
+import request_trace
+import ryanair_client
+import state_snapshot
+from fare_cache import FareFetcher, LegPlan
+from fare_store import get_fare_store, start_maintenance as start_local_store_maintenance
+from price_tracker import record_price_history, build_price_records, get_daily_price_trend, start_remote_compaction
+from query_budget import QueryBudget, quota_key
+from scan_cache import ScanCache
+import scan_jobs
+import user_listings
+
+# Modules chargés à la demande (exposés dans /api/lifecycle)
+# price_analytics importe NumPy : chargé seulement au premier appel analytics
+price_analytics = lifecycle.lazy_import("price_analytics")
+deals = lifecycle.lazy_import("deal_model")
+LAZY_MODULES = {"price_analytics": price_analytics, "deal_model": deals}
+
 # Import conditionnel de Supabase (avant les endpoints)
 try:
-    from supabase_client import get_supabase_client, get_supabase_service_client
+    # Vérifier la présence du SDK sans l'importer (import différé au premier client)
+    if importlib.util.find_spec("supabase") is None:
+        raise ImportError("No module named 'supabase'")
+    
+    from supabase_client import get_supabase_client, get_supabase_service_client, supabase_sdk
     from db_models import SavedSearchDB, SavedFavoriteDB
-    from auth_middleware import get_user_id_from_token, optional_auth
-    from price_tracker import record_price_history
+    from auth_middleware import get_user_id_from_token, resolve_user_id, optional_auth, auth_stats
     
     # Tester si les variables d'environnement sont définies
     import os
@@ -33,6 +73,7 @@ try:
         raise ValueError("Variables d'environnement Supabase manquantes")
     
     SUPABASE_AVAILABLE = True
+    LAZY_MODULES["supabase"] = supabase_sdk
     print("[OK] Supabase configure et disponible")
 except Exception as e:
     print(f"[WARNING] Supabase non disponible: {e}")
@@ -42,8 +83,29 @@ except Exception as e:
     get_supabase_client = None
     get_supabase_service_client = None
     get_user_id_from_token = lambda r: None
+    async def resolve_user_id(request):
+        return None
     optional_auth = lambda f: f  # Décorateur par défaut qui ne fait rien
-    record_price_history = lambda trips: None
+    auth_stats = lambda: None
+
+# État des auto-vérifications (intervalle adaptatif, auto_checks.json)
+auto_checks = AutoCheckPolicy()
+
+# Créneaux de scan simultanés et file par priorité (interactif > auto-check > tâches de fond)
+scan_admission = admission.AdmissionController()
+
+# Budgets de requêtes API par utilisateur et global (seaux à jetons)
+query_budgets = QueryBudget()
+
+# Pages des listes recherches / favoris par utilisateur (invalidées à chaque modification)
+listings = user_listings.ListingCache()
+
+# Cache des résultats de scan (TTL adaptatif, stale-while-revalidate)
+scan_cache = ScanCache(get_supabase_service_client)
+# Nombre max de scans dans un appel /api/scan/batch
+MAX_BATCH_SCANS = 20
+# Échéance des scans interactifs (secondes) : au-delà, réponse avec les segments obtenus
+SCAN_DEADLINE_SECONDS = float(os.getenv("FLIGHTWATCHER_SCAN_DEADLINE", "25"))
 
 app = FastAPI(title="Ryanair Flight Scanner API")
 
@@ -54,8 +116,125 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lisibles par le frontend : curseur des listes paginées, validation du cache
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+async def _lire_corps(receive) -> Tuple[bytes, List[Dict[str, Any]]]:
+    """Lit tout le corps de la requête ; retourne (corps, messages à rejouer après lui)"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            # Client déconnecté pendant la lecture : l'application le verra après le corps
+            return b"".join(chunks), [message]
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks), []
+
+def _rejouer(body: bytes, suite: List[Dict[str, Any]], receive):
+    """receive qui renvoie d'abord le corps déjà lu, puis les messages suivants du client"""
+    messages = [{"type": "http.request", "body": body, "more_body": False}] + suite
+
+    async def receive_rejoue():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return receive_rejoue
+
+class SuiviLatenceMiddleware:
+    """
+    Mesure la latence par endpoint (premier appel = à froid) ; trace les scans si activé.
+    Middleware ASGI pur : avec @app.middleware("http") (Starlette 0.27), lire le corps avant
+    l'endpoint bloque la requête. Le corps est lu ici puis rejoué à l'application via receive.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        request = Request(scope)
+        trace = None
+        if request_trace.recorder.wants(request.method, request.url.path):
+            # Vérification du token hors de la boucle d'événements (résultat gardé pour l'endpoint)
+            await resolve_user_id(request)
+            body, suite = await _lire_corps(receive)
+            trace = request_trace.recorder.begin(request.method, request.url.path, body, _cle_quota(request))
+            receive = _rejouer(body, suite, receive)
+
+        statut = 500
+
+        async def send_statut(message):
+            nonlocal statut
+            if message["type"] == "http.response.start":
+                statut = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_statut)
+        except Exception:
+            if trace is not None:
+                request_trace.recorder.finish(trace, 500, (time.perf_counter() - start) * 1000)
+            raise
+        duration_ms = (time.perf_counter() - start) * 1000
+        route = scope.get("route")
+        route_path = getattr(route, "path", None) or request.url.path
+        lifecycle.latency_tracker.record(f"{request.method} {route_path}", duration_ms)
+        if trace is not None:
+            request_trace.recorder.finish(trace, statut, duration_ms)
+
+app.add_middleware(SuiviLatenceMiddleware)
+
+# Structures chaudes reprises d'un redémarrage à l'autre (FLIGHTWATCHER_SNAPSHOT_FILE)
+state_snapshot.snapshot.register("fares", fare_cache.export_snapshot, fare_cache.restore_snapshot)
+state_snapshot.snapshot.register("airports", airport_index.export_snapshot, airport_index.restore_snapshot,
+                                 airport_index.source_fingerprint)
+state_snapshot.snapshot.register("destinations", destinations_graph.export_snapshot,
+                                 destinations_graph.restore_snapshot)
+state_snapshot.snapshot.register("route_stats", route_stats.export_snapshot, route_stats.restore_snapshot)
+
+@app.on_event("startup")
+def startup_warmup():
+    """Relit le snapshot des caches puis lance les tâches de warm-up configurées (FLIGHTWATCHER_WARMUP_TASKS)"""
+    # Avant le warm-up : les tâches trouvent alors les caches déjà remplis
+    state_snapshot.snapshot.restore()
+    state_snapshot.snapshot.start()
+    lifecycle.start_warmup()
+    start_local_store_maintenance()
+    # Agrégation des partitions mensuelles de price_history (Supabase, si la migration est appliquée)
+    start_remote_compaction()
+    # Reprend les jobs de scan restés en file lors de l'arrêt précédent
+    scan_job_queue.start()
+    # Rafraîchissement périodique de la matrice découverte (si FLIGHTWATCHER_INSPIRE_ORIGINS)
+    inspire.start()
+    # Revalidation groupée des favoris (clé service_role et colonne current_price requises)
+    if SUPABASE_AVAILABLE and get_supabase_service_client() and _verifier_colonne_prix_favoris() is not False:
+        favorites_revalidation.start(_revalider_favoris)
+
+@app.on_event("shutdown")
+def shutdown_save_state():
+    """Sauvegarde le modèle de score (observations reçues depuis le démarrage) et le snapshot des caches"""
+    if deals.is_loaded and deals.deal_model.routes:
+        try:
+            deals.deal_model.save()
+        except Exception as e:
+            print(f"⚠️ Erreur sauvegarde modèle de score: {e}")
+    try:
+        state_snapshot.snapshot.save()
+    except Exception as e:
+        print(f"⚠️ Erreur sauvegarde du snapshot: {e}")
+    # Compteurs des auto-vérifications ignorées depuis la dernière écriture
+    auto_checks.flush()
+    # Ferme les connexions keep-alive vers l'API Ryanair
+    ryanair_client.get_transport().close()
+    # Écrit les derniers événements de la trace de requêtes
+    request_trace.recorder.close()
+
 class FlightResponse(BaseModel):
     flightNumber: str
     origin: str
@@ -85,11 +264,80 @@ class ScanRequest(BaseModel):
     limite_allers: Optional[int] = 50  # Nombre max d'allers à traiter pour les retours
     destinations_exclues: Optional[List[str]] = []  # Codes IATA des destinations à exclure
     destinations_incluses: Optional[List[str]] = None  # Codes IATA des destinations à inclure (si None, toutes sauf exclues)
+    aeroports_depart: Optional[List[str]] = None  # Plusieurs départs possibles (ex: ["BVA", "CDG", "ORY"] ou ["PAR"]), prioritaire sur aeroport_depart
+    meme_aeroport_retour: Optional[bool] = False  # En multi-départs : revenir à l'aéroport de départ du voyage
+
+class FlexibleScanRequest(BaseModel):
+    aeroport_depart: str = "BVA"
+    date_debut: str  # Premier jour de départ possible (ISO)
+    date_fin: str  # Dernier jour de départ possible (ISO)
+    nuits_min: int = 2
+    nuits_max: int = 4
+    budget_max: Optional[int] = 200  # Prix max pour le total (aller + retour)
+    destinations_exclues: Optional[List[str]] = []
+    destinations_incluses: Optional[List[str]] = None  # Si None : les destinations les moins chères depuis l'aéroport
+    limite_destinations: Optional[int] = 10  # Nombre max de routes lues dans le calendrier
+    resultats_par_destination: Optional[int] = 1
+
+class ReverseSearchRequest(BaseModel):
+    destination: str  # Code IATA de la destination
+    aeroports_depart: Optional[List[str]] = None  # Origines candidates (codes ville acceptés), défaut : origines populaires
+    date_debut: str  # ISO
+    date_fin: str  # ISO
+    inclure_retour: Optional[bool] = False  # Ajouter la grille des retours (destination -> origines)
+
+class PriceGridDay(BaseModel):
+    date: str
+    prix: Dict[str, float]  # Origine -> prix le moins cher du jour
+    meilleure_origine: Optional[str] = None
+    meilleur_prix: Optional[float] = None
+
+class ReverseSearchResponse(BaseModel):
+    destination: str
+    aeroports_depart: List[str]
+    aller: List[PriceGridDay]
+    retour: List[PriceGridDay] = []
+    meilleur_aller: Optional[PriceGridDay] = None
+    nombre_requetes: int
+    message: str
+
+class ScanJobResponse(BaseModel):
+    job_id: str
+    status: str  # queued, running, done, failed, cancelled
+    position: Optional[int] = None  # Position dans la file si en attente
+    progress: Optional[Dict[str, Any]] = None  # {"done": destinations traitées, "total": ..., "segments_ignores": [...]}
+    resultats: Optional[List[TripResponse]] = None  # Partiels pendant l'exécution, finaux ensuite
+    segments_ignores: List[str] = []  # Segments non obtenus (résultats finaux partiels, non mis en cache)
+    nombre_requetes: int = 0
+    error: Optional[str] = None
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 class ScanResponse(BaseModel):
     resultats: List[TripResponse]
     nombre_requetes: int
     message: str
+    estimation_requetes: Optional[int] = None  # Coût estimé avant exécution (réservé dans le budget)
+    segments_ignores: List[str] = []  # Segments non obtenus avant l'échéance (résultats partiels)
+
+class BatchScanRequest(BaseModel):
+    requetes: List[ScanRequest]  # Scans liés (mêmes origines, presets ou budgets différents)
+
+class BatchScanResponse(BaseModel):
+    resultats: List[ScanResponse]  # Dans l'ordre des requêtes
+    nombre_requetes: int  # Requêtes API pour tout le lot
+    segments: Dict[str, int]  # Segments distincts planifiés : {"aller": ..., "retour": ...}
+    message: str
+    estimation_requetes: Optional[int] = None
+
+class EnrichedTripResponse(TripResponse):
+    discount_percent: Optional[float] = None
+    is_good_deal: Optional[bool] = None
+    image_url: Optional[str] = None
+    avg_price_last_month: Optional[float] = None
+    deal_percentile: Optional[float] = None  # Rang du prix dans l'historique (0 = le moins cher)
+    recommendation: Optional[str] = None  # 'buy_now' ou 'wait'
 
 class AutoCheckRequest(BaseModel):
     search_id: str
@@ -99,8 +347,12 @@ class AutoCheckResponse(BaseModel):
     search_id: str
     current_results: List[TripResponse]
     new_results: List[TripResponse]
+    deal_alerts: List[EnrichedTripResponse] = []  # Nouveaux résultats jugés bonnes affaires par le modèle
     nombre_requetes: int
     message: str
+    next_check_seconds: Optional[int] = None  # Intervalle effectif avant la prochaine vérification utile
+    estimation_requetes: Optional[int] = None
+    skipped: bool = False  # Vérification pas encore due : derniers résultats, sans appel à l'API
 
 class InspireRequest(BaseModel):
     budget: int
@@ -110,218 +362,282 @@ class InspireRequest(BaseModel):
     destinations_exclues: Optional[List[str]] = None
     limite_allers: Optional[int] = None
 
-class EnrichedTripResponse(TripResponse):
-    discount_percent: Optional[float] = None
-    is_good_deal: Optional[bool] = None
-    image_url: Optional[str] = None
-    avg_price_last_month: Optional[float] = None
-
 class InspireResponse(BaseModel):
     resultats: List[EnrichedTripResponse]
     nombre_requetes: int
     message: str
+    segments_ignores: List[str] = []
+
+def _fenetre_horaire(date_config: DateAvecHoraire):
+    """
+    Fenêtre de recherche d'une date avec horaires :
+    (date, date de fin, heure_min, heure_max, departure_time_from, departure_time_to)
+    """
+    date_obj = datetime.fromisoformat(date_config.date).date()
+    heure_min = datetime.strptime(date_config.heure_min or "00:00", "%H:%M").time()
+    heure_max = datetime.strptime(date_config.heure_max or "23:59", "%H:%M").time()
+    
+    # Si la plage traverse minuit, chercher aussi le jour suivant (jusqu'à 23:59 le jour suivant)
+    if heure_max < heure_min:
+        return date_obj, date_obj + timedelta(days=1), heure_min, heure_max, date_config.heure_min or "00:00", "23:59"
+    # Plage normale : chercher seulement le jour actuel
+    return (date_obj, date_obj, heure_min, heure_max,
+            date_config.heure_min or "00:00", date_config.heure_max or "23:59")
+
+def _horaire_correspond(departure: datetime, date_obj: date, heure_min, heure_max) -> bool:
+    """Vérifie date et horaire exacts d'un vol"""
+    vol_date = departure.date()
+    vol_heure = departure.time()
+    # Gérer les plages qui traversent minuit (ex: 23:00 à 06:00) :
+    # accepter entre heure_min et 23:59 le jour actuel OU entre 00:00 et heure_max le jour suivant
+    if heure_max < heure_min:
+        return (vol_date == date_obj and vol_heure >= heure_min) or \
+               (vol_date == date_obj + timedelta(days=1) and vol_heure <= heure_max)
+    return vol_date == date_obj and heure_min <= vol_heure <= heure_max
+
+def _flight_response(vol: Flight) -> FlightResponse:
+    return FlightResponse(
+        flightNumber=vol.flightNumber,
+        origin=vol.origin,
+        originFull=vol.originFull,
+        destination=vol.destination,
+        destinationFull=vol.destinationFull,
+        departureTime=vol.departureTime.isoformat(),
+        price=vol.price,
+        currency=vol.currency
+    )
+
+def _collecter_allers(fetcher: FareFetcher, aeroport_depart: str, dates_depart: List[DateAvecHoraire],
+                      budget_max: int, destinations_exclues: List[str],
+                      destinations_incluses: Optional[List[str]]) -> List[Flight]:
+    """Tous les vols aller depuis un aéroport pour les dates demandées, filtrés par horaire et destination"""
+    vols_aller = []
+    # Une seule destination demandée : filtre poussé dans la requête amont (réponse ciblée)
+    destination_unique = None
+    if destinations_incluses is not None and len(destinations_incluses) == 1:
+        destination_unique = destinations_incluses[0]
+    for date_config in dates_depart:
+        try:
+            date_obj, date_to, heure_min, heure_max, time_from, time_to = _fenetre_horaire(date_config)
+            
+            # Ne pas filtrer par prix au niveau des allers (on filtrera au niveau total)
+            # Utiliser budget_max comme limite max pour éviter les prix trop élevés
+            vols = fetcher.get_cheapest_flights(
+                airport=aeroport_depart,
+                date_from=date_obj,
+                date_to=date_to,
+                destination_airport=destination_unique,
+                departure_time_from=time_from,
+                departure_time_to=time_to,
+                max_price=budget_max  # Limite pour éviter les prix trop élevés, mais le vrai filtre sera sur le total
+            )
+            for vol in vols:
+                if not _horaire_correspond(vol.departureTime, date_obj, heure_min, heure_max):
+                    continue
+                # Filtrer par destinations si spécifié
+                if vol.destination in destinations_exclues:
+                    continue
+                if destinations_incluses is not None and vol.destination not in destinations_incluses:
+                    continue
+                vols_aller.append(vol)
+        except Exception as e:
+            print(f"  Erreur pour la date {date_config.date}: {e}")
+            continue
+    return vols_aller
+
+def _meilleurs_retours(fetcher: FareFetcher, destination_code: str, origines: List[str],
+                       dates_retour: List[DateAvecHoraire], budget_max: int) -> Dict[str, Flight]:
+    """
+    Retour le moins cher vers chaque origine depuis une destination.
+    Une seule origine : le filtre est poussé dans la requête ; plusieurs : une requête
+    par date de retour couvre toutes les origines (partagée au lieu d'une par origine).
+    """
+    retours: Dict[str, Flight] = {}
+    for date_retour_config in dates_retour:
+        try:
+            date_obj, date_to, heure_min, heure_max, time_from, time_to = _fenetre_horaire(date_retour_config)
+            
+            # Ne pas filtrer strictement par prix au niveau API pour les retours
+            # On filtrera par prix total après
+            vols_retour = fetcher.get_cheapest_flights(
+                airport=destination_code,
+                date_from=date_obj,
+                date_to=date_to,
+                destination_airport=origines[0] if len(origines) == 1 else None,
+                departure_time_from=time_from,
+                departure_time_to=time_to,
+                max_price=budget_max  # Limite haute pour éviter les prix déraisonnables
+            )
+            for vol_retour in vols_retour:
+                if vol_retour.destination not in origines:
+                    continue
+                if not _horaire_correspond(vol_retour.departureTime, date_obj, heure_min, heure_max):
+                    continue
+                meilleur = retours.get(vol_retour.destination)
+                if meilleur is None or vol_retour.price < meilleur.price:
+                    retours[vol_retour.destination] = vol_retour
+        except Exception as e:
+            print(f"  Erreur retour {destination_code} le {date_retour_config.date}: {e}")
+            continue
+    return retours
+
+def _selectionner_destinations(tous_vols_aller: List[Tuple[str, Flight]], limite_allers: int):
+    """
+    Meilleur aller par destination et par origine, puis les limite_allers destinations
+    les moins chères : (allers par destination, destinations retenues)
+    """
+    tous_vols_aller = sorted(tous_vols_aller, key=lambda item: item[1].price)
+    
+    # Grouper par destination et garder le meilleur prix par destination (et par origine)
+    vols_aller_optimises: Dict[str, Dict[str, Flight]] = {}
+    for origine, vol in tous_vols_aller:
+        par_origine = vols_aller_optimises.setdefault(vol.destination, {})
+        if origine not in par_origine or vol.price < par_origine[origine].price:
+            par_origine[origine] = vol
+    
+    # Prendre les N meilleurs (triés par prix)
+    destinations_retenues = sorted(
+        vols_aller_optimises,
+        key=lambda dest: min(vol.price for vol in vols_aller_optimises[dest].values())
+    )[:limite_allers]
+    return vols_aller_optimises, destinations_retenues
 
 def scanner_vols_api(aeroport_depart: str, dates_depart: List[DateAvecHoraire], 
                      dates_retour: List[DateAvecHoraire], budget_max: int = 200,
                      limite_allers: int = 50, destinations_exclues: List[str] = None,
                      destinations_incluses: List[str] = None, 
-                     record_prices: bool = True) -> Tuple[List[TripResponse], int]:
+                     record_prices: bool = True,
+                     refresh_fares: bool = False,
+                     cache_only: bool = False,
+                     deadline_seconds: Optional[float] = None,
+                     scan_info: Optional[Dict] = None,
+                     aeroports_depart: Optional[List[str]] = None,
+                     meme_aeroport_retour: bool = False,
+                     on_progress: Optional[Callable[[int, int, List[TripResponse]], None]] = None,
+                     should_cancel: Optional[Callable[[], bool]] = None) -> Tuple[List[TripResponse], int]:
     """
     Fonction de scan optimisée :
     1. Récupère TOUS les vols aller d'abord
     2. Trie par prix et garde les plus pertinents
     3. Cherche les retours uniquement pour les meilleurs allers
+
+    aeroports_depart (ou un code ville comme PAR) : scan multi-départs. Les allers de chaque
+    origine sont récupérés en parallèle, les retours sont partagés par destination et les
+    résultats fusionnés, triés par prix total. meme_aeroport_retour impose de revenir à
+    l'aéroport de départ du voyage.
+    refresh_fares=True ignore le cache des tarifs (rafraîchissement d'un résultat périmé)
+    cache_only=True n'interroge pas l'API (mode dégradé : résultats des segments en cache)
+    deadline_seconds : échéance du scan, propagée à chaque segment ; au-delà, seuls les
+    segments en cache sont utilisés et les autres sont ignorés (résultats partiels)
+    scan_info (optionnel) reçoit "candidates" : nombre de destinations aller avant limite_allers,
+    "allers" : prix de l'aller le moins cher par destination, et "segments_ignores" : segments
+    non obtenus (échéance ou erreur de l'API)
+    on_progress(faites, total, résultats partiels) est appelé après chaque destination ;
+    should_cancel() est testé avant chaque destination (le scan s'arrête avec les résultats partiels)
     """
-    api = Ryanair(currency="EUR")
+    origines = expand_origins(aeroports_depart or [aeroport_depart])
     resultats = []
     
-    if not dates_depart or not dates_retour:
+    if not dates_depart or not dates_retour or not origines:
         return [], 0
     
     # Normaliser les listes de destinations
     destinations_exclues = destinations_exclues or []
     destinations_incluses = destinations_incluses if destinations_incluses is not None else None
     
+    # Tarifs servis par le cache (mémoire puis stockage local) avant l'API Ryanair
+    # Un fetcher par origine : les balayages aller tournent dans des threads distincts
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    fetchers = [FareFetcher(refresh=refresh_fares, cache_only=cache_only, deadline=deadline) for _ in origines]
+    
     # Étape 1: Récupérer TOUS les vols aller pour toutes les dates
-    print(f"📥 Étape 1: Récupération de tous les vols aller depuis {aeroport_depart}...")
-    tous_vols_aller = []
+    print(f"📥 Étape 1: Récupération de tous les vols aller depuis {', '.join(origines)}...")
+    def balayer(index: int) -> List[Flight]:
+        return _collecter_allers(fetchers[index], origines[index], dates_depart, budget_max,
+                                 destinations_exclues, destinations_incluses)
     
-    for date_config in dates_depart:
-        date_obj = datetime.fromisoformat(date_config.date).date()
-        try:
-            heure_min = datetime.strptime(date_config.heure_min or "00:00", "%H:%M").time()
-            heure_max = datetime.strptime(date_config.heure_max or "23:59", "%H:%M").time()
-            
-            # Si la plage traverse minuit, chercher aussi le jour suivant
-            if heure_max < heure_min:
-                # Plage qui traverse minuit : chercher sur 2 jours
-                date_to = date_obj + timedelta(days=1)
-                departure_time_from = date_config.heure_min or "00:00"
-                departure_time_to = "23:59"  # Chercher jusqu'à 23:59 le jour suivant
-            else:
-                # Plage normale : chercher seulement le jour actuel
-                date_to = date_obj
-                departure_time_from = date_config.heure_min or "00:00"
-                departure_time_to = date_config.heure_max or "23:59"
-            
-            # Ne pas filtrer par prix au niveau des allers (on filtrera au niveau total)
-            # Utiliser budget_max comme limite max pour éviter les prix trop élevés
-            vols = api.get_cheapest_flights(
-                airport=aeroport_depart,
-                date_from=date_obj,
-                date_to=date_to,
-                departure_time_from=departure_time_from,
-                departure_time_to=departure_time_to,
-                max_price=budget_max  # Limite pour éviter les prix trop élevés, mais le vrai filtre sera sur le total
-            )
-            # Filtrer par date exacte et horaire
-            for vol in vols:
-                vol_date = vol.departureTime.date()
-                vol_heure = vol.departureTime.time()
-                
-                # Gérer les plages qui traversent minuit (ex: 23:00 à 06:00)
-                if heure_max < heure_min:
-                    # Plage qui traverse minuit : accepter entre heure_min et 23:59 le jour actuel OU entre 00:00 et heure_max le jour suivant
-                    time_matches = (vol_date == date_obj and vol_heure >= heure_min) or \
-                                  (vol_date == date_obj + timedelta(days=1) and vol_heure <= heure_max)
-                else:
-                    # Plage normale : accepter entre heure_min et heure_max
-                    time_matches = vol_date == date_obj and heure_min <= vol_heure <= heure_max
-                
-                if time_matches:
-                    # Ne pas filtrer par prix ici, on vérifiera le total plus tard
-                    # Filtrer par destinations si spécifié
-                    dest_code = vol.destination
-                    if dest_code in destinations_exclues:
-                        continue
-                    if destinations_incluses is not None and dest_code not in destinations_incluses:
-                        continue
-                    tous_vols_aller.append(vol)
-        except Exception as e:
-            print(f"  Erreur pour la date {date_config.date}: {e}")
-            continue
+    if len(origines) == 1:
+        allers_par_origine = [balayer(0)]
+    else:
+        # Un contexte copié par origine : les appels restent rattachés à la trace de la requête
+        with ThreadPoolExecutor(max_workers=len(origines)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, balayer, i) for i in range(len(origines))]
+            allers_par_origine = [future.result() for future in futures]
     
+    tous_vols_aller = [
+        (origine, vol) for origine, vols in zip(origines, allers_par_origine) for vol in vols
+    ]
     print(f"  ✓ {len(tous_vols_aller)} vol(s) aller trouvé(s)")
     
+    if scan_info is not None:
+        scan_info["candidates"] = len({vol.destination for _, vol in tous_vols_aller})
+        scan_info["segments_ignores"] = [leg["segment"] for f in fetchers for leg in f.skipped_legs]
+    
     if not tous_vols_aller:
-        return [], api.num_queries
+        return [], sum(f.num_queries for f in fetchers)
     
     # Étape 2: Trier par prix et garder les plus pertinents
-    tous_vols_aller.sort(key=lambda v: v.price)
-    
-    # Grouper par destination et garder le meilleur prix par destination
-    vols_aller_optimises = {}
-    for vol in tous_vols_aller:
-        dest = vol.destination
-        if dest not in vols_aller_optimises or vol.price < vols_aller_optimises[dest].price:
-            vols_aller_optimises[dest] = vol
-    
-    # Prendre les N meilleurs (triés par prix)
-    vols_aller_filtres = sorted(vols_aller_optimises.values(), key=lambda v: v.price)[:limite_allers]
-    print(f"  ✓ {len(vols_aller_filtres)} destination(s) retenue(s) pour recherche de retours")
+    vols_aller_optimises, destinations_retenues = _selectionner_destinations(tous_vols_aller, limite_allers)
+    if scan_info is not None:
+        scan_info["allers"] = {
+            dest: min(vol.price for vol in vols.values()) for dest, vols in vols_aller_optimises.items()
+        }
+    print(f"  ✓ {len(destinations_retenues)} destination(s) retenue(s) pour recherche de retours")
     
     # Étape 3: Chercher les retours uniquement pour les meilleurs allers
     print(f"📤 Étape 2: Recherche des vols retour pour les meilleures destinations...")
-    for vol_aller in vols_aller_filtres:
-        destination_code = vol_aller.destination
-        
-        # Chercher un retour pour chaque date de retour possible
-        meilleur_retour = None
-        meilleur_prix_total = float('inf')
-        
-        for date_retour_config in dates_retour:
-            date_retour_obj = datetime.fromisoformat(date_retour_config.date).date()
-            try:
-                heure_min = datetime.strptime(date_retour_config.heure_min or "00:00", "%H:%M").time()
-                heure_max = datetime.strptime(date_retour_config.heure_max or "23:59", "%H:%M").time()
-                
-                # Si la plage traverse minuit, chercher aussi le jour suivant
-                if heure_max < heure_min:
-                    # Plage qui traverse minuit : chercher sur 2 jours
-                    date_retour_to = date_retour_obj + timedelta(days=1)
-                    departure_time_from = date_retour_config.heure_min or "00:00"
-                    departure_time_to = "23:59"  # Chercher jusqu'à 23:59 le jour suivant
-                else:
-                    # Plage normale : chercher seulement le jour actuel
-                    date_retour_to = date_retour_obj
-                    departure_time_from = date_retour_config.heure_min or "00:00"
-                    departure_time_to = date_retour_config.heure_max or "23:59"
-                
-                # Ne pas filtrer strictement par prix au niveau API pour les retours
-                # On filtrera par prix total après
-                vols_retour = api.get_cheapest_flights(
-                    airport=destination_code,
-                    date_from=date_retour_obj,
-                    date_to=date_retour_to,
-                    destination_airport=aeroport_depart,
-                    departure_time_from=departure_time_from,
-                    departure_time_to=departure_time_to,
-                    max_price=budget_max  # Limite haute pour éviter les prix déraisonnables
-                )
-                
-                for vol_retour in vols_retour:
-                    # Vérifier date et horaire exacts
-                    vol_retour_date = vol_retour.departureTime.date()
-                    vol_retour_heure = vol_retour.departureTime.time()
-                    
-                    # Gérer les plages qui traversent minuit (ex: 23:00 à 06:00)
-                    if heure_max < heure_min:
-                        # Plage qui traverse minuit : accepter entre heure_min et 23:59 le jour actuel OU entre 00:00 et heure_max le jour suivant
-                        time_matches = (vol_retour_date == date_retour_obj and vol_retour_heure >= heure_min) or \
-                                      (vol_retour_date == date_retour_obj + timedelta(days=1) and vol_retour_heure <= heure_max)
-                    else:
-                        # Plage normale : accepter entre heure_min et heure_max
-                        time_matches = vol_retour_date == date_retour_obj and heure_min <= vol_retour_heure <= heure_max
-                    
-                    if time_matches:
-                        prix_total = vol_aller.price + vol_retour.price
-                        # Filtrer par prix total (pas par segment)
-                        if prix_total <= budget_max and prix_total < meilleur_prix_total:
-                            meilleur_retour = vol_retour
-                            meilleur_prix_total = prix_total
-            except Exception:
-                continue
+    fetcher_retours = fetchers[0]
+    for index, destination_code in enumerate(destinations_retenues):
+        if should_cancel and should_cancel():
+            print(f"  ⏹ Scan annulé après {index} destination(s)")
+            break
+        retours = _meilleurs_retours(fetcher_retours, destination_code, origines, dates_retour, budget_max)
+        
+        # Meilleure combinaison aller / retour (filtrer par prix total, pas par segment)
+        meilleur = None
+        for origine_aller, vol_aller in vols_aller_optimises[destination_code].items():
+            for origine_retour, vol_retour in retours.items():
+                if meme_aeroport_retour and origine_retour != origine_aller:
+                    continue
+                prix_total = vol_aller.price + vol_retour.price
+                if prix_total <= budget_max and (meilleur is None or prix_total < meilleur[2]):
+                    meilleur = (vol_aller, vol_retour, prix_total)
         
         # Si on a trouvé un retour valide
-        if meilleur_retour:
+        if meilleur:
+            vol_aller, vol_retour, prix_total = meilleur
             resultats.append(TripResponse(
-                aller=FlightResponse(
-                    flightNumber=vol_aller.flightNumber,
-                    origin=vol_aller.origin,
-                    originFull=vol_aller.originFull,
-                    destination=vol_aller.destination,
-                    destinationFull=vol_aller.destinationFull,
-                    departureTime=vol_aller.departureTime.isoformat(),
-                    price=vol_aller.price,
-                    currency=vol_aller.currency
-                ),
-                retour=FlightResponse(
-                    flightNumber=meilleur_retour.flightNumber,
-                    origin=meilleur_retour.origin,
-                    originFull=meilleur_retour.originFull,
-                    destination=meilleur_retour.destination,
-                    destinationFull=meilleur_retour.destinationFull,
-                    departureTime=meilleur_retour.departureTime.isoformat(),
-                    price=meilleur_retour.price,
-                    currency=meilleur_retour.currency
-                ),
-                prix_total=meilleur_prix_total,
+                aller=_flight_response(vol_aller),
+                retour=_flight_response(vol_retour),
+                prix_total=prix_total,
                 destination_code=destination_code
             ))
+        
+        if on_progress:
+            on_progress(index + 1, len(destinations_retenues), resultats)
+    
+    if len(origines) > 1:
+        resultats.sort(key=lambda trip: trip.prix_total)
     
     print(f"  ✓ {len(resultats)} voyage(s) aller-retour complet(s) trouvé(s)")
+    num_queries = sum(f.num_queries for f in fetchers)
+    if scan_info is not None:
+        scan_info["segments_ignores"] = [leg["segment"] for f in fetchers for leg in f.skipped_legs]
     
-    # Enregistrer les prix dans price_history si activé
-    if record_prices and resultats and SUPABASE_AVAILABLE:
+    # Enregistrer les prix dans price_history si activé (stockage local + Supabase si configuré)
+    # Un scan servi entièrement par le cache n'apporte pas de nouvelle observation
+    if record_prices and resultats and num_queries > 0:
         try:
             # Convertir les TripResponse en dict pour éviter import circulaire
             trips_dict = [trip.model_dump() for trip in resultats]
             record_price_history(trips_dict)
+            # Mise à jour incrémentale du modèle de score des affaires
+            deals.deal_model.observe_records(build_price_records(trips_dict))
         except Exception as e:
             print(f"⚠️ Erreur enregistrement price_history: {e}")
             # Ne pas bloquer le scan
     
-    return resultats, api.num_queries
+    return resultats, num_queries
 
 def get_dates_from_preset(preset: str) -> Tuple[List[DateAvecHoraire], List[DateAvecHoraire]]:
     """
@@ -375,39 +691,46 @@ def get_dates_from_preset(preset: str) -> Tuple[List[DateAvecHoraire], List[Date
 
 def get_avg_price_last_month(departure_airport: str, destination_code: str) -> Optional[float]:
     """
-    Récupère le prix moyen du mois dernier pour une route donnée depuis Supabase
+    Récupère le prix moyen du mois dernier pour une route donnée
+    depuis Supabase, ou depuis l'historique local si Supabase n'est pas disponible
     """
-    if not SUPABASE_AVAILABLE:
+    return route_stats.get_avg_price(departure_airport, destination_code, _fetch_avg_price_last_month)
+
+def _get_local_avg_price(departure_airport: str, destination_code: str) -> Optional[float]:
+    local_store = get_fare_store()
+    if not local_store:
         return None
+    return local_store.get_avg_price(departure_airport, destination_code)
+
+def _fetch_avg_price_last_month(departure_airport: str, destination_code: str) -> Optional[float]:
+    """Loader de route_stats : lève une exception en cas d'erreur (le résultat n'est alors pas mis en cache)"""
+    if not SUPABASE_AVAILABLE:
+        return _get_local_avg_price(departure_airport, destination_code)
     
-    try:
-        supabase_service = get_supabase_service_client()
-        if not supabase_service:
-            return None
-        
-        # Utiliser la fonction SQL get_avg_price_last_30_days
-        # La fonction retourne directement un DECIMAL ou NULL
-        result = supabase_service.rpc(
-            'get_avg_price_last_30_days',
-            {
-                'p_departure': departure_airport,
-                'p_destination': destination_code
-            }
-        ).execute()
-        
-        # La fonction RPC retourne directement la valeur (DECIMAL) ou None
-        if result.data is not None:
-            try:
-                avg_price = float(result.data)
-                if avg_price > 0:
-                    return avg_price
-            except (ValueError, TypeError):
-                pass
-        
-        return None
-    except Exception as e:
-        print(f"⚠️ Erreur récupération prix moyen: {e}")
-        return None
+    supabase_service = get_supabase_service_client()
+    if not supabase_service:
+        return _get_local_avg_price(departure_airport, destination_code)
+    
+    # Utiliser la fonction SQL get_avg_price_last_30_days
+    # La fonction retourne directement un DECIMAL ou NULL
+    result = supabase_service.rpc(
+        'get_avg_price_last_30_days',
+        {
+            'p_departure': departure_airport,
+            'p_destination': destination_code
+        }
+    ).execute()
+    
+    # La fonction RPC retourne directement la valeur (DECIMAL) ou None
+    if result.data is not None:
+        try:
+            avg_price = float(result.data)
+            if avg_price > 0:
+                return avg_price
+        except (ValueError, TypeError):
+            pass
+    
+    return None
 
 def calculate_discount(current_price: float, avg_price: Optional[float]) -> float:
     """
@@ -429,12 +752,18 @@ def enrich_trip_results(trips: List[TripResponse], departure_airport: str) -> Li
     enriched = []
     
     for trip in trips[:15]:  # Limiter à 15 résultats pour performance
-        # Récupérer prix moyen
-        avg_price = get_avg_price_last_month(departure_airport, trip.destination_code)
+        # Prix moyen des 30 derniers jours : modèle de score en mémoire (sommes exactes par jour
+        # d'observation), sinon price_history (cache route_stats)
+        avg_price = deals.deal_model.recent_mean(departure_airport, trip.destination_code)
+        if avg_price is None:
+            avg_price = get_avg_price_last_month(departure_airport, trip.destination_code)
         
         # Calculer discount
         discount_percent = calculate_discount(trip.prix_total, avg_price)
         
+        # Score du modèle (anticipation + jour de semaine), lecture en mémoire sans requête
+        score = deals.deal_model.score_trip(trip.model_dump())
+        
         # Générer URL image Unsplash
         city_name = trip.aller.destinationFull.split(',')[0].strip()
         image_url = f"https://source.unsplash.com/800x600/?{city_name}"
@@ -446,15 +775,50 @@ def enrich_trip_results(trips: List[TripResponse], departure_airport: str) -> Li
             prix_total=trip.prix_total,
             destination_code=trip.destination_code,
             discount_percent=discount_percent if discount_percent > 0 else None,
-            is_good_deal=discount_percent > 20,
+            # Sans historique suffisant pour la route : règle simple sur le prix moyen
+            is_good_deal=score["is_good_deal"] if score else discount_percent > 20,
             image_url=image_url,
-            avg_price_last_month=avg_price
+            avg_price_last_month=avg_price,
+            deal_percentile=score["percentile"] if score else None,
+            recommendation=score["recommendation"] if score else None
         )
         
         enriched.append(enriched_trip)
     
     return enriched
 
+# ==================== WARM-UP ====================
+
+@lifecycle.warmup_task("airports")
+def warmup_airports():
+    """Construit l'index des aéroports (parsing du CSV)"""
+    return {"airports": len(search_airports())}
+
+@lifecycle.warmup_task("destinations")
+def warmup_destinations():
+    """Précharge le graphe des destinations des aéroports populaires"""
+    counts = {}
+    for origin in lifecycle.get_popular_origins():
+        destinations = load_destinations_by_country(origin)
+        counts[origin] = sum(len(dests) for dests in destinations.values())
+    return counts
+
+@lifecycle.warmup_task("deal_model")
+def warmup_deal_model():
+    """Charge (ou ajuste depuis l'export colonnaire) le modèle de score des affaires"""
+    return deals.load_or_fit()
+
+@lifecycle.warmup_task("route_stats")
+def warmup_route_stats():
+    """Précharge le prix moyen 30 jours des routes depuis les aéroports populaires"""
+    routes = 0
+    for origin in lifecycle.get_popular_origins():
+        for dests in load_destinations_by_country(origin).values():
+            for dest in dests:
+                get_avg_price_last_month(origin, dest['code'])
+                routes += 1
+    return {"routes": routes}
+
 @app.get("/")
 def read_root():
     return {"message": "Ryanair Flight Scanner API", "status": "ok"}
@@ -464,11 +828,15 @@ def generate_cache_key(request: ScanRequest) -> str:
     cache_data = {
         "departure_airport": request.aeroport_depart or "BVA",
         "budget_max": request.budget_max or 200,
+        "limite_allers": request.limite_allers or 50,
         "dates_depart": [d.model_dump() for d in request.dates_depart],
         "dates_retour": [d.model_dump() for d in request.dates_retour],
         "destinations_exclues": sorted(request.destinations_exclues or []),
         "destinations_incluses": sorted(request.destinations_incluses) if request.destinations_incluses else None
     }
+    if request.aeroports_depart:
+        cache_data["aeroports_depart"] = sorted(expand_origins(request.aeroports_depart))
+        cache_data["meme_aeroport_retour"] = bool(request.meme_aeroport_retour)
     cache_str = json.dumps(cache_data, sort_keys=True)
     return hashlib.md5(cache_str.encode()).hexdigest()
 
@@ -477,96 +845,676 @@ def generate_cache_key(request: ScanRequest) -> str:
 async def scan_flights(request: ScanRequest, http_request: Request = None):
     """Scan les vols avec paramètres personnalisés et cache"""
     try:
-        # Vérifier le cache si Supabase est disponible
         cache_key = generate_cache_key(request)
-        cached_result = None
-        
-        if SUPABASE_AVAILABLE:
+        request_dict = request.model_dump()
+
+        def run_scan(refresh_fares: bool = False, cache_only: bool = False,
+                     deadline_seconds: Optional[float] = None):
+            scan_info = {}
+            resultats, num_requetes = scanner_vols_api(
+                aeroport_depart=request.aeroport_depart or "BVA",
+                dates_depart=request.dates_depart,
+                dates_retour=request.dates_retour,
+                budget_max=request.budget_max or 200,
+                limite_allers=request.limite_allers or 50,
+                destinations_exclues=request.destinations_exclues or [],
+                destinations_incluses=request.destinations_incluses,
+                record_prices=True,
+                refresh_fares=refresh_fares,
+                cache_only=cache_only,
+                deadline_seconds=deadline_seconds,
+                scan_info=scan_info,
+                aeroports_depart=request.aeroports_depart,
+                meme_aeroport_retour=bool(request.meme_aeroport_retour)
+            )
+            return resultats, num_requetes, scan_info
+
+        def refresh_cached_scan():
+            # Tâche de fond : coût pris dans le seau global (tous les segments sont relus)
+            estimation = estimer_cout_scan(request, rafraichissement=True)["total"]
+            _reserver_tache_de_fond(estimation)
+            num_requetes = 0
             try:
-                supabase_service = get_supabase_service_client()
-                if supabase_service:
-                    # Chercher dans le cache
-                    cache_result = supabase_service.table("search_results_cache")\
-                        .select("results, expires_at, hit_count")\
-                        .eq("cache_key", cache_key)\
-                        .gt("expires_at", datetime.now().isoformat())\
-                        .execute()
-                    
-                    if cache_result.data and len(cache_result.data) > 0:
-                        cached = cache_result.data[0]
-                        # Mettre à jour hit_count
-                        supabase_service.table("search_results_cache")\
-                            .update({
-                                "hit_count": (cached.get("hit_count", 0) or 0) + 1,
-                                "last_hit_at": datetime.now().isoformat()
-                            })\
-                            .eq("cache_key", cache_key)\
-                            .execute()
-                        
-                        cached_result = cached["results"]
-                        print(f"✅ Résultats récupérés depuis le cache (hit #{cached.get('hit_count', 0) + 1})")
-            except Exception as e:
-                print(f"⚠️ Erreur vérification cache: {e}")
+                with scan_admission.slot(admission.BACKGROUND):
+                    resultats, num_requetes, scan_info = run_scan(refresh_fares=True)
+            finally:
+                query_budgets.settle(None, estimation, num_requetes)
+            return ([r.model_dump() for r in resultats], scan_info.get("candidates"),
+                    scan_info.get("segments_ignores", []))
+
+        def admitted_scan():
+            try:
+                with scan_admission.slot(admission.INTERACTIVE, admission.INTERACTIVE_QUEUE_TARGET):
+                    return run_scan(deadline_seconds=SCAN_DEADLINE_SECONDS), False
+            except admission.Overloaded:
+                # Surcharge : réponse immédiate avec les segments déjà en cache
+                scan_admission.record_degraded(admission.INTERACTIVE)
+                return run_scan(cache_only=True), True
+
+        # Cache local (clé exacte puis dérivation d'un scan plus large), puis Supabase ;
+        # une entrée périmée est servie et rafraîchie en arrière-plan
+        cached = await asyncio.to_thread(scan_cache.lookup, cache_key, request_dict)
+        if cached:
+            if cached["stale"]:
+                scan_cache.revalidate(cache_key, request_dict, refresh_cached_scan)
+            request_trace.annotate(cache="derived" if cached["derived"] else cached["tier"],
+                                   stale=cached["stale"], queries=0)
+            return ScanResponse(
+                resultats=[TripResponse(**r) for r in cached["results"]],
+                nombre_requetes=0,
+                message=f"Scan terminé (cache): {len(cached['results'])} voyage(s) trouvé(s)"
+            )
         
-        # Si cache valide, retourner les résultats
-        if cached_result:
+        # Sinon, effectuer le scan (coût estimé réservé dans les budgets, corrigé ensuite)
+        estimation = estimer_cout_scan(request)["total"]
+        cle_quota = _cle_quota(http_request)
+        _reserver_requetes(cle_quota, estimation)
+        num_requetes = 0
+        try:
+            (resultats, num_requetes, scan_info), degrade = await asyncio.to_thread(admitted_scan)
+        finally:
+            query_budgets.settle(cle_quota, estimation, num_requetes)
+        request_trace.annotate(cache="miss", queries=num_requetes, estimation=estimation, degraded=degrade,
+                               segments_ignores=len(scan_info.get("segments_ignores", [])))
+        if degrade:
             return ScanResponse(
-                resultats=[TripResponse(**r) for r in cached_result],
+                resultats=resultats,
                 nombre_requetes=0,
-                message=f"Scan terminé (cache): {len(cached_result)} voyage(s) trouvé(s)"
+                message=f"Service surchargé, résultats partiels (cache uniquement): {len(resultats)} voyage(s) trouvé(s)",
+                estimation_requetes=estimation
+            )
+        segments_ignores = scan_info.get("segments_ignores", [])
+        if segments_ignores:
+            # Résultats partiels : pas de mise en cache
+            return ScanResponse(
+                resultats=resultats,
+                nombre_requetes=num_requetes,
+                message=f"Scan partiel ({len(segments_ignores)} segment(s) ignoré(s)): {len(resultats)} voyage(s) trouvé(s)",
+                estimation_requetes=estimation,
+                segments_ignores=segments_ignores
             )
+        await asyncio.to_thread(scan_cache.store, cache_key, request_dict,
+                                [r.model_dump() for r in resultats], scan_info.get("candidates"))
         
-        # Sinon, effectuer le scan
-        resultats, num_requetes = scanner_vols_api(
-            aeroport_depart=request.aeroport_depart or "BVA",
-            dates_depart=request.dates_depart,
-            dates_retour=request.dates_retour,
-            budget_max=request.budget_max or 200,
-            limite_allers=request.limite_allers or 50,
-            destinations_exclues=request.destinations_exclues or [],
-            destinations_incluses=request.destinations_incluses,
-            record_prices=True
+        return ScanResponse(
+            resultats=resultats,
+            nombre_requetes=num_requetes,
+            message=f"Scan terminé: {len(resultats)} voyage(s) trouvé(s)",
+            estimation_requetes=estimation
         )
-        
-        # Mettre en cache les résultats si Supabase est disponible
-        if SUPABASE_AVAILABLE and resultats:
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _origines_requete(request: ScanRequest) -> List[str]:
+    return expand_origins(request.aeroports_depart or [request.aeroport_depart or "BVA"])
+
+def estimer_cout_scan(request: ScanRequest, rafraichissement: bool = False) -> Dict[str, Any]:
+    """
+    Requêtes API qu'un scan va envoyer, compte tenu du cache des tarifs.
+    Allers : segments absents du cache (exact). Retours : exact si tous les allers sont
+    en cache (destinations retenues connues), sinon une requête par destination probable
+    et par date de retour (graphe des destinations si en cache, sinon limite_allers).
+    rafraichissement : scan qui relit tous ses segments (le cache n'est pas compté).
+    """
+    budget_max = request.budget_max or 200
+    limite_allers = request.limite_allers or 50
+    destinations_exclues = request.destinations_exclues or []
+    origines = _origines_requete(request)
+
+    if rafraichissement:
+        sonde = LegPlan()
+        for origine in origines:
+            _collecter_allers(sonde, origine, request.dates_depart, budget_max,
+                              destinations_exclues, request.destinations_incluses)
+        allers = len(sonde.legs)
+    else:
+        sonde = FareFetcher(cache_only=True)
+        tous_vols_aller = [
+            (origine, vol) for origine in origines
+            for vol in _collecter_allers(sonde, origine, request.dates_depart, budget_max,
+                                         destinations_exclues, request.destinations_incluses)
+        ]
+        allers = len(sonde.missing.legs)
+    if allers == 0 and not rafraichissement:
+        _, destinations_retenues = _selectionner_destinations(tous_vols_aller, limite_allers)
+        for destination_code in destinations_retenues:
+            _meilleurs_retours(sonde, destination_code, origines, request.dates_retour, budget_max)
+        retours = len(sonde.missing.legs)
+        return {"aller": 0, "retour": retours, "total": retours, "exact": True}
+
+    if request.destinations_incluses is not None:
+        nb_destinations = len(set(request.destinations_incluses) - set(destinations_exclues))
+    else:
+        graphes = [cached_destination_codes(origine) for origine in origines]
+        if all(graphe is not None for graphe in graphes):
+            nb_destinations = len(set().union(*graphes) - set(destinations_exclues))
+        else:
+            nb_destinations = limite_allers
+    retours = min(nb_destinations, limite_allers) * len(request.dates_retour)
+    return {"aller": allers, "retour": retours, "total": allers + retours, "exact": False}
+
+def _cle_quota(http_request: Optional[Request]) -> str:
+    if http_request is None:
+        return quota_key(None, None)
+    return quota_key(get_user_id_from_token(http_request), http_request.client.host if http_request.client else None)
+
+def _reserver_requetes(cle: str, cout: int) -> None:
+    """Réserve le coût estimé dans les budgets de requêtes ; 429 si l'un est épuisé"""
+    accepte, delai = query_budgets.reserve(cle, cout)
+    if not accepte:
+        retry_after = int(delai) + 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Budget de requêtes épuisé (coût estimé : {cout}), réessayer dans {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+def _reserver_tache_de_fond(cout: int) -> None:
+    """Tâche de fond : réserve dans le seau global seulement ; lève une erreur (tâche ignorée) s'il est vide"""
+    accepte, delai = query_budgets.reserve(None, cout)
+    if not accepte:
+        raise RuntimeError(
+            f"Budget global de requêtes épuisé (coût estimé : {cout}), tâche ignorée (réessai possible dans {int(delai) + 1}s)"
+        )
+
+def _surcharge(e: admission.Overloaded) -> HTTPException:
+    retry_after = int(e.retry_after) + 1
+    return HTTPException(
+        status_code=503,
+        detail=f"{e}, réessayer dans {retry_after}s",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+@app.post("/api/scan/estimate")
+@optional_auth
+async def estimate_scan(request: ScanRequest, http_request: Request = None):
+    """Coût estimé d'un scan (requêtes API) et budget restant, sans rien exécuter"""
+    try:
+        def estimer():
+            # Cache lu sans effet de bord (ni compteurs ni hit_count Supabase)
+            if scan_cache.peek(generate_cache_key(request), request.model_dump()):
+                return {"aller": 0, "retour": 0, "total": 0, "exact": True}
+            return estimer_cout_scan(request)
+
+        estimation = await asyncio.to_thread(estimer)
+        return {"estimation": estimation, "budget_restant": query_budgets.remaining(_cle_quota(http_request))}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _executer_lot(requetes: List[ScanRequest], a_scanner: List[int],
+                  reponses: List[Optional[ScanResponse]]) -> Tuple[int, Dict[str, int]]:
+    """Planifie et récupère les segments des requêtes a_scanner, puis remplit leurs réponses"""
+    # Étape 1 : segments aller de toutes les requêtes
+    plan_allers = LegPlan()
+    for index in a_scanner:
+        r = requetes[index]
+        for origine in _origines_requete(r):
+            _collecter_allers(plan_allers, origine, r.dates_depart, r.budget_max or 200,
+                              r.destinations_exclues or [], r.destinations_incluses)
+    num_requetes = plan_allers.execute()
+
+    # Étape 2 : segments retour des destinations retenues par chaque requête
+    plan_retours = LegPlan()
+    fetcher = FareFetcher()
+    for index in a_scanner:
+        r = requetes[index]
+        origines = _origines_requete(r)
+        tous_vols_aller = [
+            (origine, vol) for origine in origines
+            for vol in _collecter_allers(fetcher, origine, r.dates_depart, r.budget_max or 200,
+                                         r.destinations_exclues or [], r.destinations_incluses)
+        ]
+        _, destinations_retenues = _selectionner_destinations(tous_vols_aller, r.limite_allers or 50)
+        for destination_code in destinations_retenues:
+            _meilleurs_retours(plan_retours, destination_code, origines, r.dates_retour, r.budget_max or 200)
+    num_requetes += fetcher.num_queries + plan_retours.execute()
+
+    # Étape 3 : chaque scan est servi par le cache des segments
+    voyages: Dict[Tuple, Dict] = {}
+    for index in a_scanner:
+        r = requetes[index]
+        scan_info = {}
+        resultats, requetes_scan = scanner_vols_api(
+            aeroport_depart=r.aeroport_depart or "BVA",
+            dates_depart=r.dates_depart,
+            dates_retour=r.dates_retour,
+            budget_max=r.budget_max or 200,
+            limite_allers=r.limite_allers or 50,
+            destinations_exclues=r.destinations_exclues or [],
+            destinations_incluses=r.destinations_incluses,
+            record_prices=False,
+            scan_info=scan_info,
+            aeroports_depart=r.aeroports_depart,
+            meme_aeroport_retour=bool(r.meme_aeroport_retour)
+        )
+        num_requetes += requetes_scan
+        for trip in resultats:
+            cle = (trip.aller.flightNumber, trip.aller.departureTime,
+                   trip.retour.flightNumber, trip.retour.departureTime)
+            voyages[cle] = trip.model_dump()
+        segments_ignores = scan_info.get("segments_ignores", [])
+        if segments_ignores:
+            # Résultats partiels : pas de mise en cache
+            reponses[index] = ScanResponse(
+                resultats=resultats,
+                nombre_requetes=0,
+                message=f"Scan partiel ({len(segments_ignores)} segment(s) ignoré(s)): {len(resultats)} voyage(s) trouvé(s)",
+                segments_ignores=segments_ignores
+            )
+            continue
+        scan_cache.store(generate_cache_key(r), r.model_dump(),
+                         [trip.model_dump() for trip in resultats], scan_info.get("candidates"))
+        reponses[index] = ScanResponse(
+            resultats=resultats,
+            nombre_requetes=0,
+            message=f"Scan terminé: {len(resultats)} voyage(s) trouvé(s)"
+        )
+
+    # Prix enregistrés une fois pour l'ensemble du lot (voyages communs dédupliqués)
+    if voyages and num_requetes > 0:
+        try:
+            trips_dict = list(voyages.values())
+            record_price_history(trips_dict)
+            deals.deal_model.observe_records(build_price_records(trips_dict))
+        except Exception as e:
+            print(f"⚠️ Erreur enregistrement price_history: {e}")
+
+    return num_requetes, {"aller": len(plan_allers.legs), "retour": len(plan_retours.legs)}
+
+def _lot_depuis_cache(requetes: List[ScanRequest],
+                      reponses: List[Optional[ScanResponse]]) -> Tuple[List[int], int]:
+    """Remplit les réponses servies par le cache ; retourne les index à scanner et leur coût estimé"""
+    a_scanner = []
+    for index, scan_request in enumerate(requetes):
+        cached = scan_cache.lookup(generate_cache_key(scan_request), scan_request.model_dump())
+        if cached and not cached["stale"]:
+            reponses[index] = ScanResponse(
+                resultats=[TripResponse(**r) for r in cached["results"]],
+                nombre_requetes=0,
+                message=f"Scan terminé (cache): {len(cached['results'])} voyage(s) trouvé(s)"
+            )
+        else:
+            a_scanner.append(index)
+    # Estimation majorante (segments communs comptés pour chaque requête), corrigée après exécution
+    estimation = sum(estimer_cout_scan(requetes[index])["total"] for index in a_scanner)
+    return a_scanner, estimation
+
+@app.post("/api/scan/batch", response_model=BatchScanResponse)
+@optional_auth
+async def scan_batch(request: BatchScanRequest, http_request: Request = None):
+    """
+    Plusieurs scans en un appel. Les segments aller puis retour de toutes les requêtes
+    sont planifiés ensemble (dédupliqués, plafond de prix le plus large) et récupérés
+    une seule fois ; chaque scan est ensuite servi par le cache des tarifs.
+    """
+    if not request.requetes:
+        raise HTTPException(status_code=400, detail="Au moins une requête est nécessaire")
+    if len(request.requetes) > MAX_BATCH_SCANS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_SCANS} requêtes par lot")
+
+    try:
+        reponses: List[Optional[ScanResponse]] = [None] * len(request.requetes)
+        # Lectures du cache (local, Supabase) hors de la boucle d'événements
+        a_scanner, estimation = await asyncio.to_thread(_lot_depuis_cache, request.requetes, reponses)
+        cle_quota = _cle_quota(http_request)
+        _reserver_requetes(cle_quota, estimation)
+        num_requetes, segments = 0, {"aller": 0, "retour": 0}
+        def admitted_batch():
+            with scan_admission.slot(admission.INTERACTIVE, admission.INTERACTIVE_QUEUE_TARGET):
+                return _executer_lot(request.requetes, a_scanner, reponses)
+
+        try:
+            num_requetes, segments = await asyncio.to_thread(admitted_batch)
+        except admission.Overloaded as e:
+            raise _surcharge(e)
+        finally:
+            query_budgets.settle(cle_quota, estimation, num_requetes)
+        request_trace.annotate(cache_hits=len(request.requetes) - len(a_scanner), queries=num_requetes,
+                               estimation=estimation)
+
+        return BatchScanResponse(
+            resultats=reponses,
+            nombre_requetes=num_requetes,
+            segments=segments,
+            message=f"Lot terminé: {len(request.requetes)} scan(s), {len(a_scanner)} hors cache",
+            estimation_requetes=estimation
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/scan/flexible", response_model=ScanResponse)
+@optional_auth
+async def scan_flexible(request: FlexibleScanRequest, http_request: Request = None):
+    """
+    Scan sur fenêtre flexible : N à M nuits avec un départ entre deux dates.
+    Chaque route est lue une fois dans le calendrier des prix (un tarif par jour).
+    """
+    try:
+        date_debut = date.fromisoformat(request.date_debut)
+        date_fin = date.fromisoformat(request.date_fin)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates invalides (format YYYY-MM-DD)")
+    if date_fin < date_debut or (date_fin - date_debut).days > flex_search.MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La plage de départ doit couvrir entre 0 et {flex_search.MAX_RANGE_DAYS} jours"
+        )
+    if request.nuits_min < 0 or request.nuits_max < request.nuits_min:
+        raise HTTPException(status_code=400, detail="nuits_min doit être positif et inférieur à nuits_max")
+    limite_destinations = request.limite_destinations or 10
+    if not 1 <= limite_destinations <= flex_search.MAX_DESTINATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limite_destinations doit être comprise entre 1 et {flex_search.MAX_DESTINATIONS}"
+        )
+    destinations_exclues = request.destinations_exclues or []
+    if request.destinations_incluses:
+        nb_destinations = len([d for d in request.destinations_incluses if d not in destinations_exclues])
+    else:
+        nb_destinations = limite_destinations
+    estimation = flex_search.estimate_queries(
+        date_debut, date_fin, request.nuits_min, request.nuits_max,
+        min(nb_destinations, limite_destinations), discovery=not request.destinations_incluses
+    )
+
+    def admitted_flexible():
+        # Balayage synchrone (appels réseau) : hors de la boucle d'événements, dans un créneau de scan
+        with scan_admission.slot(admission.INTERACTIVE, admission.INTERACTIVE_QUEUE_TARGET):
+            return flex_search.search_nights_range(
+                origin=request.aeroport_depart or "BVA",
+                date_from=date_debut,
+                date_to=date_fin,
+                nights_min=request.nuits_min,
+                nights_max=request.nuits_max,
+                budget_max=request.budget_max,
+                destinations_incluses=request.destinations_incluses,
+                destinations_exclues=destinations_exclues,
+                limite_destinations=limite_destinations,
+                par_destination=request.resultats_par_destination or 1
+            )
+
+    try:
+        # Coût maximal réservé dans les budgets, corrigé avec le coût réel (cache compris)
+        cle_quota = _cle_quota(http_request)
+        _reserver_requetes(cle_quota, estimation)
+        num_requetes = 0
+        try:
+            trips, num_requetes = await asyncio.to_thread(admitted_flexible)
+        except admission.Overloaded as e:
+            raise _surcharge(e)
+        finally:
+            query_budgets.settle(cle_quota, estimation, num_requetes)
+        resultats = [TripResponse(**trip) for trip in trips]
+        request_trace.annotate(queries=num_requetes, estimation=estimation)
+
+        # Même enregistrement des prix qu'un scan classique (seulement si l'API a été interrogée)
+        if trips and num_requetes > 0:
             try:
-                supabase_service = get_supabase_service_client()
-                if supabase_service:
-                    expires_at = (datetime.now().timestamp() + 3600) * 1000  # +1h en millisecondes
-                    expires_at_iso = datetime.fromtimestamp(expires_at / 1000).isoformat()
-                    
-                    cache_data = {
-                        "cache_key": cache_key,
-                        "departure_airport": request.aeroport_depart or "BVA",
-                        "budget_max": request.budget_max or 200,
-                        "dates_depart": [d.model_dump() for d in request.dates_depart],
-                        "dates_retour": [d.model_dump() for d in request.dates_retour],
-                        "results": [r.model_dump() for r in resultats],
-                        "expires_at": expires_at_iso,
-                        "hit_count": 0
-                    }
-                    
-                    supabase_service.table("search_results_cache")\
-                        .upsert(cache_data, on_conflict="cache_key")\
-                        .execute()
-                    
-                    print(f"✅ Résultats mis en cache (clé: {cache_key[:8]}...)")
+                record_price_history(trips)
+                deals.deal_model.observe_records(build_price_records(trips))
             except Exception as e:
-                print(f"⚠️ Erreur mise en cache: {e}")
-        
+                print(f"⚠️ Erreur enregistrement price_history: {e}")
+
         return ScanResponse(
             resultats=resultats,
             nombre_requetes=num_requetes,
-            message=f"Scan terminé: {len(resultats)} voyage(s) trouvé(s)"
+            message=f"Scan flexible terminé: {len(resultats)} voyage(s) trouvé(s)"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/reverse", response_model=ReverseSearchResponse)
+@optional_auth
+async def reverse_search_destination(request: ReverseSearchRequest, http_request: Request = None):
+    """
+    Recherche inversée : prix le moins cher par jour pour rejoindre une destination
+    depuis plusieurs origines candidates (seules ces routes sont interrogées)
+    """
+    try:
+        date_debut = date.fromisoformat(request.date_debut)
+        date_fin = date.fromisoformat(request.date_fin)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates invalides (format YYYY-MM-DD)")
+    if date_fin < date_debut or (date_fin - date_debut).days > flex_search.MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La plage de dates doit couvrir entre 0 et {flex_search.MAX_RANGE_DAYS} jours"
+        )
+
+    destination = request.destination.strip().upper()
+    origines = [o for o in expand_origins(request.aeroports_depart or lifecycle.get_popular_origins())
+                if o != destination]
+    if not origines:
+        raise HTTPException(status_code=400, detail="Aucun aéroport de départ candidat")
+    if len(origines) > reverse_search.MAX_ORIGINS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(origines)} aéroports de départ candidats, maximum {reverse_search.MAX_ORIGINS}"
+        )
+    estimation = reverse_search.estimate_queries(len(origines), date_debut, date_fin, bool(request.inclure_retour))
+
+    def admitted_reverse():
+        # Balayage synchrone (appels réseau) : hors de la boucle d'événements, dans un créneau de scan
+        with scan_admission.slot(admission.INTERACTIVE, admission.INTERACTIVE_QUEUE_TARGET):
+            return reverse_search.search_destination(
+                destination, origines, date_debut, date_fin, include_return=bool(request.inclure_retour)
+            )
+
+    try:
+        cle_quota = _cle_quota(http_request)
+        _reserver_requetes(cle_quota, estimation)
+        num_requetes = 0
+        try:
+            grilles, num_requetes = await asyncio.to_thread(admitted_reverse)
+        except admission.Overloaded as e:
+            raise _surcharge(e)
+        finally:
+            query_budgets.settle(cle_quota, estimation, num_requetes)
+        request_trace.annotate(queries=num_requetes, estimation=estimation)
+        jours = [day for day in grilles["aller"] if day["meilleur_prix"] is not None]
+        meilleur = min(jours, key=lambda day: day["meilleur_prix"]) if jours else None
+        return ReverseSearchResponse(
+            destination=destination,
+            aeroports_depart=origines,
+            aller=grilles["aller"],
+            retour=grilles["retour"],
+            meilleur_aller=meilleur,
+            nombre_requetes=num_requetes,
+            message=f"Recherche terminée: {len(jours)} jour(s) avec vol vers {destination}"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== JOBS DE SCAN ====================
+
+def run_scan_job(request_dict: Dict, context: scan_jobs.JobContext):
+    """Exécute un job de scan : cache d'abord, puis scan avec progression et annulation"""
+    request = ScanRequest(**request_dict)
+    cache_key = generate_cache_key(request)
+    cached = scan_cache.lookup(cache_key, request.model_dump())
+    if cached and not cached["stale"]:
+        return cached["results"], 0
+
+    scan_info = {}
+    # Les jobs passent après les scans interactifs et les auto-vérifications
+    with scan_admission.slot(admission.BACKGROUND):
+        resultats, num_requetes = scanner_vols_api(
+            aeroport_depart=request.aeroport_depart or "BVA",
+            dates_depart=request.dates_depart,
+            dates_retour=request.dates_retour,
+            budget_max=request.budget_max or 200,
+            limite_allers=request.limite_allers or 50,
+            destinations_exclues=request.destinations_exclues or [],
+            destinations_incluses=request.destinations_incluses,
+            record_prices=True,
+            scan_info=scan_info,
+            aeroports_depart=request.aeroports_depart,
+            meme_aeroport_retour=bool(request.meme_aeroport_retour),
+            on_progress=lambda done, total, partial: context.progress(done, total, [r.model_dump() for r in partial]),
+            should_cancel=context.cancelled
+        )
+    results = [r.model_dump() for r in resultats]
+    segments_ignores = scan_info.get("segments_ignores", [])
+    if segments_ignores:
+        # Résultats partiels : exposés dans la progression du job, pas de mise en cache
+        context.skipped(segments_ignores)
+    # Un scan annulé est incomplet : pas de mise en cache
+    elif not context.cancelled():
+        scan_cache.store(cache_key, request.model_dump(), results, scan_info.get("candidates"))
+    return results, num_requetes
+
+scan_job_queue = scan_jobs.ScanJobQueue(run_scan_job)
+
+def _job_response(job: Dict) -> ScanJobResponse:
+    return ScanJobResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        position=scan_job_queue.position(job["job_id"]) if job["status"] == scan_jobs.QUEUED else None,
+        progress=job.get("progress"),
+        resultats=job.get("results"),
+        segments_ignores=(job.get("progress") or {}).get("segments_ignores", []),
+        nombre_requetes=job.get("num_queries") or 0,
+        error=job.get("error"),
+        submitted_at=job["submitted_at"],
+        started_at=job.get("started_at"),
+        finished_at=job.get("finished_at")
+    )
+
+@app.post("/api/jobs/scan", response_model=ScanJobResponse)
+@optional_auth
+async def submit_scan_job(request: ScanRequest, http_request: Request = None):
+    """Soumet un scan en arrière-plan : retourne immédiatement l'identifiant du job"""
+    # Le coût estimé est prélevé à la soumission (pas de correction après exécution)
+    cached = await asyncio.to_thread(scan_cache.peek, generate_cache_key(request), request.model_dump())
+    request_trace.annotate(cache=cached["tier"] if cached else "miss")
+    cle_quota = _cle_quota(http_request)
+    if not cached:
+        _reserver_requetes(cle_quota, estimer_cout_scan(request)["total"])
+    # Le job n'est lisible et annulable que par le client qui l'a soumis (utilisateur, sinon adresse)
+    return _job_response(scan_job_queue.submit(request.model_dump(), owner=cle_quota))
+
+@app.get("/api/jobs/stats")
+def scan_jobs_stats():
+    """Profondeur de file, temps d'attente et d'exécution des jobs de scan"""
+    return scan_job_queue.stats()
+
+def _job_du_client(job_id: str, cle_quota: str) -> Dict[str, Any]:
+    """Job soumis par ce client ; 404 s'il n'existe pas ou appartient à un autre client"""
+    job = scan_job_queue.get(job_id)
+    if job is None or job.get("owner") != cle_quota:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job
+
+@app.get("/api/jobs/{job_id}", response_model=ScanJobResponse)
+def get_scan_job(job_id: str, http_request: Request):
+    """État d'un job (résultats partiels pendant l'exécution)"""
+    return _job_response(_job_du_client(job_id, _cle_quota(http_request)))
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_scan_job(job_id: str, http_request: Request):
+    """Abonnement aux changements d'état d'un job (Server-Sent Events) jusqu'à sa fin"""
+    await resolve_user_id(http_request)
+    _job_du_client(job_id, _cle_quota(http_request))
+
+    async def events():
+        last_version = None
+        while True:
+            job = scan_job_queue.get(job_id)
+            if job is None:
+                return
+            version = (job.get("version"), job["status"])
+            if version != last_version:
+                last_version = version
+                yield f"data: {_job_response(job).model_dump_json()}\n\n"
+            if job["status"] in scan_jobs.FINISHED_STATUSES:
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.delete("/api/jobs/{job_id}", response_model=ScanJobResponse)
+def cancel_scan_job(job_id: str, http_request: Request):
+    """Annule un job en file ou en cours (les résultats partiels sont conservés)"""
+    _job_du_client(job_id, _cle_quota(http_request))
+    job = scan_job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return _job_response(job)
+
 @app.get("/api/health")
 def health_check():
     return {"status": "ok", "service": "ryanair-scanner"}
 
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Statistiques des caches : résultats de scan, tarifs par segment, stockage local, connexions amont"""
+    local_store = get_fare_store()
+    return {
+        "scan_results": scan_cache.stats(),
+        "fares": fare_cache.stats(),
+        "local_store": local_store.stats() if local_store else None,
+        "auth_tokens": auth_stats(),
+        "upstream": ryanair_client.stats(),
+        "inspire_matrix": inspire.stats(),
+        "query_budgets": query_budgets.stats(),
+        "listings": listings.stats(),
+        "favorites_revalidation": favorites_revalidation.stats(),
+    }
+
+@app.get("/api/lifecycle")
+def lifecycle_info():
+    """État du warm-up, modules différés, latences à froid / à chaud par endpoint, trace des requêtes et snapshot"""
+    return {**lifecycle.lifecycle_status(LAZY_MODULES), "trace": request_trace.recorder.stats(),
+            "snapshot": state_snapshot.snapshot.stats()}
+
+INSPIRE_PRESETS = ('weekend', 'next-weekend', 'next-week')
+
+def _presets_decouverte() -> Dict[str, Tuple[List[Dict], List[Dict]]]:
+    presets = {}
+    for preset in INSPIRE_PRESETS:
+        dates_depart, dates_retour = get_dates_from_preset(preset)
+        presets[preset] = ([d.model_dump() for d in dates_depart], [d.model_dump() for d in dates_retour])
+    return presets
+
+def _construire_matrice_decouverte(origine: str, dates_depart: List[Dict], dates_retour: List[Dict]):
+    """Scan large d'une origine pour la matrice : toutes les destinations, budget maximal"""
+    scan_request = ScanRequest(
+        aeroport_depart=origine,
+        dates_depart=[DateAvecHoraire(**d) for d in dates_depart],
+        dates_retour=[DateAvecHoraire(**d) for d in dates_retour],
+        budget_max=inspire_matrix.MAX_BUDGET,
+        limite_allers=inspire_matrix.MAX_DESTINATIONS
+    )
+    estimation = estimer_cout_scan(scan_request)["total"]
+    _reserver_tache_de_fond(estimation)
+    scan_info = {}
+    num_requetes = 0
+    try:
+        with scan_admission.slot(admission.BACKGROUND):
+            resultats, num_requetes = scanner_vols_api(
+                aeroport_depart=origine,
+                dates_depart=scan_request.dates_depart,
+                dates_retour=scan_request.dates_retour,
+                budget_max=inspire_matrix.MAX_BUDGET,
+                limite_allers=inspire_matrix.MAX_DESTINATIONS,
+                record_prices=True,
+                scan_info=scan_info
+            )
+    finally:
+        query_budgets.settle(None, estimation, num_requetes)
+    return [r.model_dump() for r in resultats], scan_info.get("allers", {}), num_requetes
+
+# Matrice des prix précalculée pour les origines chaudes (rafraîchie en arrière-plan)
+inspire = inspire_matrix.InspireMatrix(_construire_matrice_decouverte, _presets_decouverte)
+
 @app.post("/api/inspire", response_model=InspireResponse)
 @optional_auth
 async def inspire_trip(request: InspireRequest, http_request: Request = None):
@@ -601,17 +1549,68 @@ async def inspire_trip(request: InspireRequest, http_request: Request = None):
         if not dates_depart or not dates_retour:
             raise HTTPException(status_code=400, detail="Impossible de générer les dates pour ce preset")
         
+        # Origine et dates couvertes par la matrice précalculée : réponse sans appel à l'API
+        trips = inspire.lookup(
+            request.departure,
+            [d.model_dump() for d in dates_depart],
+            [d.model_dump() for d in dates_retour],
+            request.budget,
+            request.destinations_exclues,
+            request.limite_allers or 30
+        )
+        if trips is not None:
+            request_trace.annotate(cache="inspire_matrix", queries=0)
+            enriched_results = enrich_trip_results([TripResponse(**t) for t in trips], request.departure)
+            enriched_results.sort(key=lambda t: t.prix_total)
+            return InspireResponse(
+                resultats=enriched_results,
+                nombre_requetes=0,
+                message=f"{len(enriched_results)} destination(s) trouvée(s) pour {request.budget}€ (précalculé)"
+            )
+        
         # Appeler scanner_vols_api existant avec les paramètres avancés
-        resultats, num_requetes = scanner_vols_api(
+        scan_info = {}
+
+        def run_scan(cache_only: bool = False):
+            return scanner_vols_api(
+                aeroport_depart=request.departure,
+                dates_depart=dates_depart,
+                dates_retour=dates_retour,
+                budget_max=request.budget,
+                limite_allers=request.limite_allers or 30,  # Utiliser la limite fournie ou 30 par défaut
+                destinations_exclues=request.destinations_exclues or [],
+                destinations_incluses=None,
+                record_prices=True,
+                cache_only=cache_only,
+                deadline_seconds=SCAN_DEADLINE_SECONDS,
+                scan_info=scan_info
+            )
+
+        def admitted_scan():
+            try:
+                with scan_admission.slot(admission.INTERACTIVE, admission.INTERACTIVE_QUEUE_TARGET):
+                    return run_scan(), False
+            except admission.Overloaded:
+                scan_admission.record_degraded(admission.INTERACTIVE)
+                return run_scan(cache_only=True), True
+
+        estimation = estimer_cout_scan(ScanRequest(
             aeroport_depart=request.departure,
             dates_depart=dates_depart,
             dates_retour=dates_retour,
             budget_max=request.budget,
-            limite_allers=request.limite_allers or 30,  # Utiliser la limite fournie ou 30 par défaut
-            destinations_exclues=request.destinations_exclues or [],
-            destinations_incluses=None,
-            record_prices=True
-        )
+            limite_allers=request.limite_allers or 30,
+            destinations_exclues=request.destinations_exclues or []
+        ))["total"]
+        cle_quota = _cle_quota(http_request)
+        _reserver_requetes(cle_quota, estimation)
+        num_requetes = 0
+        try:
+            (resultats, num_requetes), degrade = await asyncio.to_thread(admitted_scan)
+        finally:
+            query_budgets.settle(cle_quota, estimation, num_requetes)
+        request_trace.annotate(cache="miss", queries=num_requetes, estimation=estimation, degraded=degrade,
+                               segments_ignores=len(scan_info.get("segments_ignores", [])))
         
         # Enrichir les résultats
         enriched_results = enrich_trip_results(resultats, request.departure)
@@ -619,11 +1618,15 @@ async def inspire_trip(request: InspireRequest, http_request: Request = None):
         # Trier par prix (meilleurs prix en premier)
         enriched_results.sort(key=lambda t: t.prix_total)
         
+        message = f"{len(enriched_results)} destination(s) trouvée(s) pour {request.budget}€"
         return InspireResponse(
             resultats=enriched_results,
             nombre_requetes=num_requetes,
-            message=f"{len(enriched_results)} destination(s) trouvée(s) pour {request.budget}€"
+            message=message + (" (service surchargé, cache uniquement)" if degrade else ""),
+            segments_ignores=scan_info.get("segments_ignores", [])
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -631,70 +1634,11 @@ async def inspire_trip(request: InspireRequest, http_request: Request = None):
 def get_airports(query: Optional[str] = None):
     """Récupère la liste des aéroports avec code, ville et pays, optionnellement filtrée par recherche"""
     try:
-        import csv
-        from collections import defaultdict
-        
-        # Mapping des codes pays ISO vers noms de pays (les plus courants)
-        # Pour une solution complète, on pourrait utiliser pycountry
-        country_names = {
-            'FR': 'France', 'GB': 'Royaume-Uni', 'ES': 'Espagne', 'IT': 'Italie',
-            'DE': 'Allemagne', 'PT': 'Portugal', 'GR': 'Grèce', 'IE': 'Irlande',
-            'BE': 'Belgique', 'NL': 'Pays-Bas', 'CH': 'Suisse', 'AT': 'Autriche',
-            'PL': 'Pologne', 'CZ': 'République tchèque', 'HU': 'Hongrie', 'RO': 'Roumanie',
-            'BG': 'Bulgarie', 'HR': 'Croatie', 'SI': 'Slovénie', 'SK': 'Slovaquie',
-            'DK': 'Danemark', 'SE': 'Suède', 'NO': 'Norvège', 'FI': 'Finlande',
-            'US': 'États-Unis', 'CA': 'Canada', 'MX': 'Mexique', 'BR': 'Brésil',
-            'AR': 'Argentine', 'CL': 'Chili', 'CO': 'Colombie', 'PE': 'Pérou',
-            'AU': 'Australie', 'NZ': 'Nouvelle-Zélande', 'JP': 'Japon', 'CN': 'Chine',
-            'IN': 'Inde', 'TH': 'Thaïlande', 'VN': 'Vietnam', 'PH': 'Philippines',
-            'ID': 'Indonésie', 'MY': 'Malaisie', 'SG': 'Singapour', 'AE': 'Émirats arabes unis',
-            'TR': 'Turquie', 'EG': 'Égypte', 'MA': 'Maroc', 'ZA': 'Afrique du Sud',
-            'IL': 'Israël', 'JO': 'Jordanie', 'LB': 'Liban', 'SA': 'Arabie saoudite',
-        }
-        
-        airports = []
-        airports_file = os.path.join(os.path.dirname(__file__), '..', 'ryanair-py', 'ryanair', 'airports.csv')
-        
-        if not os.path.exists(airports_file):
-            raise HTTPException(status_code=500, detail="Fichier airports.csv introuvable")
-        
-        with open(airports_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                iata_code = row.get('iata_code', '').strip()
-                municipality = row.get('municipality', '').strip()
-                iso_country = row.get('iso_country', '').strip()
-                airport_name = row.get('name', '').strip()
-                
-                # Ne garder que les aéroports avec un code IATA valide
-                if not iata_code or len(iata_code) != 3:
-                    continue
-                
-                # Obtenir le nom du pays
-                country = country_names.get(iso_country, iso_country)
-                
-                airport_data = {
-                    'code': iata_code,
-                    'name': airport_name or 'N/A',
-                    'city': municipality or 'N/A',
-                    'country': country
-                }
-                
-                # Filtrer par recherche si fournie
-                if query:
-                    query_lower = query.lower()
-                    if (query_lower in iata_code.lower() or 
-                        query_lower in airport_name.lower() or
-                        query_lower in municipality.lower() or 
-                        query_lower in country.lower()):
-                        airports.append(airport_data)
-                else:
-                    airports.append(airport_data)
-        
-        # Trier par code IATA
-        airports.sort(key=lambda x: x['code'])
-        
+        # L'index est construit une seule fois (au warm-up ou au premier appel)
+        airports = search_airports(query)
         return {"airports": airports, "count": len(airports)}
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Fichier airports.csv introuvable")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -702,62 +1646,14 @@ def get_airports(query: Optional[str] = None):
 def get_destinations(airport: str = "BVA"):
     """Récupère toutes les destinations disponibles depuis un aéroport, groupées par pays"""
     try:
-        from datetime import timedelta
-        from collections import defaultdict
-        api = Ryanair(currency="EUR")
-        
-        # Chercher sur plusieurs dates pour obtenir TOUTES les destinations disponibles
-        # Certaines destinations peuvent ne pas avoir de vols tous les jours
-        date_debut = date.today() + timedelta(days=30)
-        date_fin = date_debut + timedelta(days=60)  # Chercher sur 60 jours
-        
-        print(f"🔍 Recherche des destinations depuis {airport} du {date_debut} au {date_fin}...")
-        
-        # Récupérer tous les vols disponibles sur la plage de dates
-        vols = api.get_cheapest_flights(
-            airport=airport,
-            date_from=date_debut,
-            date_to=date_fin,
-            max_price=1000  # Prix élevé pour ne pas filtrer
-        )
-        
-        print(f"  ✓ {len(vols)} vol(s) trouvé(s)")
-        
-        # Grouper par pays et dédoublonner les destinations (même destination peut apparaître plusieurs fois)
-        destinations_par_pays = defaultdict(dict)  # Utiliser un dict pour dédoublonner par code
-        
-        for vol in vols:
-            dest_code = vol.destination
-            dest_full = vol.destinationFull
-            
-            # Extraire le pays depuis destinationFull (format: "City, Country")
-            if ', ' in dest_full:
-                country = dest_full.split(', ')[-1]
-            else:
-                country = "Autre"
-            
-            # Garder seulement la première occurrence de chaque destination
-            if dest_code not in destinations_par_pays[country]:
-                destinations_par_pays[country][dest_code] = {
-                    'code': dest_code,
-                    'nom': dest_full.split(',')[0].strip(),
-                    'pays': country,
-                    'destinationFull': dest_full
-                }
-        
-        # Convertir les dict en listes et trier
-        result = {}
-        for pays in sorted(destinations_par_pays.keys()):
-            result[pays] = sorted(destinations_par_pays[pays].values(), key=lambda x: x['nom'])
-        
-        total_destinations = sum(len(dests) for dests in result.values())
-        print(f"  ✓ {total_destinations} destination(s) unique(s) trouvée(s) réparties sur {len(result)} pays")
-        
+        # Graphe des destinations mis en cache (voir get_destinations.py)
+        result = load_destinations_by_country(airport)
         return {"destinations": result, "aeroport": airport}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/auto-check")
+@optional_auth
 async def auto_check_flights(request: Request):
     """Vérifie automatiquement les vols et identifie les nouveaux résultats"""
     try:
@@ -774,19 +1670,55 @@ async def auto_check_flights(request: Request):
             budget_max=body.get("budget_max", 200),
             limite_allers=body.get("limite_allers", 50),
             destinations_exclues=body.get("destinations_exclues", []),
-            destinations_incluses=body.get("destinations_incluses")
+            destinations_incluses=body.get("destinations_incluses"),
+            aeroports_depart=body.get("aeroports_depart"),
+            meme_aeroport_retour=body.get("meme_aeroport_retour", False)
         )
         
-        # Effectuer la recherche
-        resultats, num_requetes = scanner_vols_api(
-            aeroport_depart=scan_request.aeroport_depart or "BVA",
-            dates_depart=scan_request.dates_depart,
-            dates_retour=scan_request.dates_retour,
-            budget_max=scan_request.budget_max or 200,
-            limite_allers=scan_request.limite_allers or 50,
-            destinations_exclues=scan_request.destinations_exclues or [],
-            destinations_incluses=scan_request.destinations_incluses
-        )
+        # Intervalle adaptatif : une recherche stable n'est pas revérifiée à chaque passage du client
+        search_request = scan_request.model_dump()
+        interval_seconds = body.get("interval_seconds") or 300
+        interval_max_seconds = body.get("interval_max_seconds")
+        if not body.get("force"):
+            pending = await asyncio.to_thread(auto_checks.due, search_id, search_request,
+                                              interval_seconds, interval_max_seconds)
+            if pending is not None:
+                return AutoCheckResponse(
+                    search_id=search_id,
+                    current_results=[TripResponse(**r) for r in pending["results"]],
+                    new_results=[],
+                    nombre_requetes=0,
+                    message=f"Vérification pas encore due (prochaine dans {pending['next_check_seconds']}s)",
+                    next_check_seconds=pending["next_check_seconds"],
+                    skipped=True
+                )
+        
+        # Effectuer la recherche (coût estimé réservé dans les budgets, corrigé ensuite)
+        estimation = estimer_cout_scan(scan_request)["total"]
+        cle_quota = _cle_quota(request)
+        _reserver_requetes(cle_quota, estimation)
+        def admitted_check():
+            with scan_admission.slot(admission.AUTO_CHECK, admission.AUTO_CHECK_QUEUE_TARGET):
+                return scanner_vols_api(
+                    aeroport_depart=scan_request.aeroport_depart or "BVA",
+                    dates_depart=scan_request.dates_depart,
+                    dates_retour=scan_request.dates_retour,
+                    budget_max=scan_request.budget_max or 200,
+                    limite_allers=scan_request.limite_allers or 50,
+                    destinations_exclues=scan_request.destinations_exclues or [],
+                    destinations_incluses=scan_request.destinations_incluses,
+                    aeroports_depart=scan_request.aeroports_depart,
+                    meme_aeroport_retour=bool(scan_request.meme_aeroport_retour)
+                )
+
+        num_requetes = 0
+        try:
+            # Surcharge : la vérification est refusée (503), le client réessaiera au prochain passage
+            resultats, num_requetes = await asyncio.to_thread(admitted_check)
+        except admission.Overloaded as e:
+            raise _surcharge(e)
+        finally:
+            query_budgets.settle(cle_quota, estimation, num_requetes)
         
         # Convertir les résultats précédents en TripResponse si nécessaire
         previous_results = []
@@ -824,13 +1756,182 @@ async def auto_check_flights(request: Request):
             # Si pas de résultats précédents, tous les résultats sont nouveaux
             nouveaux_resultats = resultats
         
+        # Alertes : nouveaux résultats que le modèle classe comme bonnes affaires
+        deal_alerts = [
+            trip for trip in enrich_trip_results(nouveaux_resultats, scan_request.aeroport_depart or "BVA")
+            if trip.deal_percentile is not None and trip.is_good_deal
+        ]
+        
+        next_check_seconds = await asyncio.to_thread(
+            auto_checks.record, search_id, search_request, interval_seconds, interval_max_seconds,
+            [trip.model_dump() for trip in resultats], num_requetes
+        )
+        
         return AutoCheckResponse(
             search_id=search_id,
             current_results=resultats,
             new_results=nouveaux_resultats,
+            deal_alerts=deal_alerts,
             nombre_requetes=num_requetes,
-            message=f"{len(nouveaux_resultats)} nouveau(x) résultat(s) trouvé(s) sur {len(resultats)} total"
+            message=f"{len(nouveaux_resultats)} nouveau(x) résultat(s) trouvé(s) sur {len(resultats)} total",
+            next_check_seconds=next_check_seconds,
+            estimation_requetes=estimation
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admission/stats")
+def admission_stats():
+    """Créneaux de scan occupés, file d'attente et requêtes refusées ou dégradées par classe"""
+    return scan_admission.stats()
+
+@app.get("/api/auto-check/stats")
+def auto_check_stats():
+    """Intervalles effectifs par recherche, vérifications évitées et requêtes économisées"""
+    return auto_checks.stats()
+
+# ==================== DIAGNOSTICS (ADMIN) ====================
+# Désactivés par défaut (FLIGHTWATCHER_DIAGNOSTICS=1) ; en-tête X-Admin-Token ou utilisateur admin
+
+for _nom, _structure in {
+    "fare_cache.l1": lambda: fare_cache._l1_fares,
+    "fare_cache.latencies": lambda: fare_cache._latencies,
+    "upstream.latencies": lambda: ryanair_client.get_transport()._latencies,
+    "destinations": lambda: destinations_graph._destinations_cache,
+    "route_stats": lambda: route_stats._avg_price_cache,
+    "airport_index": lambda: airport_index._airports,
+    "query_budgets.users": lambda: query_budgets._users,
+    "listings": lambda: listings._pages,
+    "auto_checks": lambda: auto_checks._checks,
+    "admission.waiting": lambda: scan_admission._waiting,
+    "scan_jobs.queue": lambda: scan_job_queue._queue,
+    "scan_jobs.jobs": lambda: scan_job_queue._jobs,
+    "inspire_matrix": lambda: inspire._entries,
+    "deal_model.routes": lambda: deals.deal_model.routes if deals.is_loaded else None,
+    "latency_tracker": lambda: lifecycle.latency_tracker._routes,
+    "request_trace.queue": lambda: request_trace.recorder._queue,
+}.items():
+    diagnostics.register_structure(_nom, _structure)
+
+def _exiger_admin(http_request: Request) -> None:
+    if not diagnostics.DIAGNOSTICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not diagnostics.is_admin(http_request.headers.get("X-Admin-Token"), get_user_id_from_token(http_request)):
+        raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+
+@app.post("/api/admin/diagnostics/profile")
+def start_profile(http_request: Request, seconds: float = 30, interval_ms: float = diagnostics.DEFAULT_INTERVAL_MS):
+    """Démarre le profileur CPU par échantillonnage pour seconds secondes (max 300)"""
+    _exiger_admin(http_request)
+    try:
+        return diagnostics.profiler.start(seconds, interval_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.delete("/api/admin/diagnostics/profile")
+def stop_profile(http_request: Request):
+    """Arrête le profilage en cours (le résultat reste disponible)"""
+    _exiger_admin(http_request)
+    return diagnostics.profiler.stop()
+
+@app.get("/api/admin/diagnostics/profile")
+def get_profile(http_request: Request, format: str = "json", focus: Optional[str] = None, limit: int = 30):
+    """
+    Résultat du dernier profilage (lisible pendant l'échantillonnage).
+    format=folded : piles pour flamegraph.pl / speedscope ; focus : ne garder que les piles
+    qui contiennent cette chaîne (ex: scanner_vols_api)
+    """
+    _exiger_admin(http_request)
+    if format == "folded":
+        return Response(content=diagnostics.profiler.folded(focus), media_type="text/plain; charset=utf-8")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format doit valoir json ou folded")
+    return diagnostics.profiler.summary(focus, limit)
+
+@app.post("/api/admin/diagnostics/memory")
+def start_memory_tracing(http_request: Request, frames: int = diagnostics.DEFAULT_TRACE_FRAMES):
+    """Démarre tracemalloc (frames : profondeur des piles enregistrées) et prend la référence"""
+    _exiger_admin(http_request)
+    return diagnostics.memory.start(frames)
+
+@app.delete("/api/admin/diagnostics/memory")
+def stop_memory_tracing(http_request: Request):
+    _exiger_admin(http_request)
+    return diagnostics.memory.stop()
+
+@app.post("/api/admin/diagnostics/memory/baseline")
+def reset_memory_baseline(http_request: Request):
+    """L'état courant devient la référence des différences"""
+    _exiger_admin(http_request)
+    try:
+        return diagnostics.memory.reset_baseline()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/diagnostics/memory")
+def get_memory_snapshot(http_request: Request, limit: int = 30):
+    """Allocations par module et croissance depuis la référence (tracemalloc démarré)"""
+    _exiger_admin(http_request)
+    try:
+        return diagnostics.memory.snapshot(limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/diagnostics/structures")
+def get_structure_sizes(http_request: Request):
+    """Entrées et taille approximative des caches et files du processus"""
+    _exiger_admin(http_request)
+    return diagnostics.structure_sizes()
+
+# ==================== ENDPOINTS ANALYTICS ====================
+# Requêtes sur l'export colonnaire de price_history (python price_analytics.py export)
+
+@app.get("/api/analytics/routes")
+def analytics_routes():
+    """Liste les routes exportées et leurs partitions mensuelles"""
+    return {"routes": price_analytics.list_routes()}
+
+@app.get("/api/analytics/{departure}/{destination}/summary")
+def analytics_route_summary(departure: str, destination: str, months: Optional[str] = None):
+    """Statistiques de prix d'une route (months: 'YYYY-MM,YYYY-MM' optionnel)"""
+    try:
+        return price_analytics.route_summary(departure.upper(), destination.upper(), months.split(",") if months else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analytics/{departure}/{destination}/weekdays")
+def analytics_cheapest_weekday(departure: str, destination: str, months: Optional[str] = None):
+    """Jour de semaine le moins cher pour une route"""
+    try:
+        return price_analytics.cheapest_weekday(departure.upper(), destination.upper(), months.split(",") if months else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analytics/{departure}/{destination}/lead-time")
+def analytics_lead_time(departure: str, destination: str, bucket_days: int = 7, max_days: int = 180):
+    """Courbe prix / anticipation d'achat pour une route"""
+    if bucket_days < 1:
+        raise HTTPException(status_code=400, detail="bucket_days doit être >= 1")
+    try:
+        return price_analytics.lead_time_curve(departure.upper(), destination.upper(), bucket_days, max_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analytics/{departure}/{destination}/daily")
+def analytics_daily_trend(departure: str, destination: str, days: int = 365):
+    """Tendance quotidienne (min, max, moyenne) depuis price_history et ses agrégats"""
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days doit être >= 1")
+    try:
+        return {"days": get_daily_price_trend(departure.upper(), destination.upper(), days)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -857,6 +1958,8 @@ class SavedFavoriteResponse(BaseModel):
     search_request: ScanRequest
     created_at: str
     is_still_valid: Optional[bool] = None
+    current_price: Optional[float] = None  # Prix du voyage à la dernière revalidation
+    last_checked: Optional[str] = None
 
 @app.get("/api/config")
 def get_config():
@@ -933,6 +2036,7 @@ async def save_search_supabase(search: SavedSearchRequest, request: Request):
             raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde")
         
         saved = result.data[0]
+        listings.invalidate(user_listings.SEARCHES, user_id)
         return SavedSearchResponse(
             id=saved["id"],
             name=saved["name"],
@@ -943,55 +2047,112 @@ async def save_search_supabase(search: SavedSearchRequest, request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
-@app.get("/api/supabase/searches", response_model=List[SavedSearchResponse])
-@optional_auth
-async def get_searches_supabase(request: Request):
-    """Récupère toutes les recherches sauvegardées depuis Supabase"""
+# Colonnes lues pour les listes (sans last_check_results ni autres colonnes volumineuses)
+SEARCH_LIST_COLUMNS = ("id, name, departure_airport, dates_depart, dates_retour, budget_max, limite_allers, "
+                       "destinations_exclues, destinations_incluses, created_at, last_used")
+FAVORITE_LIST_COLUMNS = ("id, destination_code, total_price, outbound_flight, return_flight, search_request, "
+                         "created_at, is_available, last_availability_check")
+
+def _recherche_liste(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne saved_searches -> SavedSearchResponse (dict, sans revalidation pydantic)"""
+    return {
+        "id": item["id"],
+        "name": item["name"],
+        "request": {
+            "aeroport_depart": item["departure_airport"],
+            "dates_depart": item["dates_depart"],
+            "dates_retour": item["dates_retour"],
+            "budget_max": item.get("budget_max", 200),
+            "limite_allers": item.get("limite_allers", 50),
+            "destinations_exclues": item.get("destinations_exclues") or [],
+            "destinations_incluses": item.get("destinations_incluses"),
+            "aeroports_depart": None,
+            "meme_aeroport_retour": False,
+        },
+        "created_at": item["created_at"],
+        "last_used": item.get("last_used"),
+    }
+
+def _favori_liste(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne favorites -> SavedFavoriteResponse (dict, sans revalidation pydantic)"""
+    return {
+        "id": item["id"],
+        "trip": {
+            "aller": item["outbound_flight"],
+            "retour": item["return_flight"],
+            "prix_total": item["total_price"],
+            "destination_code": item["destination_code"],
+        },
+        "search_request": item["search_request"],
+        "created_at": item["created_at"],
+        "is_still_valid": item.get("is_available"),
+        "current_price": float(item["current_price"]) if item.get("current_price") is not None else None,
+        "last_checked": item.get("last_availability_check"),
+    }
+
+def _page_utilisateur(request: Request, kind: str, table: str, columns: str,
+                      to_item: Callable[[Dict[str, Any]], Dict[str, Any]],
+                      limit: int, cursor: Optional[str]) -> Response:
+    """
+    Page (plus récents d'abord) d'une liste de l'utilisateur : pagination par curseur,
+    pages en cache par utilisateur, ETag / If-None-Match. Curseur suivant : en-tête X-Next-Cursor.
+    """
     if not SUPABASE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Supabase n'est pas configuré")
-    
+
     user_id = get_user_id_from_token(request)
     if not user_id:
         raise HTTPException(status_code=401, detail="Authentification requise")
-    
-    try:
-        supabase = get_supabase_client()
-        result = supabase.table("saved_searches")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=False)\
-            .execute()
-        
-        # Inverser pour avoir les plus récents en premier
-        result.data.reverse()
-        
-        searches = []
-        for item in result.data:
-            # Reconstruire le ScanRequest depuis les données JSON
-            dates_depart = [DateAvecHoraire(**d) for d in item["dates_depart"]]
-            dates_retour = [DateAvecHoraire(**d) for d in item["dates_retour"]]
-            
-            request_obj = ScanRequest(
-                aeroport_depart=item["departure_airport"],
-                dates_depart=dates_depart,
-                dates_retour=dates_retour,
-                budget_max=item.get("budget_max", 200),
-                limite_allers=item.get("limite_allers", 50),
-                destinations_exclues=item.get("destinations_exclues", []),
-                destinations_incluses=item.get("destinations_incluses")
-            )
-            
-            searches.append(SavedSearchResponse(
-                id=item["id"],
-                name=item["name"],
-                request=request_obj,
-                created_at=item["created_at"],
-                last_used=item.get("last_used")
-            ))
-        
-        return searches
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
+    if not 1 <= limit <= user_listings.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit doit être entre 1 et {user_listings.MAX_PAGE_SIZE}")
+
+    page_key = (limit, cursor)
+    page = listings.get(kind, user_id, page_key)
+    if page is None:
+        try:
+            query = get_supabase_client().table(table)\
+                .select(columns)\
+                .eq("user_id", user_id)\
+                .order("created_at", desc=True)\
+                .order("id", desc=True)\
+                .limit(limit + 1)
+            if cursor:
+                created_at, row_id = user_listings.decode_cursor(cursor)
+                # Lignes de même created_at : départager par id
+                query = query.or_(
+                    f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})'
+                )
+            rows = query.execute().data or []
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
+
+        body = json.dumps([to_item(row) for row in rows[:limit]], ensure_ascii=False).encode("utf-8")
+        page = {
+            "body": body,
+            "etag": user_listings.page_etag(body),
+            "next_cursor": user_listings.encode_cursor(rows[limit - 1]) if len(rows) > limit else None,
+        }
+        listings.put(kind, user_id, page_key, page)
+
+    headers = {"ETag": page["etag"], "Cache-Control": "private, no-cache"}
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+    if user_listings.etag_matches(request.headers.get("if-none-match"), page["etag"]):
+        listings.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(content=page["body"], media_type="application/json", headers=headers)
+
+@app.get("/api/supabase/searches", response_model=List[SavedSearchResponse])
+@optional_auth
+async def get_searches_supabase(request: Request, limit: int = user_listings.DEFAULT_PAGE_SIZE,
+                                cursor: Optional[str] = None):
+    """Recherches sauvegardées, plus récentes d'abord (page suivante : ?cursor=<X-Next-Cursor>)"""
+    return await asyncio.to_thread(
+        _page_utilisateur, request, user_listings.SEARCHES, "saved_searches", SEARCH_LIST_COLUMNS,
+        _recherche_liste, limit, cursor
+    )
 
 @app.delete("/api/supabase/searches/{search_id}")
 @optional_auth
@@ -1011,6 +2172,7 @@ async def delete_search_supabase(search_id: str, request: Request):
             .eq("id", search_id)\
             .eq("user_id", user_id)\
             .execute()
+        listings.invalidate(user_listings.SEARCHES, user_id)
         return {"success": True, "message": "Recherche supprimée"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
@@ -1049,6 +2211,7 @@ async def save_favorite_supabase(favorite: SavedFavoriteRequest, request: Reques
             raise HTTPException(status_code=500, detail="Erreur lors de la sauvegarde")
         
         saved = result.data[0]
+        listings.invalidate(user_listings.FAVORITES, user_id)
         return SavedFavoriteResponse(
             id=saved["id"],
             trip=favorite.trip,
@@ -1061,47 +2224,14 @@ async def save_favorite_supabase(favorite: SavedFavoriteRequest, request: Reques
 
 @app.get("/api/supabase/favorites", response_model=List[SavedFavoriteResponse])
 @optional_auth
-async def get_favorites_supabase(request: Request):
-    """Récupère tous les favoris depuis Supabase"""
-    if not SUPABASE_AVAILABLE:
-        raise HTTPException(status_code=503, detail="Supabase n'est pas configuré")
-    
-    user_id = get_user_id_from_token(request)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentification requise")
-    
-    try:
-        supabase = get_supabase_client()
-        result = supabase.table("favorites")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=False)\
-            .execute()
-        
-        # Inverser pour avoir les plus récents en premier
-        result.data.reverse()
-        
-        favorites = []
-        for item in result.data:
-            trip = TripResponse(
-                aller=FlightResponse(**item["outbound_flight"]),
-                retour=FlightResponse(**item["return_flight"]),
-                prix_total=item["total_price"],
-                destination_code=item["destination_code"]
-            )
-            search_request = ScanRequest(**item["search_request"])
-            
-            favorites.append(SavedFavoriteResponse(
-                id=item["id"],
-                trip=trip,
-                search_request=search_request,
-                created_at=item["created_at"],
-                is_still_valid=item.get("is_available")
-            ))
-        
-        return favorites
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
+async def get_favorites_supabase(request: Request, limit: int = user_listings.DEFAULT_PAGE_SIZE,
+                                 cursor: Optional[str] = None):
+    """Favoris, plus récents d'abord (page suivante : ?cursor=<X-Next-Cursor>)"""
+    return await asyncio.to_thread(
+        _page_utilisateur, request, user_listings.FAVORITES, "favorites",
+        FAVORITE_LIST_COLUMNS + (", current_price" if _colonne_prix_favoris is True else ""),
+        _favori_liste, limit, cursor
+    )
 
 @app.delete("/api/supabase/favorites/{favorite_id}")
 @optional_auth
@@ -1121,10 +2251,81 @@ async def delete_favorite_supabase(favorite_id: str, request: Request):
             .eq("id", favorite_id)\
             .eq("user_id", user_id)\
             .execute()
+        listings.invalidate(user_listings.FAVORITES, user_id)
         return {"success": True, "message": "Favori supprimé"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
+# ==================== REVALIDATION DES FAVORIS ====================
+
+# Favoris lus / écrits par lots (revalidation en arrière-plan)
+FAVORITES_PAGE_SIZE = 1000
+# favorites.current_price (schéma v2 récent ou supabase_favorites_revalidation.sql) :
+# None tant que la base n'a pas été interrogée (ou erreur transitoire)
+_colonne_prix_favoris: Optional[bool] = None
+
+def _verifier_colonne_prix_favoris() -> Optional[bool]:
+    """Vérifie une fois que la colonne current_price (et donc la migration) est présente"""
+    global _colonne_prix_favoris
+    if _colonne_prix_favoris is not None:
+        return _colonne_prix_favoris
+    try:
+        get_supabase_service_client().table("favorites").select("current_price").limit(1).execute()
+        _colonne_prix_favoris = True
+    except Exception as e:
+        # 42703 : colonne inexistante (réponse définitive) ; autre erreur : nouvel essai plus tard
+        if getattr(e, "code", None) == "42703":
+            _colonne_prix_favoris = False
+            print("⚠️ favorites.current_price absente : exécuter supabase_favorites_revalidation.sql "
+                  "(revalidation des favoris désactivée)")
+        else:
+            print(f"⚠️ Vérification de favorites.current_price impossible: {e}")
+    return _colonne_prix_favoris
+
+def _charger_favoris_actifs() -> List[Dict[str, Any]]:
+    """Favoris non archivés dont l'aller n'est pas passé (tous utilisateurs, clé service_role)"""
+    supabase_service = get_supabase_service_client()
+    favoris: List[Dict[str, Any]] = []
+    dernier_id = None
+    while True:
+        query = supabase_service.table("favorites")\
+            .select("id, user_id, outbound_flight, return_flight")\
+            .eq("is_archived", False)\
+            .gte("outbound_date", date.today().isoformat())\
+            .order("id")\
+            .limit(FAVORITES_PAGE_SIZE)
+        if dernier_id:
+            query = query.gt("id", dernier_id)
+        rows = query.execute().data or []
+        favoris.extend(rows)
+        if len(rows) < FAVORITES_PAGE_SIZE:
+            return favoris
+        dernier_id = rows[-1]["id"]
+
+def _ecrire_favoris(updates: List[Dict[str, Any]]) -> None:
+    """Écriture groupée (update_favorites_availability, supabase_favorites_revalidation.sql)"""
+    supabase_service = get_supabase_service_client()
+    for i in range(0, len(updates), FAVORITES_PAGE_SIZE):
+        supabase_service.rpc("update_favorites_availability", {"p_updates": updates[i:i + FAVORITES_PAGE_SIZE]}).execute()
+
+def _favoris_modifies(user_ids: set) -> None:
+    for user_id in user_ids:
+        listings.invalidate(user_listings.FAVORITES, user_id)
+
+favorites_revalidation = favorite_revalidator.FavoriteRevalidator(
+    _charger_favoris_actifs, _ecrire_favoris, _favoris_modifies,
+    # Tâche de fond : requêtes prises dans le seau global
+    reserve_queries=lambda cout: query_budgets.reserve(None, cout)[0],
+    settle_queries=lambda estimation, reel: query_budgets.settle(None, estimation, reel)
+)
+
+def _revalider_favoris() -> Dict[str, Any]:
+    if not _verifier_colonne_prix_favoris():
+        raise RuntimeError("migration supabase_favorites_revalidation.sql non vérifiée, passe ignorée")
+    # Même file que les autres tâches de fond : ne prend pas les créneaux des scans interactifs
+    with scan_admission.slot(admission.BACKGROUND):
+        return favorites_revalidation.run()
+
 # ==================== ENDPOINTS AUTH ====================
 
 @app.get("/api/auth/me")
@@ -0,0 +1,492 @@
+"""
+Export colonnaire de price_history et moteur d'analytics local
+Les observations sont stockées en tableaux NumPy (un fichier .npy par colonne),
+partitionnés par route et par mois de vol, et relus en mémoire mappée (mmap).
+
+Usage :
+    python price_analytics.py export [--source local|supabase]
+    python price_analytics.py weekdays BVA BCN
+    python price_analytics.py lead-time BVA BCN
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_ANALYTICS_DIR = os.path.join(os.path.dirname(__file__), 'data', 'price_columns')
+MANIFEST_FILE = "manifest.json"
+# Colonnes d'une partition : jour du vol et jour d'observation en jours depuis 1970-01-01, prix
+COLUMNS = ("flight_day", "recorded_day", "price")
+_DTYPES = {"flight_day": np.int32, "recorded_day": np.int32, "price": np.float32}
+
+SUPABASE_PAGE_SIZE = 1000
+# Partitions gardées en mémoire mappée (les moins récemment lues sont fermées au-delà)
+MAX_MAPPED_PARTITIONS = int(os.getenv("FLIGHTWATCHER_ANALYTICS_MAX_PARTITIONS", "512"))
+WEEKDAYS = ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche")
+
+_EPOCH = date(1970, 1, 1)
+
+
+def get_analytics_dir() -> str:
+    return os.getenv("FLIGHTWATCHER_ANALYTICS_DIR", DEFAULT_ANALYTICS_DIR)
+
+
+_AIRPORT_CODE = re.compile(r"^[A-Z]{3}$")
+_MONTH = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def validate_route(departure: str, destination: str, months: Optional[List[str]] = None) -> None:
+    """Codes IATA et mois 'YYYY-MM' (ils forment des chemins de fichiers) ; ValueError sinon"""
+    for code in (departure, destination):
+        if not _AIRPORT_CODE.match(code or ""):
+            raise ValueError(f"Code aéroport invalide: {code!r}")
+    for month in months or []:
+        if not _MONTH.match(month):
+            raise ValueError(f"Mois invalide (YYYY-MM attendu): {month!r}")
+
+
+def _day_number(value: str) -> int:
+    """'2025-11-07' ou horodatage ISO -> jours depuis 1970-01-01"""
+    return (date.fromisoformat(value[:10]) - _EPOCH).days
+
+
+def _weekday(days: np.ndarray) -> np.ndarray:
+    # 1970-01-01 était un jeudi (lundi = 0)
+    return (days + 3) % 7
+
+
+# ==================== EXPORT ====================
+
+class _PartitionBuffer:
+    """Accumule les observations par (route, mois) avant écriture"""
+
+    def __init__(self):
+        self.rows: Dict[Tuple[str, str], Dict[str, list]] = {}
+        self.count = 0
+
+    def add(self, departure: str, destination: str, flight_date: str, recorded_day: int, price: float) -> None:
+        if not departure or not destination or not flight_date or price is None:
+            return
+        key = (f"{departure}-{destination}", flight_date[:7])
+        columns = self.rows.setdefault(key, {c: [] for c in COLUMNS})
+        columns["flight_day"].append(_day_number(flight_date))
+        columns["recorded_day"].append(recorded_day)
+        columns["price"].append(float(price))
+        self.count += 1
+
+
+# Partition : une génération de fichiers {colonne}.{génération}.npy, désignée par
+# partition.json {"generation", "rows"} (génération 0 : fichiers {colonne}.npy des anciens exports)
+PARTITION_FILE = "partition.json"
+
+
+def _column_path(directory: str, column: str, generation: int) -> str:
+    return os.path.join(directory, f"{column}.npy" if generation == 0 else f"{column}.{generation}.npy")
+
+
+def _partition_meta(directory: str) -> Optional[Dict[str, int]]:
+    """{"generation", "rows"} de la partition ; None si elle n'existe pas encore"""
+    path = os.path.join(directory, PARTITION_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    legacy = _column_path(directory, COLUMNS[0], 0)
+    if os.path.exists(legacy):
+        return {"generation": 0, "rows": int(np.load(legacy, mmap_mode="r").shape[0])}
+    return None
+
+
+def _write_partitions(root: str, buffer: _PartitionBuffer) -> Dict[str, Dict[str, int]]:
+    """
+    Écrit la génération suivante de chaque partition du buffer (anciennes lignes + nouvelles),
+    sans toucher aux générations en cours. Retourne les bascules à appliquer
+    {partition relative: {"generation", "rows"}} : rien n'est visible avant _apply_pending.
+    """
+    pending = {}
+    for (route, month), columns in buffer.rows.items():
+        directory = os.path.join(root, route, month)
+        os.makedirs(directory, exist_ok=True)
+        meta = _partition_meta(directory)
+        generation = meta["generation"] + 1 if meta else 1
+        current = _read_columns(directory, meta, mmap_mode=None) if meta else None
+        for column in COLUMNS:
+            new_values = np.asarray(columns[column], dtype=_DTYPES[column])
+            if current is not None:
+                new_values = np.concatenate([current[column], new_values])
+            np.save(_column_path(directory, column, generation), new_values)
+        rows = (meta["rows"] if meta else 0) + len(columns[COLUMNS[0]])
+        pending[os.path.join(route, month)] = {"generation": generation, "rows": rows}
+    return pending
+
+
+def _apply_pending(root: str, manifest: Dict[str, Any]) -> None:
+    """
+    Bascule les partitions enregistrées dans le manifeste (après sa sauvegarde, point de
+    validation de l'export) puis supprime les anciennes générations. Rejouable : un export
+    interrompu pendant les bascules les termine au lancement suivant.
+    """
+    for partition, meta in manifest.get("pending", {}).items():
+        directory = os.path.join(root, partition)
+        path = os.path.join(directory, PARTITION_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+        keep = {os.path.basename(_column_path(directory, c, meta["generation"])) for c in COLUMNS}
+        for name in os.listdir(directory):
+            if name.endswith(".npy") and name not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+    if manifest.get("pending"):
+        manifest["pending"] = {}
+        _save_manifest(root, manifest)
+
+
+def _load_manifest(root: str) -> Dict[str, Any]:
+    path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"watermarks": {}, "rows": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(root: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(root, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_watermark(source: str, root: Optional[str] = None) -> Optional[Any]:
+    """
+    Filigrane de la source (dernière ligne exportée) ; None si elle n'a jamais été exportée.
+    Manifeste illisible : 0 (la compaction du stockage local garde alors toutes les lignes brutes).
+    """
+    root = root or get_analytics_dir()
+    if not os.path.exists(os.path.join(root, MANIFEST_FILE)):
+        return None
+    try:
+        return _load_manifest(root)["watermarks"].get(source)
+    except Exception as e:
+        print(f"⚠️ Erreur lecture du manifeste d'export {root}: {e}")
+        return 0
+
+
+def _iter_local_rows(after_id: int) -> Iterable[Tuple[Any, str, str, str, int, float]]:
+    from fare_store import get_fare_store
+
+    store = get_fare_store()
+    if store is None:
+        raise RuntimeError("Stockage local désactivé (FLIGHTWATCHER_LOCAL_STORE)")
+
+    last_id = after_id
+    while True:
+        rows = store.get_price_history_after(last_id)
+        if not rows:
+            return
+        for row in rows:
+            recorded_day = int(row["recorded_at"] // 86400)
+            yield row["id"], row["departure_airport"], row["destination_code"], row["flight_date"], recorded_day, row["price"]
+        last_id = rows[-1]["id"]
+
+
+def _iter_supabase_rows(after: Optional[Dict[str, str]]) -> Iterable[Tuple[Any, str, str, str, int, float]]:
+    """Parcourt price_history par pages (pagination par clé recorded_at, id)"""
+    from supabase_client import get_supabase_service_client
+
+    supabase = get_supabase_service_client()
+    if supabase is None:
+        raise RuntimeError("SUPABASE_SERVICE_ROLE_KEY requise pour exporter depuis Supabase")
+
+    cursor = after
+    while True:
+        query = supabase.table("price_history")\
+            .select("id, recorded_at, departure_airport, destination_code, flight_date, price")\
+            .order("recorded_at")\
+            .order("id")\
+            .limit(SUPABASE_PAGE_SIZE)
+        if cursor:
+            # Les insertions d'un même scan partagent recorded_at : départager par id
+            query = query.or_(
+                f'recorded_at.gt."{cursor["recorded_at"]}",'
+                f'and(recorded_at.eq."{cursor["recorded_at"]}",id.gt.{cursor["id"]})'
+            )
+        rows = query.execute().data or []
+        for row in rows:
+            recorded_day = _day_number(row["recorded_at"])
+            yield ({"recorded_at": row["recorded_at"], "id": row["id"]}, row["departure_airport"],
+                   row["destination_code"], row["flight_date"], recorded_day, row["price"])
+        if len(rows) < SUPABASE_PAGE_SIZE:
+            return
+        cursor = {"recorded_at": rows[-1]["recorded_at"], "id": rows[-1]["id"]}
+
+
+def export_price_history(source: str = "local", root: Optional[str] = None,
+                         flush_every: int = 200000) -> Dict[str, Any]:
+    """
+    Exporte (de façon incrémentale) price_history vers le format colonnaire.
+    source = "local" (stockage SQLite) ou "supabase" (table price_history).
+    Un filigrane par source dans manifest.json évite de ré-exporter les mêmes lignes.
+    Utiliser une seule source par répertoire : les lignes synchronisées existent dans les deux.
+    """
+    if source not in ("local", "supabase"):
+        raise ValueError("source doit être 'local' ou 'supabase'")
+
+    root = root or get_analytics_dir()
+    os.makedirs(root, exist_ok=True)
+    manifest = _load_manifest(root)
+    # Export précédent interrompu après validation : terminer ses bascules
+    _apply_pending(root, manifest)
+    watermark = manifest["watermarks"].get(source)
+
+    if source == "local":
+        rows = _iter_local_rows(watermark or 0)
+    else:
+        rows = _iter_supabase_rows(watermark)
+
+    start = time.perf_counter()
+    buffer = _PartitionBuffer()
+    exported = 0
+    partitions = set()
+
+    def flush():
+        nonlocal buffer, exported
+        if not buffer.count:
+            return
+        # Nouvelles générations écrites, puis validation (manifeste : filigrane et bascules
+        # ensemble), puis bascules : une interruption ne duplique ni ne perd de lignes
+        manifest["pending"] = _write_partitions(root, buffer)
+        partitions.update(buffer.rows.keys())
+        exported += buffer.count
+        manifest["watermarks"][source] = watermark
+        manifest["rows"] = manifest.get("rows", 0) + buffer.count
+        manifest["exported_at"] = datetime.now(timezone.utc).isoformat()
+        _save_manifest(root, manifest)
+        _apply_pending(root, manifest)
+        buffer = _PartitionBuffer()
+
+    for row_key, departure, destination, flight_date, recorded_day, price in rows:
+        buffer.add(departure, destination, flight_date, recorded_day, price)
+        watermark = row_key
+        if buffer.count >= flush_every:
+            flush()
+    flush()
+
+    _invalidate_cache()
+    return {
+        "source": source,
+        "rows_exported": exported,
+        "partitions_written": len(partitions),
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        "total_rows": manifest.get("rows", 0),
+    }
+
+
+# ==================== REQUÊTES ====================
+
+# Répertoire de partition -> ((génération, lignes), colonnes mappées), ordre LRU
+_mmap_cache: "OrderedDict[str, Tuple[tuple, Dict[str, np.ndarray]]]" = OrderedDict()
+_mmap_lock = threading.Lock()
+
+
+def _invalidate_cache() -> None:
+    with _mmap_lock:
+        _mmap_cache.clear()
+
+
+def _read_columns(directory: str, meta: Dict[str, int], mmap_mode: Optional[str] = "r") -> Dict[str, np.ndarray]:
+    """Colonnes d'une génération, vérifiées contre le nombre de lignes de partition.json"""
+    columns = {c: np.load(_column_path(directory, c, meta["generation"]), mmap_mode=mmap_mode) for c in COLUMNS}
+    for column, values in columns.items():
+        if values.shape[0] != meta["rows"]:
+            raise ValueError(f"Partition {directory} incohérente: {column} a {values.shape[0]} lignes, "
+                             f"{meta['rows']} attendues")
+    return columns
+
+
+def _load_partition(directory: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Colonnes mappées d'une partition. Revalidées à chaque lecture : un export lancé par un
+    autre processus (CLI) est pris en compte sans redémarrage.
+    """
+    for attempt in range(3):
+        meta = _partition_meta(directory)
+        if meta is None:
+            # Partition pas encore validée (premier export en cours ou interrompu)
+            with _mmap_lock:
+                _mmap_cache.pop(directory, None)
+            return None
+        signature = (meta["generation"], meta["rows"])
+        with _mmap_lock:
+            cached = _mmap_cache.get(directory)
+            if cached is not None and cached[0] == signature:
+                _mmap_cache.move_to_end(directory)
+                return cached[1]
+        try:
+            columns = _read_columns(directory, meta)
+        except FileNotFoundError:
+            # Génération remplacée puis supprimée par un export entre-temps : relire partition.json
+            if attempt == 2:
+                raise
+            continue
+        with _mmap_lock:
+            _mmap_cache[directory] = (signature, columns)
+            _mmap_cache.move_to_end(directory)
+            while len(_mmap_cache) > MAX_MAPPED_PARTITIONS:
+                _mmap_cache.popitem(last=False)
+        return columns
+
+
+def list_routes(root: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Routes exportées avec leurs mois disponibles"""
+    root = root or get_analytics_dir()
+    if not os.path.isdir(root):
+        return []
+    routes = []
+    for route in sorted(os.listdir(root)):
+        route_dir = os.path.join(root, route)
+        if not os.path.isdir(route_dir) or "-" not in route:
+            continue
+        departure, destination = route.split("-", 1)
+        try:
+            validate_route(departure, destination)
+        except ValueError:
+            continue
+        routes.append({
+            "departure_airport": departure,
+            "destination_code": destination,
+            "months": sorted(os.listdir(route_dir)),
+        })
+    return routes
+
+
+def load_route(departure: str, destination: str, months: Optional[List[str]] = None,
+               root: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Colonnes d'une route (toutes partitions ou mois 'YYYY-MM' choisis)"""
+    validate_route(departure, destination, months)
+    root = root or get_analytics_dir()
+    route_dir = os.path.join(root, f"{departure}-{destination}")
+    empty = {c: np.empty(0, dtype=_DTYPES[c]) for c in COLUMNS}
+    if not os.path.isdir(route_dir):
+        return empty
+
+    selected = sorted(months) if months else sorted(os.listdir(route_dir))
+    parts = [
+        part for part in (
+            _load_partition(os.path.join(route_dir, month))
+            for month in selected
+            if os.path.isdir(os.path.join(route_dir, month))
+        )
+        if part is not None
+    ]
+    if not parts:
+        return empty
+    if len(parts) == 1:
+        return parts[0]
+    return {c: np.concatenate([p[c] for p in parts]) for c in COLUMNS}
+
+
+def route_summary(departure: str, destination: str, months: Optional[List[str]] = None) -> Dict[str, Any]:
+    columns = load_route(departure, destination, months)
+    prices = columns["price"]
+    if prices.size == 0:
+        return {"departure_airport": departure, "destination_code": destination, "observations": 0}
+    p25, p50, p75 = np.percentile(prices, [25, 50, 75])
+    return {
+        "departure_airport": departure,
+        "destination_code": destination,
+        "observations": int(prices.size),
+        "min": round(float(prices.min()), 2),
+        "mean": round(float(prices.mean()), 2),
+        "p25": round(float(p25), 2),
+        "median": round(float(p50), 2),
+        "p75": round(float(p75), 2),
+    }
+
+
+def cheapest_weekday(departure: str, destination: str, months: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Prix moyen et minimum par jour de semaine du vol"""
+    columns = load_route(departure, destination, months)
+    prices = np.asarray(columns["price"], dtype=np.float64)
+    weekdays = _weekday(np.asarray(columns["flight_day"]))
+
+    counts = np.bincount(weekdays, minlength=7)
+    sums = np.bincount(weekdays, weights=prices, minlength=7)
+    minimums = np.full(7, np.inf)
+    np.minimum.at(minimums, weekdays, prices)
+
+    by_weekday = []
+    for day in range(7):
+        if counts[day] == 0:
+            continue
+        by_weekday.append({
+            "weekday": day,
+            "name": WEEKDAYS[day],
+            "observations": int(counts[day]),
+            "avg_price": round(float(sums[day] / counts[day]), 2),
+            "min_price": round(float(minimums[day]), 2),
+        })
+    cheapest = min(by_weekday, key=lambda d: d["avg_price"]) if by_weekday else None
+    return {
+        "departure_airport": departure,
+        "destination_code": destination,
+        "cheapest_weekday": cheapest["name"] if cheapest else None,
+        "weekdays": by_weekday,
+    }
+
+
+def lead_time_curve(departure: str, destination: str, bucket_days: int = 7, max_days: int = 180,
+                    months: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Prix en fonction de l'anticipation (jours entre observation et vol), par tranches"""
+    columns = load_route(departure, destination, months)
+    lead = np.asarray(columns["flight_day"], dtype=np.int64) - np.asarray(columns["recorded_day"], dtype=np.int64)
+    prices = np.asarray(columns["price"], dtype=np.float64)
+
+    mask = (lead >= 0) & (lead <= max_days)
+    lead, prices = lead[mask], prices[mask]
+    buckets = lead // bucket_days
+
+    # Trier une fois par tranche puis découper : médiane et quartile vectorisés
+    order = np.lexsort((prices, buckets))
+    buckets, prices = buckets[order], prices[order]
+    boundaries = np.flatnonzero(np.diff(buckets)) + 1
+    curve = []
+    for chunk_buckets, chunk_prices in zip(np.split(buckets, boundaries), np.split(prices, boundaries)):
+        if chunk_prices.size == 0:
+            continue
+        bucket = int(chunk_buckets[0])
+        curve.append({
+            "lead_days_from": bucket * bucket_days,
+            "lead_days_to": (bucket + 1) * bucket_days - 1,
+            "observations": int(chunk_prices.size),
+            "avg_price": round(float(chunk_prices.mean()), 2),
+            "p25_price": round(float(chunk_prices[int((chunk_prices.size - 1) * 0.25)]), 2),
+            "median_price": round(float(chunk_prices[(chunk_prices.size - 1) // 2]), 2),
+        })
+    return {
+        "departure_airport": departure,
+        "destination_code": destination,
+        "bucket_days": bucket_days,
+        "curve": curve,
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+    if command == "export":
+        source = sys.argv[3] if len(sys.argv) > 3 and sys.argv[2] == "--source" else "local"
+        print(json.dumps(export_price_history(source), indent=2))
+    elif command == "weekdays" and len(sys.argv) == 4:
+        print(json.dumps(cheapest_weekday(sys.argv[2], sys.argv[3]), indent=2, ensure_ascii=False))
+    elif command == "lead-time" and len(sys.argv) == 4:
+        print(json.dumps(lead_time_curve(sys.argv[2], sys.argv[3]), indent=2, ensure_ascii=False))
+    else:
+        print(__doc__)
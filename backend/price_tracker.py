@@ -1,80 +1,224 @@
 """
 Tracking de l'historique des prix pour FlightWatcher
-Enregistre les prix dans price_history pour analytics futures
+Enregistre les prix dans le stockage local (tampon) puis dans price_history (Supabase)
+pour analytics futures
 """
-from typing import List, Dict, Any
-from supabase_client import get_supabase_service_client
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from fare_store import get_fare_store
 import logging
 
 logger = logging.getLogger(__name__)
 
+try:
+    from supabase_client import get_supabase_service_client
+except Exception:
+    # Supabase non configuré : l'historique reste dans le stockage local
+    get_supabase_service_client = None
+
+# Nombre max de lignes poussées vers Supabase par synchronisation
+SYNC_BATCH_SIZE = 500
+# Compaction de price_history côté Supabase (voir supabase_price_history_lifecycle.sql)
+REMOTE_COMPACT_SECONDS = int(os.getenv("FLIGHTWATCHER_PRICE_HISTORY_COMPACT_SECONDS", "86400"))
+REMOTE_RAW_DAYS = int(os.getenv("FLIGHTWATCHER_PRICE_HISTORY_RAW_DAYS", "30"))
+REMOTE_DAILY_DAYS = int(os.getenv("FLIGHTWATCHER_PRICE_HISTORY_DAYS", "730"))
+
+# Pause après un échec de synchronisation (Supabase indisponible)
+SYNC_RETRY_SECONDS = int(os.getenv("FLIGHTWATCHER_PRICE_SYNC_RETRY_SECONDS", "60"))
+
+_remote_compaction_started = False
+
+# Envois vers Supabase hors du chemin des scans, dans un seul thread
+_sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price-history-sync")
+# Sérialise lecture du tampon -> insertion -> marquage (une ligne n'est poussée qu'une fois)
+_sync_lock = threading.Lock()
+_sync_state_lock = threading.Lock()
+_sync_state = {"scheduled": False, "retry_at": 0.0}
+
+def _departure_date(departure_time: str) -> str:
+    return departure_time.split('T')[0] if 'T' in departure_time else departure_time.split(' ')[0]
+
+def build_price_records(trips: List[Dict[str, Any]], source: str = "api_scan") -> List[Dict[str, Any]]:
+    """Convertit des voyages (dict) en lignes price_history (un enregistrement par segment)"""
+    price_records = []
+
+    for trip in trips:
+        # trip est un dict avec les clés aller, retour, etc.
+        for flight in (trip.get('aller', {}), trip.get('retour', {})):
+            price_records.append({
+                "departure_airport": flight.get('origin', ''),
+                "destination_code": flight.get('destination', ''),
+                "flight_date": _departure_date(flight.get('departureTime', '')),
+                "price": flight.get('price', 0),
+                "currency": flight.get('currency', 'EUR'),
+                "airline": "Ryanair",
+                "source": source,
+                "flight_number": flight.get('flightNumber', '')
+            })
+
+    return price_records
+
+def _get_supabase_service():
+    if get_supabase_service_client is None:
+        return None
+    if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_SERVICE_ROLE_KEY"):
+        return None
+    return get_supabase_service_client()
+
+def sync_price_history() -> int:
+    """
+    Pousse vers Supabase les observations restées dans le tampon local
+    (enregistrées pendant que Supabase était indisponible). Retourne le nombre de lignes poussées.
+    """
+    store = get_fare_store()
+    supabase = _get_supabase_service()
+    if not store or not supabase:
+        return 0
+
+    pushed = 0
+    with _sync_lock:
+        while True:
+            pending = store.get_unsynced_prices(SYNC_BATCH_SIZE)
+            if not pending:
+                break
+            rows = [
+                {key: row[key] for key in (
+                    "departure_airport", "destination_code", "flight_date", "price",
+                    "currency", "airline", "source", "flight_number"
+                )}
+                for row in pending
+            ]
+            supabase.table("price_history").insert(rows).execute()
+            store.mark_synced([row["id"] for row in pending])
+            pushed += len(rows)
+            if len(pending) < SYNC_BATCH_SIZE:
+                break
+    return pushed
+
+def schedule_sync() -> None:
+    """
+    Planifie une synchronisation du tampon en arrière-plan : une seule en attente à la fois,
+    aucune pendant SYNC_RETRY_SECONDS après un échec (les lignes restent dans le tampon).
+    """
+    with _sync_state_lock:
+        if _sync_state["scheduled"] or time.time() < _sync_state["retry_at"]:
+            return
+        _sync_state["scheduled"] = True
+    _sync_executor.submit(_run_sync)
+
+def _run_sync() -> None:
+    # Libère la place avant de lire le tampon : un scan enregistré pendant l'envoi replanifie
+    with _sync_state_lock:
+        _sync_state["scheduled"] = False
+    try:
+        pushed = sync_price_history()
+        if pushed:
+            logger.info(f"✅ {pushed} prix enregistré(s) dans price_history")
+    except Exception as e:
+        _sync_state["retry_at"] = time.time() + SYNC_RETRY_SECONDS
+        logger.warning(f"⚠️ Synchronisation price_history impossible (nouvel essai dans {SYNC_RETRY_SECONDS} s): {e}")
+
+def _insert_remote(supabase, price_records: List[Dict[str, Any]]) -> None:
+    try:
+        result = supabase.table("price_history").insert(price_records).execute()
+        if result.data:
+            logger.info(f"✅ {len(price_records)} prix enregistré(s) dans price_history")
+        else:
+            logger.warning("⚠️ Aucun prix enregistré dans price_history")
+    except Exception as e:
+        logger.error(f"❌ Erreur enregistrement price_history: {e}")
+
 def record_price_history(trips: List[Dict[str, Any]]) -> None:
     """
     Enregistre les prix des vols dans price_history pour analytics
-    
+
     Args:
         trips: Liste des voyages (dict) trouvés lors d'un scan
-    
+
     Note: Cette fonction ne doit pas bloquer le scan si elle échoue
     """
     if not trips:
         return
-    
+
     try:
-        supabase = get_supabase_service_client()
-        
+        price_records = build_price_records(trips)
+        if not price_records:
+            return
+
+        store = get_fare_store()
+        if store:
+            # Tampon local d'abord : l'historique survit à une indisponibilité de Supabase
+            store.record_prices(price_records)
+            if _get_supabase_service():
+                schedule_sync()
+            return
+
+        supabase = _get_supabase_service()
         if not supabase:
-            # Service role key non configurée, on skip silencieusement
+            # Ni stockage local ni service role key : on skip silencieusement
             return
-        
-        # Préparer les données à insérer
-        price_records = []
-        
-        for trip in trips:
-            # trip est un dict avec les clés aller, retour, etc.
-            aller = trip.get('aller', {})
-            retour = trip.get('retour', {})
-            
-            # Enregistrer le vol aller
-            departure_time_aller = aller.get('departureTime', '')
-            departure_date_aller = departure_time_aller.split('T')[0] if 'T' in departure_time_aller else departure_time_aller.split(' ')[0]
-            
-            price_records.append({
-                "departure_airport": aller.get('origin', ''),
-                "destination_code": aller.get('destination', ''),
-                "flight_date": departure_date_aller,
-                "price": aller.get('price', 0),
-                "currency": aller.get('currency', 'EUR'),
-                "airline": "Ryanair",
-                "source": "api_scan",
-                "flight_number": aller.get('flightNumber', '')
-            })
-            
-            # Enregistrer le vol retour
-            departure_time_retour = retour.get('departureTime', '')
-            departure_date_retour = departure_time_retour.split('T')[0] if 'T' in departure_time_retour else departure_time_retour.split(' ')[0]
-            
-            price_records.append({
-                "departure_airport": retour.get('origin', ''),
-                "destination_code": retour.get('destination', ''),
-                "flight_date": departure_date_retour,
-                "price": retour.get('price', 0),
-                "currency": retour.get('currency', 'EUR'),
-                "airline": "Ryanair",
-                "source": "api_scan",
-                "flight_number": retour.get('flightNumber', '')
-            })
-        
-        # Insertion batch dans price_history
-        if price_records:
-            result = supabase.table("price_history").insert(price_records).execute()
-            
-            if result.data:
-                logger.info(f"✅ {len(price_records)} prix enregistré(s) dans price_history")
-            else:
-                logger.warning("⚠️ Aucun prix enregistré dans price_history")
-                
+
+        # Insertion batch dans price_history (en arrière-plan)
+        _sync_executor.submit(_insert_remote, supabase, price_records)
+
     except Exception as e:
         # Ne pas bloquer le scan si l'enregistrement échoue
         logger.error(f"❌ Erreur enregistrement price_history: {e}")
         # On continue silencieusement
+
+def compact_remote_price_history() -> Optional[int]:
+    """
+    Appelle compact_price_history() sur Supabase : agrège puis supprime les partitions
+    mensuelles sorties de la fenêtre brute. Retourne le nombre de partitions supprimées
+    (None si Supabase n'est pas configuré).
+    """
+    supabase = _get_supabase_service()
+    if not supabase:
+        return None
+    result = supabase.rpc(
+        'compact_price_history',
+        {'p_raw_days': REMOTE_RAW_DAYS, 'p_daily_days': REMOTE_DAILY_DAYS}
+    ).execute()
+    return int(result.data or 0)
+
+def get_daily_price_trend(departure_airport: str, destination_code: str, days: int = 365) -> List[Dict[str, Any]]:
+    """Tendance quotidienne d'une route (Supabase si configuré, sinon stockage local)"""
+    supabase = _get_supabase_service()
+    if supabase:
+        try:
+            result = supabase.rpc(
+                'get_daily_price_trend',
+                {'p_departure': departure_airport, 'p_destination': destination_code, 'p_days': days}
+            ).execute()
+            return [
+                {**row, **{key: float(row[key]) for key in ("min_price", "max_price", "avg_price")}}
+                for row in (result.data or [])
+            ]
+        except Exception as e:
+            logger.warning(f"⚠️ Tendance Supabase indisponible, repli sur l'historique local: {e}")
+    store = get_fare_store()
+    return store.get_daily_prices(departure_airport, destination_code, days) if store else []
+
+def start_remote_compaction() -> None:
+    """Compaction périodique de price_history sur Supabase (aucun effet sans service_role)"""
+    global _remote_compaction_started
+    if _remote_compaction_started or REMOTE_COMPACT_SECONDS <= 0 or not _get_supabase_service():
+        return
+    _remote_compaction_started = True
+
+    def loop():
+        while True:
+            try:
+                dropped = compact_remote_price_history()
+                if dropped:
+                    logger.info(f"🧹 price_history: {dropped} partition(s) mensuelle(s) agrégée(s)")
+            except Exception as e:
+                # Typiquement : migration supabase_price_history_lifecycle.sql pas encore exécutée
+                # ou Supabase indisponible ; nouvel essai à la prochaine période
+                logger.warning(f"⚠️ Erreur compaction price_history (Supabase): {e}")
+            time.sleep(REMOTE_COMPACT_SECONDS)
+
+    threading.Thread(target=loop, name="price-history-compaction", daemon=True).start()
@@ -0,0 +1,131 @@
+"""
+Budgets de requêtes vers l'API Ryanair
+Chaque scan réserve son coût estimé (nombre de requêtes) dans deux seaux à jetons :
+celui de l'utilisateur (user_id authentifié, sinon adresse IP) et un seau global
+partagé par tout le processus. Après exécution, l'écart entre estimation et coût réel
+est rendu (ou prélevé). Un seau vide fait refuser le scan avec un délai de réessai.
+Les tâches de fond (matrice découverte, revalidations) n'ont pas d'utilisateur
+(user_key None) : elles ne puisent que dans le seau global et sont reportées s'il est vide.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from ttl_cache import TTLCache
+
+# Requêtes API par heure et par utilisateur (la capacité du seau vaut une heure de budget)
+USER_QUERIES_PER_HOUR = int(os.getenv("FLIGHTWATCHER_USER_QUERY_BUDGET", "600"))
+# Requêtes API par heure pour l'ensemble du processus
+GLOBAL_QUERIES_PER_HOUR = int(os.getenv("FLIGHTWATCHER_GLOBAL_QUERY_BUDGET", "6000"))
+
+
+class TokenBucket:
+    """Seau à jetons : capacity jetons max, rechargé de refill_per_second"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def retry_after(self, cost: float) -> float:
+        """Secondes avant que cost jetons soient disponibles"""
+        with self._lock:
+            self._refill()
+            missing = min(cost, self.capacity) - self.tokens
+            return max(0.0, missing / self.refill_per_second) if self.refill_per_second else float("inf")
+
+    def take(self, cost: float) -> bool:
+        with self._lock:
+            self._refill()
+            # Un scan plus coûteux que la capacité passe quand le seau est plein
+            if self.tokens >= min(cost, self.capacity):
+                self.tokens -= cost
+                return True
+            return False
+
+    def adjust(self, delta: float) -> None:
+        """Rend (delta > 0) ou prélève (delta < 0) des jetons ; le solde peut devenir négatif"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class QueryBudget:
+    def __init__(self, user_per_hour: int = USER_QUERIES_PER_HOUR, global_per_hour: int = GLOBAL_QUERIES_PER_HOUR):
+        self.user_per_hour = user_per_hour
+        # Seaux inactifs oubliés au bout de 2 h (ils seraient de nouveau pleins)
+        self._users = TTLCache(max_size=50000, ttl_seconds=7200)
+        self._users_lock = threading.Lock()
+        self.global_bucket = TokenBucket(global_per_hour, global_per_hour / 3600)
+        self._counters = {"reserved": 0, "rejected": 0, "estimated_queries": 0, "actual_queries": 0}
+
+    def _user_bucket(self, user_key: str) -> TokenBucket:
+        with self._users_lock:
+            bucket = self._users.get(user_key)
+            if bucket is None:
+                bucket = TokenBucket(self.user_per_hour, self.user_per_hour / 3600)
+            # Réinsertion : prolonge la durée de vie d'un seau actif
+            self._users.set(user_key, bucket)
+            return bucket
+
+    def reserve(self, user_key: Optional[str], cost: int) -> Tuple[bool, float]:
+        """
+        Réserve cost requêtes ; retourne (accepté, secondes avant réessai si refusé).
+        user_key None : tâche de fond, seau global seulement.
+        """
+        if cost <= 0:
+            return True, 0.0
+        user_bucket = self._user_bucket(user_key) if user_key is not None else None
+        if user_bucket is not None and not user_bucket.take(cost):
+            self._counters["rejected"] += 1
+            return False, user_bucket.retry_after(cost)
+        if not self.global_bucket.take(cost):
+            if user_bucket is not None:
+                user_bucket.adjust(cost)
+            self._counters["rejected"] += 1
+            return False, self.global_bucket.retry_after(cost)
+        self._counters["reserved"] += 1
+        return True, 0.0
+
+    def settle(self, user_key: Optional[str], estimated: int, actual: int) -> None:
+        """Corrige la réservation avec le coût réel (user_key None : seau global seulement)"""
+        self._counters["estimated_queries"] += estimated
+        self._counters["actual_queries"] += actual
+        delta = estimated - actual
+        if delta:
+            if user_key is not None:
+                self._user_bucket(user_key).adjust(delta)
+            self.global_bucket.adjust(delta)
+
+    def remaining(self, user_key: str) -> Dict[str, int]:
+        return {
+            "utilisateur": int(self._user_bucket(user_key).available()),
+            "global": int(self.global_bucket.available()),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "user_queries_per_hour": self.user_per_hour,
+            "global_queries_per_hour": self.global_bucket.capacity,
+            "global_available": int(self.global_bucket.available()),
+            "active_users": len(self._users),
+            **self._counters,
+        }
+
+
+def quota_key(user_id: Optional[str], client_host: Optional[str]) -> str:
+    """Clé de quota : utilisateur authentifié, sinon adresse du client"""
+    return f"user:{user_id}" if user_id else f"ip:{client_host or 'inconnu'}"
@@ -0,0 +1,234 @@
+"""
+Enregistrement de traces de requêtes (opt-in : FLIGHTWATCHER_TRACE_FILE)
+Capture la séquence des requêtes de scan reçues en production pour la rejouer hors
+ligne (trace_replay.py) :
+- requêtes : route, corps JSON (routes de scan uniquement), décalage depuis le début
+  de l'enregistrement, statut, durée, puis issue du cache et requêtes API annotées
+  par l'endpoint (annotate)
+- appels amont (API Ryanair) : paramètres, latence et forme compacte de la réponse
+  (destination, horaire, prix et numéro de chaque vol), rattachés à la requête en
+  cours quand l'appel est fait dans son contexte
+Anonymisation : ni adresse IP, ni jeton, ni identifiant utilisateur ; chaque client est
+remplacé par un pseudonyme (HMAC avec un sel tiré au démarrage, donc non rapprochable
+d'un enregistrement à l'autre) et les horodatages sont relatifs au début. Les routes
+liées à un compte (recherches sauvegardées, favoris, auto-check) ne sont pas tracées.
+
+Format : JSON lines, une ligne {"type": "header"} à chaque ouverture du fichier, puis
+des lignes "request" et "upstream". L'écriture se fait dans un thread dédié : une
+requête tracée ne fait qu'ajouter un événement à une file.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+TRACE_FILE = os.getenv("FLIGHTWATCHER_TRACE_FILE", "").strip()
+# Part des requêtes tracées (1 = toutes)
+TRACE_SAMPLE_RATE = float(os.getenv("FLIGHTWATCHER_TRACE_SAMPLE", "1"))
+# Taille max du fichier (Mo) : l'enregistrement s'arrête au-delà
+TRACE_MAX_MB = float(os.getenv("FLIGHTWATCHER_TRACE_MAX_MB", "200"))
+FORMAT_VERSION = 1
+
+# Routes dont les requêtes sont enregistrées (paramètres de recherche, sans donnée de compte)
+TRACED_ROUTES = {
+    "/api/scan", "/api/scan/batch", "/api/scan/estimate", "/api/scan/flexible",
+    "/api/reverse", "/api/inspire", "/api/jobs/scan",
+}
+
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("flightwatcher_trace", default=None)
+
+
+def fares_shape(data: Any) -> Optional[List[list]]:
+    """Réponse oneWayFares -> [[destination, départ ISO, prix, devise, numéro de vol]]"""
+    try:
+        return [
+            [
+                fare["outbound"]["arrivalAirport"]["iataCode"],
+                fare["outbound"]["departureDate"],
+                fare["outbound"]["price"]["value"],
+                fare["outbound"]["price"]["currencyCode"],
+                fare["outbound"]["flightNumber"],
+            ]
+            for fare in data.get("fares") or []
+        ]
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def calendar_shape(data: Any) -> Optional[List[list]]:
+    """Réponse cheapestPerDay -> [[jour, départ ISO, prix, devise]] (jours disponibles)"""
+    try:
+        return [
+            [fare["day"], fare.get("departureDate"), fare["price"]["value"], fare["price"]["currencyCode"]]
+            for fare in (data.get("outbound") or {}).get("fares") or []
+            if fare.get("price") and not fare.get("unavailable") and not fare.get("soldOut")
+        ]
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def upstream_endpoint(url: str) -> str:
+    """Nom court d'un endpoint amont (oneWayFares, cheapestPerDay, ...)"""
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+class TraceRecorder:
+    def __init__(self, path: str = TRACE_FILE, sample_rate: float = TRACE_SAMPLE_RATE,
+                 max_mb: float = TRACE_MAX_MB):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._salt = os.urandom(16)
+        self._started = time.monotonic()
+        self._ids = itertools.count(1)
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._full = False
+        self._counters = {"requests": 0, "upstream": 0, "bytes": 0, "write_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and not self._full
+
+    # ---------- Requêtes ----------
+
+    def wants(self, method: str, path: str) -> bool:
+        """La requête doit-elle être tracée (route de scan, échantillonnage) ?"""
+        if not self.enabled or method != "POST" or path not in TRACED_ROUTES:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def pseudonym(self, client_key: str) -> str:
+        return hmac.new(self._salt, client_key.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+    def begin(self, method: str, path: str, body: bytes, client_key: str) -> Dict[str, Any]:
+        """Début d'une requête tracée : l'événement devient le contexte courant (annotate)"""
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = None
+        event = {
+            "type": "request",
+            "id": next(self._ids),
+            "t": self._offset(),
+            "client": self.pseudonym(client_key),
+            "method": method,
+            "route": path,
+            "body": payload,
+        }
+        event["_token"] = _current.set(event)
+        return event
+
+    def finish(self, event: Dict[str, Any], status: int, duration_ms: float) -> None:
+        _current.reset(event.pop("_token"))
+        event["status"] = status
+        event["ms"] = round(duration_ms, 1)
+        self._counters["requests"] += 1
+        self._emit(event)
+
+    # ---------- Appels amont ----------
+
+    def record_upstream(self, url: str, params: Optional[Dict[str, Any]], latency_seconds: float,
+                        data: Any = None, error: Optional[BaseException] = None) -> None:
+        if not self.enabled:
+            return
+        current = _current.get()
+        endpoint = upstream_endpoint(url)
+        event = {
+            "type": "upstream",
+            "t": self._offset(),
+            "req": current["id"] if current else None,
+            "endpoint": endpoint,
+            "url": url,
+            "params": dict(params or {}),
+            "ms": round(latency_seconds * 1000, 1),
+        }
+        if error is not None:
+            event["error"] = type(error).__name__
+        elif endpoint == "cheapestPerDay":
+            event["days"] = calendar_shape(data)
+        elif endpoint == "oneWayFares":
+            event["fares"] = fares_shape(data)
+        else:
+            event["keys"] = sorted(data)[:20] if isinstance(data, dict) else None
+        self._counters["upstream"] += 1
+        self._emit(event)
+
+    # ---------- Écriture ----------
+
+    def _offset(self) -> float:
+        return round(time.monotonic() - self._started, 3)
+
+    def _emit(self, event: Dict[str, Any]) -> None:
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                    self._writer.start()
+        self._queue.put(event)
+
+    def _header(self) -> Dict[str, Any]:
+        return {
+            "type": "header",
+            "version": FORMAT_VERSION,
+            # Jour de référence pour décaler les dates lors d'un rejeu
+            "day": date.today().isoformat(),
+            "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "sample_rate": self.sample_rate,
+        }
+
+    def _write_loop(self) -> None:
+        try:
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(json.dumps(self._header()) + "\n")
+                while True:
+                    event = self._queue.get()
+                    if event is None:
+                        break
+                    line = json.dumps(event, separators=(",", ":"), ensure_ascii=False, default=str) + "\n"
+                    trace_file.write(line)
+                    self._counters["bytes"] += len(line)
+                    if self._counters["bytes"] >= self.max_bytes:
+                        self._full = True
+                        print(f"⚠️ Trace {self.path}: taille max atteinte ({TRACE_MAX_MB:g} Mo), enregistrement arrêté")
+                        break
+                    if self._queue.empty():
+                        trace_file.flush()
+        except OSError as e:
+            self._counters["write_errors"] += 1
+            self._full = True
+            print(f"⚠️ Erreur écriture de la trace {self.path}: {e}")
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Vide la file et ferme le fichier (arrêt du serveur)"""
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path or None,
+            "sample_rate": self.sample_rate,
+            **self._counters,
+        }
+
+
+recorder = TraceRecorder()
+
+
+def annotate(**fields: Any) -> None:
+    """Ajoute des informations (issue du cache, requêtes API, ...) à la requête tracée en cours"""
+    event = _current.get()
+    if event is not None:
+        event.update(fields)
@@ -0,0 +1,222 @@
+"""
+Encodage compact des ensembles de résultats stockés (voyages au format TripResponse)
+Les résultats mis en cache répètent pour chaque voyage les noms complets des aéroports
+et des horodatages ISO. Format v1 (colonnes) :
+- aéroports dédupliqués dans un dictionnaire (code, nom complet), référencés par indice
+- horaires de départ en minutes depuis le plus ancien départ de l'ensemble
+- prix en centimes, codés en différence avec le voyage précédent
+- le tout sérialisé en JSON puis compressé (zlib)
+Un ensemble qui ne se prête pas au format colonnes (champ inattendu, horaire non ISO
+à la minute, prix au-delà du centime) est seulement compressé (v0) : le décodage
+restitue toujours exactement les résultats d'origine.
+
+Formes stockées : octets (SQLite) b"FW" + version + données, ou texte (JSONB, JSON)
+"fw<version>:" + base64. decode_results accepte aussi les listes JSON d'avant l'encodage.
+"""
+import base64
+import json
+import zlib
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+FORMAT_VERSION = 1
+_MAGIC = b"FW"
+_TEXT_PREFIX = "fw"
+COMPRESSION_LEVEL = 6
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_TRIP_KEYS = {"aller", "retour", "prix_total", "destination_code"}
+_FLIGHT_KEYS = {"flightNumber", "origin", "originFull", "destination", "destinationFull",
+                "departureTime", "price", "currency"}
+_LEGS = ("aller", "retour")
+
+
+@lru_cache(maxsize=4096)
+def _day_number(day: str) -> int:
+    return date.fromisoformat(day).toordinal() - _EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=4096)
+def _day_string(day_number: int) -> str:
+    return date.fromordinal(day_number + _EPOCH_ORDINAL).isoformat()
+
+
+def _minutes(departure_time: Any) -> Optional[int]:
+    """Minutes depuis 1970 (heure locale de l'aéroport, sans fuseau) ; None si non restituable"""
+    # Seule la forme "AAAA-MM-JJTHH:MM:00" est restituée à l'identique
+    if not isinstance(departure_time, str) or len(departure_time) != 19 or departure_time[10] != "T" \
+            or departure_time[13] != ":" or not departure_time.endswith(":00"):
+        return None
+    try:
+        day = _day_number(departure_time[:10])
+        hours, minutes = int(departure_time[11:13]), int(departure_time[14:16])
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60) or not departure_time[11:16].replace(":", "").isdigit():
+        return None
+    return day * 1440 + hours * 60 + minutes
+
+
+def _format_minutes(minutes: int) -> str:
+    day, minutes = divmod(minutes, 1440)
+    return f"{_day_string(day)}T{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def _cents(price: Any) -> Optional[int]:
+    if isinstance(price, bool) or not isinstance(price, (int, float)):
+        return None
+    cents = round(price * 100)
+    return cents if cents / 100 == price else None
+
+
+def _deltas(values: List[int]) -> List[int]:
+    return [value - previous for previous, value in zip([0] + values[:-1], values)]
+
+
+def _undeltas(deltas: List[int]) -> List[int]:
+    values, total = [], 0
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def _columns(results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Payload v1, None si un voyage ne peut pas être restitué à l'identique"""
+    airports: Dict[Tuple[str, str], int] = {}
+    currencies: Dict[str, int] = {}
+
+    def airport(code: Any, name: Any) -> Optional[int]:
+        if not isinstance(code, str) or not isinstance(name, str):
+            return None
+        return airports.setdefault((code, name), len(airports))
+
+    legs: Dict[str, Dict[str, list]] = {leg: {"n": [], "o": [], "d": [], "t": [], "p": [], "c": []} for leg in _LEGS}
+    totals, destinations = [], []
+    for trip in results:
+        if not isinstance(trip, dict) or trip.keys() != _TRIP_KEYS or not isinstance(trip["destination_code"], str):
+            return None
+        total = _cents(trip["prix_total"])
+        if total is None:
+            return None
+        totals.append(total)
+        destinations.append(trip["destination_code"])
+        for leg in _LEGS:
+            flight = trip[leg]
+            if not isinstance(flight, dict) or flight.keys() != _FLIGHT_KEYS:
+                return None
+            origin = airport(flight["origin"], flight["originFull"])
+            destination = airport(flight["destination"], flight["destinationFull"])
+            minutes = _minutes(flight["departureTime"])
+            price = _cents(flight["price"])
+            if None in (origin, destination, minutes, price) or not isinstance(flight["flightNumber"], str) \
+                    or not isinstance(flight["currency"], str):
+                return None
+            column = legs[leg]
+            column["n"].append(flight["flightNumber"])
+            column["o"].append(origin)
+            column["d"].append(destination)
+            column["t"].append(minutes)
+            column["p"].append(price)
+            column["c"].append(currencies.setdefault(flight["currency"], len(currencies)))
+
+    all_minutes = legs["aller"]["t"] + legs["retour"]["t"]
+    base = min(all_minutes) if all_minutes else 0
+    for column in legs.values():
+        column["t"] = [minutes - base for minutes in column["t"]]
+        column["p"] = _deltas(column["p"])
+        # Une seule devise (cas courant) : pas de colonne
+        if len(currencies) <= 1:
+            del column["c"]
+    # Code destination = destination de l'aller sauf exception : on ne garde que les exceptions
+    airport_codes = [code for code, _ in airports]
+    destination_codes = {
+        index: code for index, code in enumerate(destinations)
+        if code != airport_codes[legs["aller"]["d"][index]]
+    }
+    return {
+        "a": [list(key) for key in airports],
+        "cur": list(currencies),
+        "t0": base,
+        "pt": _deltas(totals),
+        "dc": destination_codes,
+        **legs,
+    }
+
+
+def _rows(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    airports = payload["a"]
+    currencies = payload["cur"]
+    base = payload["t0"]
+    totals = _undeltas(payload["pt"])
+    exceptions = {int(index): code for index, code in payload["dc"].items()}
+    flights = {}
+    for leg in _LEGS:
+        column = payload[leg]
+        prices = _undeltas(column["p"])
+        currency_indexes = column.get("c") or [0] * len(prices)
+        flights[leg] = [
+            {
+                "flightNumber": column["n"][i],
+                "origin": airports[column["o"][i]][0],
+                "originFull": airports[column["o"][i]][1],
+                "destination": airports[column["d"][i]][0],
+                "destinationFull": airports[column["d"][i]][1],
+                "departureTime": _format_minutes(base + column["t"][i]),
+                "price": prices[i] / 100,
+                "currency": currencies[currency_indexes[i]],
+            }
+            for i in range(len(prices))
+        ]
+    return [
+        {
+            "aller": aller,
+            "retour": retour,
+            "prix_total": totals[i] / 100,
+            "destination_code": exceptions.get(i, aller["destination"]),
+        }
+        for i, (aller, retour) in enumerate(zip(flights["aller"], flights["retour"]))
+    ]
+
+
+def encode_results(results: List[Dict[str, Any]]) -> bytes:
+    """Résultats -> octets compacts (b"FW" + version + JSON compressé)"""
+    payload = _columns(results)
+    version = FORMAT_VERSION if payload is not None else 0
+    data = json.dumps(payload if payload is not None else results, separators=(",", ":"), ensure_ascii=False)
+    return _MAGIC + bytes([version]) + zlib.compress(data.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def encode_results_text(results: List[Dict[str, Any]]) -> str:
+    """Forme texte (colonne JSONB, fichier JSON) : "fw<version>:" + base64"""
+    encoded = encode_results(results)
+    return f"{_TEXT_PREFIX}{encoded[2]}:" + base64.b64encode(encoded[3:]).decode("ascii")
+
+
+def decode_results(stored: Union[bytes, str, List[Dict[str, Any]], None]) -> List[Dict[str, Any]]:
+    """
+    Forme stockée -> résultats. Accepte les octets et le texte encodés, et les anciennes
+    valeurs non encodées (liste, ou texte JSON).
+    """
+    if stored is None:
+        return []
+    if isinstance(stored, list):
+        return stored
+    if isinstance(stored, (bytes, bytearray, memoryview)):
+        stored = bytes(stored)
+        if not stored.startswith(_MAGIC):
+            return json.loads(stored.decode("utf-8"))
+        version, data = stored[2], zlib.decompress(stored[3:])
+    elif stored.startswith(_TEXT_PREFIX):
+        header, _, body = stored.partition(":")
+        version, data = int(header[len(_TEXT_PREFIX):]), zlib.decompress(base64.b64decode(body))
+    else:
+        return json.loads(stored)
+
+    decoded = json.loads(data.decode("utf-8"))
+    if version == 0:
+        return decoded
+    if version == 1:
+        return _rows(decoded)
+    raise ValueError(f"Version d'encodage des résultats inconnue: {version}")
@@ -0,0 +1,78 @@
+"""
+Recherche inversée : partir d'une destination pour trouver les dates et aéroports
+de départ les moins chers
+Seules les routes demandées (origine -> destination) sont interrogées, via le
+calendrier des prix : le coût est d'une requête par route et par mois, au lieu d'un
+balayage complet depuis chaque origine pour chaque date.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fare_cache import FareFetcher
+from flex_search import months_between, daily_fares
+
+# Origines candidates au plus par recherche (après expansion des codes ville)
+MAX_ORIGINS = 12
+
+
+def estimate_queries(nb_origins: int, date_from: date, date_to: date, include_return: bool = False) -> int:
+    """Requêtes API au plus d'une recherche : une par route et par mois"""
+    return nb_origins * (2 if include_return else 1) * len(months_between(date_from, date_to))
+
+
+def _grid(fares_by_origin: Dict[str, Dict[date, Dict[str, Any]]],
+          date_from: date, date_to: date) -> List[Dict[str, Any]]:
+    """Grille jour par jour : prix par origine et meilleure origine du jour"""
+    grid = []
+    day = date_from
+    while day <= date_to:
+        prices = {
+            origin: fares[day]["price"]
+            for origin, fares in fares_by_origin.items()
+            if day in fares
+        }
+        best = min(prices, key=prices.get) if prices else None
+        grid.append({
+            "date": day.isoformat(),
+            "prix": prices,
+            "meilleure_origine": best,
+            "meilleur_prix": prices[best] if best else None,
+        })
+        day += timedelta(days=1)
+    return grid
+
+
+def search_destination(destination: str, origins: List[str], date_from: date, date_to: date,
+                       include_return: bool = False) -> Tuple[Dict[str, Any], int]:
+    """
+    Grilles des prix les moins chers par jour pour rejoindre destination depuis chaque
+    origine (et en revenir si include_return). Les routes sont lues en parallèle.
+    Retourne ({"aller": grille, "retour": grille}, requêtes API).
+    """
+    legs = [(origin, destination) for origin in origins]
+    if include_return:
+        legs += [(destination, origin) for origin in origins]
+    fetchers = [FareFetcher() for _ in legs]
+
+    def fetch(index: int) -> Optional[Dict[date, Dict[str, Any]]]:
+        airport, arrival = legs[index]
+        try:
+            return daily_fares(fetchers[index], airport, arrival, date_from, date_to)
+        except Exception as e:
+            print(f"  Erreur calendrier {airport}-{arrival}: {e}")
+            return None
+
+    # Un contexte copié par route : les appels restent rattachés à la trace de la requête
+    with ThreadPoolExecutor(max_workers=min(len(legs), 8) or 1) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, fetch, i) for i in range(len(legs))]
+        results = [future.result() for future in futures]
+
+    outbound = {origin: fares for (origin, _), fares in zip(legs[:len(origins)], results) if fares}
+    inbound = {origin: fares for (_, origin), fares in zip(legs[len(origins):], results[len(origins):]) if fares}
+    grids = {
+        "aller": _grid(outbound, date_from, date_to),
+        "retour": _grid(inbound, date_from, date_to) if include_return else [],
+    }
+    return grids, sum(f.num_queries for f in fetchers)
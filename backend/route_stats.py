@@ -0,0 +1,46 @@
+"""
+Cache des statistiques de prix par route (prix moyen sur 30 jours)
+Évite un appel RPC Supabase par voyage enrichi
+"""
+import os
+from typing import Callable, Optional
+
+from ttl_cache import TTLCache
+
+ROUTE_STATS_TTL_SECONDS = int(os.getenv("FLIGHTWATCHER_ROUTE_STATS_TTL", "21600"))  # 6h
+
+# Clé: (aéroport de départ, destination) -> prix moyen (ou None si pas d'historique)
+_avg_price_cache = TTLCache(max_size=5000, ttl_seconds=ROUTE_STATS_TTL_SECONDS)
+
+
+def get_avg_price(departure_airport: str, destination_code: str,
+                  loader: Callable[[str, str], Optional[float]]) -> Optional[float]:
+    """
+    Retourne le prix moyen d'une route depuis le cache, ou le charge via loader.
+    Les absences d'historique (None) sont aussi mises en cache ; une erreur du loader
+    retourne None sans le mettre en cache (nouvel essai au prochain appel).
+    """
+    key = (departure_airport, destination_code)
+    try:
+        return _avg_price_cache.get_or_load(key, lambda: loader(departure_airport, destination_code))
+    except Exception as e:
+        print(f"⚠️ Erreur récupération prix moyen {departure_airport}-{destination_code}: {e}")
+        return None
+
+
+def set_avg_price(departure_airport: str, destination_code: str, avg_price: Optional[float]) -> None:
+    _avg_price_cache.set((departure_airport, destination_code), avg_price)
+
+
+def export_snapshot() -> list:
+    """Entrées du cache pour le snapshot : [[départ, destination, prix_moyen, expires_at]]"""
+    return [[dep, dest, value, exp] for (dep, dest), value, exp in _avg_price_cache.items()]
+
+
+def restore_snapshot(entries: list) -> int:
+    """Réinsère les entrées d'un snapshot encore valides ; retourne le nombre restauré"""
+    return sum(_avg_price_cache.restore((dep, dest), value, exp) for dep, dest, value, exp in entries)
+
+
+def stats() -> dict:
+    return _avg_price_cache.stats()
@@ -0,0 +1,227 @@
+"""
+Transport HTTP partagé pour le client Ryanair
+ryanair-py ouvre une nouvelle session (et visite la page d'accueil pour les cookies)
+à chaque instanciation : chaque scan repartait de connexions froides. Ici, une seule
+session par processus : pool de connexions borné, keep-alive, HTTP/2 si le paquet h2
+est installé (httpx), sinon requests avec un pool urllib3. Cookies récupérés une fois.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from ryanair import Ryanair
+from ryanair.SessionManager import SessionManager
+
+import request_trace
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401 (active HTTP/2 dans httpx)
+    HTTP2_AVAILABLE = HTTPX_AVAILABLE
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Connexions simultanées max vers l'API (au-delà, les requêtes attendent une connexion libre)
+POOL_SIZE = int(os.getenv("FLIGHTWATCHER_UPSTREAM_POOL_SIZE", "20"))
+# Durée de conservation d'une connexion inactive (secondes)
+KEEPALIVE_SECONDS = float(os.getenv("FLIGHTWATCHER_UPSTREAM_KEEPALIVE", "60"))
+# Timeout d'une requête, attente d'une connexion du pool comprise (secondes)
+TIMEOUT_SECONDS = float(os.getenv("FLIGHTWATCHER_UPSTREAM_TIMEOUT", "15"))
+# Rafraîchissement des cookies de session (secondes)
+COOKIE_REFRESH_SECONDS = int(os.getenv("FLIGHTWATCHER_UPSTREAM_COOKIE_REFRESH", "1800"))
+
+
+class UpstreamTransport:
+    """
+    Session HTTP du processus, utilisée par tous les clients Ryanair.
+    Expose get(url, params) comme la session requests attendue par ryanair-py.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self._cookies_at = 0.0
+        self._refreshing_cookies = False
+        self._latencies: deque = deque(maxlen=1000)
+        self._counters = {"requests": 0, "errors": 0, "connections_opened": 0, "tls_handshakes": 0}
+        self._http_versions: Dict[str, int] = {}
+        # Compteurs mis à jour par tous les threads de scan (+= n'est pas atomique)
+        self._counters_lock = threading.Lock()
+
+    def _build_client(self):
+        if HTTPX_AVAILABLE:
+            return httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE,
+                                    keepalive_expiry=KEEPALIVE_SECONDS),
+                timeout=httpx.Timeout(TIMEOUT_SECONDS),
+                follow_redirects=True,
+            )
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, pool_block=True)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _ensure_client(self):
+        """Client HTTP courant (créé au premier appel) ; l'appelant garde cette référence"""
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+                client = self._client
+        return client
+
+    def _refresh_cookies(self, client) -> None:
+        """
+        Visite la page d'accueil si les cookies ont expiré. Un seul thread s'en charge, hors
+        du verrou : les autres requêtes continuent avec les cookies actuels pendant ce temps.
+        """
+        if time.time() - self._cookies_at <= COOKIE_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if self._refreshing_cookies or time.time() - self._cookies_at <= COOKIE_REFRESH_SECONDS:
+                return
+            self._refreshing_cookies = True
+        try:
+            client.get(SessionManager.BASE_SITE_FOR_SESSION_URL, timeout=TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"⚠️ Erreur récupération des cookies Ryanair: {e}")
+        finally:
+            self._cookies_at = time.time()
+            self._refreshing_cookies = False
+
+    def get_session(self) -> "UpstreamTransport":
+        """Compatibilité SessionManager : crée le client au premier appel"""
+        self._refresh_cookies(self._ensure_client())
+        return self
+
+    def _count(self, name: str) -> None:
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        # Événements httpcore : une connexion neuve passe par connect_tcp (et start_tls en HTTPS)
+        if event == "connection.connect_tcp.complete":
+            self._count("connections_opened")
+        elif event == "connection.start_tls.complete":
+            self._count("tls_handshakes")
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None):
+        # Référence lue une fois : close() peut remettre self._client à None pendant l'appel
+        client = self._ensure_client()
+        self._refresh_cookies(client)
+        started = time.perf_counter()
+        self._count("requests")
+        try:
+            if HTTPX_AVAILABLE:
+                response = client.get(url, params=params, extensions={"trace": self._trace})
+                version = response.http_version
+            else:
+                response = client.get(url, params=params, timeout=TIMEOUT_SECONDS)
+                version = "HTTP/1.1"
+        except Exception:
+            self._count("errors")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._counters_lock:
+                self._latencies.append(elapsed)
+        with self._counters_lock:
+            self._http_versions[version] = self._http_versions.get(version, 0) + 1
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+                self._cookies_at = 0.0
+
+    def _pool_connections(self) -> Optional[int]:
+        client = self._client
+        if client is None:
+            return 0
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+            http_versions = dict(self._http_versions)
+        requests_sent = counters["requests"]
+        opened = counters["connections_opened"]
+        return {
+            "backend": "httpx" if HTTPX_AVAILABLE else "requests",
+            "http2": HTTP2_AVAILABLE,
+            "pool_size": POOL_SIZE,
+            "pool_connections": self._pool_connections(),
+            **counters,
+            # Part des requêtes servies par une connexion déjà ouverte (httpx uniquement)
+            "reuse_ratio": round(1 - opened / requests_sent, 3) if HTTPX_AVAILABLE and requests_sent else None,
+            "http_versions": http_versions,
+            "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None,
+        }
+
+
+_transport = UpstreamTransport()
+
+
+class SharedRyanair(Ryanair):
+    """Client Ryanair sans session propre : toutes les instances partagent le transport du processus"""
+
+    def __init__(self, currency: Optional[str] = None):
+        self.currency = currency
+        self._num_queries = 0
+        self.session_manager = _transport
+        self.session = _transport.get_session()
+
+    def _retryable_query(self, url, params=None):
+        recorder = request_trace.recorder
+        if not recorder.enabled:
+            return super()._retryable_query(url, params)
+        # Trace active : latence (retries compris) et forme de la réponse
+        started = time.perf_counter()
+        try:
+            data = super()._retryable_query(url, params)
+        except Exception as e:
+            recorder.record_upstream(url, params, time.perf_counter() - started, error=e)
+            raise
+        recorder.record_upstream(url, params, time.perf_counter() - started, data)
+        return data
+
+
+# Classe des clients créés par new_client (remplacée par un bouchon pour rejouer une trace)
+_client_class = SharedRyanair
+
+
+def set_client_class(client_class: Optional[type]) -> None:
+    """Remplace la classe des clients Ryanair (None : client partagé par défaut)"""
+    global _client_class
+    _client_class = client_class or SharedRyanair
+
+
+def new_client(currency: str = "EUR") -> Ryanair:
+    """Client Ryanair léger (compteur de requêtes propre, connexions partagées)"""
+    return _client_class(currency=currency)
+
+
+def get_transport() -> UpstreamTransport:
+    return _transport
+
+
+def stats() -> Dict[str, Any]:
+    return _transport.stats()
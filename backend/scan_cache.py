@@ -0,0 +1,415 @@
+"""
+Cache des résultats de scan (/api/scan) avec durée de vie adaptative
+- TTL calculé selon la proximité du départ et la volatilité observée des prix
+  (price_history local) au lieu d'une heure fixe
+- stale-while-revalidate : une entrée périmée mais encore dans sa fenêtre de grâce
+  est servie immédiatement et rafraîchie en arrière-plan
+- Subsomption : une requête plus restrictive (budget plus bas, destinations exclues en plus,
+  destinations incluses en moins) est dérivée d'un résultat plus large déjà en cache
+- Niveaux : stockage local SQLite -> search_results_cache (Supabase)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from airport_index import expand_origins
+from fare_store import get_fare_store
+from result_codec import decode_results, encode_results_text
+from ttl_cache import TTLCache
+
+# Paliers de TTL selon le nombre de jours avant le premier départ : (jours max, secondes)
+TTL_TIERS = [
+    (3, 10 * 60),
+    (7, 20 * 60),
+    (30, 60 * 60),
+    (90, 3 * 3600),
+]
+MAX_TTL_SECONDS = int(os.getenv("FLIGHTWATCHER_SCAN_CACHE_MAX_TTL", str(6 * 3600)))
+MIN_TTL_SECONDS = int(os.getenv("FLIGHTWATCHER_SCAN_CACHE_MIN_TTL", "300"))
+# Fenêtre de grâce (stale-while-revalidate) : fraction du TTL, plafonnée
+STALE_FRACTION = 0.5
+MAX_STALE_SECONDS = int(os.getenv("FLIGHTWATCHER_SCAN_CACHE_MAX_STALE", "1800"))
+# En dessous de ce délai avant le départ, jamais de résultat périmé
+NO_STALE_WITHIN_DAYS = 2
+# Part du délai moyen entre deux changements de prix qu'on accepte de servir sans re-scanner
+VOLATILITY_FRACTION = 0.5
+
+# Taux de changement de prix par aéroport de départ (recalculé toutes les heures)
+_change_rates = TTLCache(max_size=500, ttl_seconds=3600)
+
+
+def _days_until_departure(request: Dict[str, Any], today: Optional[date] = None) -> Optional[int]:
+    days = []
+    for entry in request.get("dates_depart") or []:
+        try:
+            days.append((date.fromisoformat(str(entry["date"])[:10]) - (today or date.today())).days)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return min(days) if days else None
+
+
+def _price_change_rate(departure_airport: str) -> Optional[float]:
+    """Changements de prix par heure observés au départ de l'aéroport (None si inconnu)"""
+    store = get_fare_store()
+    if not store:
+        return None
+
+    def load():
+        try:
+            return store.get_price_change_rate(departure_airport)
+        except Exception as e:
+            print(f"⚠️ Erreur calcul volatilité {departure_airport}: {e}")
+            return None
+    return _change_rates.get_or_load(departure_airport, load)
+
+
+def compute_ttl(request: Dict[str, Any], today: Optional[date] = None) -> Tuple[int, int]:
+    """
+    Retourne (ttl, fenêtre de grâce) en secondes pour une requête de scan.
+    Plus le départ est proche et la route volatile, plus le TTL est court.
+    """
+    days = _days_until_departure(request, today)
+    ttl = MAX_TTL_SECONDS
+    if days is not None:
+        for max_days, seconds in TTL_TIERS:
+            if days <= max_days:
+                ttl = seconds
+                break
+
+    rate = _price_change_rate(request.get("aeroport_depart") or "BVA")
+    if rate:
+        ttl = min(ttl, VOLATILITY_FRACTION * 3600 / rate)
+    ttl = int(max(MIN_TTL_SECONDS, min(ttl, MAX_TTL_SECONDS)))
+
+    if days is not None and days <= NO_STALE_WITHIN_DAYS:
+        return ttl, 0
+    return ttl, int(min(ttl * STALE_FRACTION, MAX_STALE_SECONDS))
+
+
+# ==================== SUBSOMPTION ====================
+
+def _canonical_dates(entries: Optional[List[Dict[str, Any]]]) -> List[Tuple[str, str, str]]:
+    return sorted(
+        (str(entry["date"])[:10], entry.get("heure_min") or "00:00", entry.get("heure_max") or "23:59")
+        for entry in entries or []
+    )
+
+
+def scan_family_key(request: Dict[str, Any]) -> str:
+    """
+    Clé de famille : aéroport et fenêtres de dates/horaires, sans budget ni filtres de
+    destinations. Deux requêtes d'une même famille interrogent les mêmes segments.
+    """
+    family = {
+        "departure_airport": request.get("aeroport_depart") or "BVA",
+        "origins": sorted(expand_origins(request["aeroports_depart"])) if request.get("aeroports_depart") else None,
+        "same_return_airport": bool(request.get("meme_aeroport_retour")),
+        "dates_depart": _canonical_dates(request.get("dates_depart")),
+        "dates_retour": _canonical_dates(request.get("dates_retour")),
+    }
+    return hashlib.md5(json.dumps(family, sort_keys=True).encode()).hexdigest()
+
+
+def scan_filters(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Partie filtrable localement d'une requête de scan (forme normalisée)"""
+    included = request.get("destinations_incluses")
+    return {
+        "budget_max": request.get("budget_max") or 200,
+        "limite_allers": request.get("limite_allers") or 50,
+        "destinations_exclues": sorted(set(request.get("destinations_exclues") or [])),
+        "destinations_incluses": sorted(set(included)) if included is not None else None,
+    }
+
+
+def covers(meta: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """
+    Vrai si le résultat décrit par meta contient exactement la réponse à filters une fois filtré.
+    Le scan garde les limite_allers allers les moins chers : baisser le budget ne change pas
+    cette sélection, mais restreindre les destinations oui, sauf si aucune n'a été écartée
+    (candidates = destinations aller retenues avant la limite).
+    """
+    if filters["budget_max"] > meta["budget_max"]:
+        return False
+    if not set(meta["destinations_exclues"]) <= set(filters["destinations_exclues"]):
+        return False
+    if meta["destinations_incluses"] is not None and (
+        filters["destinations_incluses"] is None
+        or not set(filters["destinations_incluses"]) <= set(meta["destinations_incluses"])
+    ):
+        return False
+
+    same_selection = (
+        meta["destinations_exclues"] == filters["destinations_exclues"]
+        and meta["destinations_incluses"] == filters["destinations_incluses"]
+        and meta["limite_allers"] == filters["limite_allers"]
+    )
+    if same_selection:
+        return True
+    candidates = meta.get("candidates")
+    return candidates is not None and candidates <= min(meta["limite_allers"], filters["limite_allers"])
+
+
+def derive_results(results: List[Dict[str, Any]], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Applique budget et filtres de destinations à un résultat plus large"""
+    excluded = set(filters["destinations_exclues"])
+    included = set(filters["destinations_incluses"]) if filters["destinations_incluses"] is not None else None
+    return [
+        trip for trip in results
+        if trip["prix_total"] <= filters["budget_max"]
+        and trip["destination_code"] not in excluded
+        and (included is None or trip["destination_code"] in included)
+    ]
+
+
+def _parse_timestamp(value: str) -> float:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class ScanCache:
+    """Lecture / écriture des résultats de scan sur les deux niveaux de cache"""
+
+    def __init__(self, supabase_getter: Optional[Callable[[], Any]] = None):
+        self.supabase_getter = supabase_getter
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._counters = {
+            "fresh_hits": 0, "stale_hits": 0, "local_hits": 0, "supabase_hits": 0, "derived_hits": 0,
+            "misses": 0, "revalidations": 0, "revalidations_partial": 0, "revalidation_errors": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _supabase(self):
+        if self.supabase_getter is None:
+            return None
+        return self.supabase_getter()
+
+    # ---------- Lecture ----------
+
+    def lookup(self, cache_key: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Cherche un résultat servable : {"results", "tier", "stale", "derived"}.
+        Ordre : clé exacte en local, dérivation d'un résultat plus large en local, clé exacte Supabase.
+        None si absent ou au-delà de la fenêtre de grâce.
+        """
+        entry = self._lookup_local(cache_key)
+        if entry is None:
+            entry = self._lookup_derived(request)
+        if entry is None:
+            entry = self._lookup_supabase(cache_key, request)
+        if entry is None:
+            self._count("misses")
+            return None
+
+        self._count("stale_hits" if entry["stale"] else "fresh_hits")
+        self._count("derived_hits" if entry["derived"] else f"{entry['tier']}_hits")
+        return entry
+
+    def peek(self, cache_key: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Même recherche que lookup(), en lecture seule : ni compteurs, ni hit_count
+        Supabase, ni réchauffage du cache local (estimations de coût).
+        """
+        return (self._lookup_local(cache_key, read_only=True)
+                or self._lookup_derived(request, read_only=True)
+                or self._lookup_supabase(cache_key, request, read_only=True))
+
+    def _lookup_local(self, cache_key: str, read_only: bool = False) -> Optional[Dict[str, Any]]:
+        store = get_fare_store()
+        if not store:
+            return None
+        try:
+            cached = store.get_scan_results(cache_key)
+        except Exception as e:
+            print(f"⚠️ Erreur lecture cache local: {e}")
+            return None
+        if not cached:
+            return None
+        if not read_only:
+            print(f"✅ Résultats récupérés depuis le cache local (clé: {cache_key[:8]}...)")
+        return {
+            "results": cached["results"],
+            "tier": "local",
+            "stale": cached["fresh_until"] <= time.time(),
+            "derived": False,
+        }
+
+    def _lookup_derived(self, request: Dict[str, Any], read_only: bool = False) -> Optional[Dict[str, Any]]:
+        store = get_fare_store()
+        if not store:
+            return None
+        try:
+            family = store.find_scan_family(scan_family_key(request))
+        except Exception as e:
+            print(f"⚠️ Erreur lecture cache local: {e}")
+            return None
+
+        filters = scan_filters(request)
+        now = time.time()
+        supersets = [entry for entry in family if covers(entry["meta"], filters)]
+        if not supersets:
+            return None
+        # Préférer une entrée fraîche, puis la plus récente
+        best = max(supersets, key=lambda entry: (entry["fresh_until"] > now, entry["created_at"]))
+        if not read_only:
+            print(f"✅ Résultats dérivés d'un scan plus large en cache (clé: {best['cache_key'][:8]}...)")
+        return {
+            "results": derive_results(best["results"], filters),
+            "tier": "local",
+            "stale": best["fresh_until"] <= now,
+            "derived": True,
+        }
+
+    def _lookup_supabase(self, cache_key: str, request: Dict[str, Any],
+                         read_only: bool = False) -> Optional[Dict[str, Any]]:
+        try:
+            supabase_service = self._supabase()
+            if not supabase_service:
+                return None
+            now = time.time()
+            cache_result = supabase_service.table("search_results_cache")\
+                .select("results, created_at, expires_at, hit_count")\
+                .eq("cache_key", cache_key)\
+                .gt("expires_at", _iso(now))\
+                .execute()
+            if not cache_result.data:
+                return None
+
+            cached = cache_result.data[0]
+            # Entrées encodées (result_codec) ou anciennes listes JSON
+            cached["results"] = decode_results(cached["results"])
+            # expires_at inclut la fenêtre de grâce : la fraîcheur se recalcule depuis created_at
+            created_at = _parse_timestamp(cached["created_at"])
+            expires_at = _parse_timestamp(cached["expires_at"])
+            ttl, _ = compute_ttl(request)
+            fresh_until = min(created_at + ttl, expires_at)
+            if read_only:
+                return {"results": cached["results"], "tier": "supabase", "stale": fresh_until <= now, "derived": False}
+
+            supabase_service.table("search_results_cache")\
+                .update({
+                    "hit_count": (cached.get("hit_count", 0) or 0) + 1,
+                    "last_hit_at": _iso(now)
+                })\
+                .eq("cache_key", cache_key)\
+                .execute()
+            print(f"✅ Résultats récupérés depuis le cache (hit #{(cached.get('hit_count', 0) or 0) + 1})")
+
+            # Réchauffer le cache local pour les prochains appels
+            store = get_fare_store()
+            if store and cached["results"]:
+                store.put_scan_results(
+                    cache_key, request.get("aeroport_depart") or "BVA", request, cached["results"],
+                    max(fresh_until - now, 0), expires_at - max(fresh_until, now),
+                    family_key=scan_family_key(request), meta=scan_filters(request)
+                )
+            return {"results": cached["results"], "tier": "supabase", "stale": fresh_until <= now, "derived": False}
+        except Exception as e:
+            print(f"⚠️ Erreur vérification cache: {e}")
+            return None
+
+    # ---------- Écriture ----------
+
+    def store(self, cache_key: str, request: Dict[str, Any], results: List[Dict[str, Any]],
+              candidates: Optional[int] = None) -> None:
+        """
+        Met en cache des résultats sur les deux niveaux avec le TTL adaptatif.
+        candidates (destinations aller retenues avant limite_allers) permet de dériver
+        aussi les requêtes qui restreignent les destinations.
+        """
+        if not results:
+            return
+        ttl, stale = compute_ttl(request)
+        departure_airport = request.get("aeroport_depart") or "BVA"
+
+        store = get_fare_store()
+        if store:
+            try:
+                store.put_scan_results(
+                    cache_key, departure_airport, request, results, ttl, stale,
+                    family_key=scan_family_key(request),
+                    meta={**scan_filters(request), "candidates": candidates}
+                )
+            except Exception as e:
+                print(f"⚠️ Erreur mise en cache locale: {e}")
+
+        try:
+            supabase_service = self._supabase()
+            if supabase_service:
+                now = time.time()
+                supabase_service.table("search_results_cache")\
+                    .upsert({
+                        "cache_key": cache_key,
+                        "departure_airport": departure_airport,
+                        "budget_max": request.get("budget_max") or 200,
+                        "dates_depart": request.get("dates_depart") or [],
+                        "dates_retour": request.get("dates_retour") or [],
+                        "results": encode_results_text(results),
+                        "created_at": _iso(now),
+                        "expires_at": _iso(now + ttl + stale),
+                        "hit_count": 0
+                    }, on_conflict="cache_key")\
+                    .execute()
+                print(f"✅ Résultats mis en cache pour {ttl // 60} min (clé: {cache_key[:8]}...)")
+        except Exception as e:
+            print(f"⚠️ Erreur mise en cache: {e}")
+
+    # ---------- Rafraîchissement ----------
+
+    def revalidate(self, cache_key: str, request: Dict[str, Any],
+                   refresh: Callable[[], Tuple[List[Dict[str, Any]], Optional[int], List[Dict[str, Any]]]]) -> bool:
+        """
+        Relance le scan en arrière-plan pour une entrée périmée.
+        refresh retourne (résultats, candidates, segments_ignores) ; un scan partiel
+        (segments ignorés) n'est pas stocké, l'entrée périmée reste servie.
+        Un seul rafraîchissement par clé à la fois ; retourne False s'il est déjà en cours.
+        """
+        with self._lock:
+            if cache_key in self._refreshing:
+                return False
+            self._refreshing.add(cache_key)
+
+        def run():
+            try:
+                results, candidates, segments_ignores = refresh()
+                if segments_ignores:
+                    self._count("revalidations_partial")
+                    print(f"⚠️ Rafraîchissement partiel ignoré (clé: {cache_key[:8]}..., "
+                          f"{len(segments_ignores)} segment(s) ignoré(s))")
+                    return
+                self.store(cache_key, request, results, candidates)
+                self._count("revalidations")
+            except Exception as e:
+                self._count("revalidation_errors")
+                print(f"⚠️ Erreur rafraîchissement cache (clé: {cache_key[:8]}...): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+
+        threading.Thread(target=run, name=f"scan-revalidate-{cache_key[:8]}", daemon=True).start()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            refreshing = len(self._refreshing)
+        lookups = counters["fresh_hits"] + counters["stale_hits"] + counters["misses"]
+        hits = counters["fresh_hits"] + counters["stale_hits"]
+        return {
+            **counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "refreshing": refreshing,
+        }
@@ -0,0 +1,237 @@
+"""
+File de jobs de scan asynchrones
+Un scan soumis reçoit un identifiant et s'exécute sur un worker en arrière-plan :
+le client interroge (ou s'abonne à) l'état du job au lieu de garder une requête
+HTTP ouverte. Les résultats partiels et finaux sont persistés dans le stockage local,
+un job peut être annulé, et la profondeur de file, l'attente et la durée d'exécution
+sont mesurées.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from fare_store import get_fare_store
+
+# Nombre de workers exécutant les scans en parallèle
+DEFAULT_WORKERS = int(os.getenv("FLIGHTWATCHER_SCAN_WORKERS", "2"))
+# Durée pendant laquelle un job terminé reste en mémoire (ensuite lu depuis le stockage local)
+FINISHED_IN_MEMORY_SECONDS = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobContext:
+    """Passé au runner : publication de la progression et test d'annulation"""
+
+    def __init__(self, queue_: "ScanJobQueue", job_id: str):
+        self._queue = queue_
+        self.job_id = job_id
+
+    def progress(self, done: int, total: int, partial_results: List[Dict[str, Any]]) -> None:
+        self._queue._update(self.job_id, progress={"done": done, "total": total},
+                            results=list(partial_results))
+
+    def skipped(self, segments: List[str]) -> None:
+        """Segments non obtenus : le job se termine avec des résultats partiels"""
+        with self._queue._lock:
+            progress = dict(self._queue._jobs[self.job_id].get("progress") or {})
+        progress["segments_ignores"] = list(segments)
+        self._queue._update(self.job_id, progress=progress)
+
+    def cancelled(self) -> bool:
+        return self.job_id in self._queue._cancel_requested
+
+
+def _percentiles(values) -> Dict[str, Optional[float]]:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50_ms": None, "p95_ms": None}
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+    }
+
+
+class ScanJobQueue:
+    """
+    File en mémoire + workers (threads). L'état des jobs est aussi écrit dans le
+    stockage local : il survit à la connexion du client et à un redémarrage.
+    runner(request, context) -> (résultats, nombre de requêtes API)
+    """
+
+    def __init__(self, runner: Callable[[Dict[str, Any], JobContext], Any], workers: int = DEFAULT_WORKERS):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._cancel_requested: set = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._running = 0
+        self._wait_times: deque = deque(maxlen=500)
+        self._run_times: deque = deque(maxlen=500)
+        self._counters = {"submitted": 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+
+    # ---------- Workers ----------
+
+    def start(self) -> None:
+        """Démarre les workers et reprend les jobs restés en file (ou interrompus)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        store = get_fare_store()
+        if store:
+            try:
+                for job in store.get_jobs_by_status([QUEUED, RUNNING]):
+                    job.update(status=QUEUED, started_at=None)
+                    with self._lock:
+                        self._jobs[job["job_id"]] = job
+                    self._queue.put(job["job_id"])
+            except Exception as e:
+                print(f"⚠️ Erreur reprise des jobs de scan: {e}")
+
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f"scan-worker-{index}", daemon=True).start()
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"⚠️ Erreur worker de scan ({job_id[:8]}): {e}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str) -> None:
+        # Passage QUEUED -> RUNNING sous le verrou : une annulation concurrente n'est pas écrasée
+        started = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return
+            job.update(status=RUNNING, started_at=started)
+            self._running += 1
+            job = dict(job)
+        self._wait_times.append(started - job["submitted_at"])
+        self._update(job_id)
+        try:
+            results, num_queries = self.runner(job["request"], JobContext(self, job_id))
+            status = CANCELLED if job_id in self._cancel_requested else DONE
+            self._update(job_id, status=status, results=results, num_queries=num_queries)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e))
+        finally:
+            finished = time.time()
+            self._run_times.append(finished - started)
+            with self._lock:
+                self._running -= 1
+                self._cancel_requested.discard(job_id)
+                self._counters[self._jobs[job_id]["status"]] += 1
+            self._update(job_id, finished_at=finished)
+
+    # ---------- État ----------
+
+    def _update(self, job_id: str, **changes) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            job["version"] = job.get("version", 0) + 1
+            snapshot = dict(job)
+        store = get_fare_store()
+        if store:
+            try:
+                store.put_job(snapshot)
+            except Exception as e:
+                print(f"⚠️ Erreur persistance job {job_id[:8]}: {e}")
+
+    def _prune(self) -> None:
+        limit = time.time() - FINISHED_IN_MEMORY_SECONDS
+        with self._lock:
+            for job_id in [jid for jid, job in self._jobs.items()
+                           if job["status"] in FINISHED_STATUSES and (job["finished_at"] or 0) < limit]:
+                del self._jobs[job_id]
+
+    def submit(self, request: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
+        """Ajoute un job à la file ; owner (clé du client) restreint la lecture et l'annulation"""
+        self.start()
+        self._prune()
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "request": request,
+            "results": None,
+            "progress": None,
+            "error": None,
+            "num_queries": 0,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "owner": owner,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._counters["submitted"] += 1
+        self._update(job_id)
+        self._queue.put(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """État d'un job (mémoire, sinon stockage local pour les jobs d'un processus précédent)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        store = get_fare_store()
+        return store.get_job(job_id) if store else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Annule un job en file (immédiat) ou en cours (au prochain point de contrôle)"""
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        with self._lock:
+            if job_id not in self._jobs:
+                return job
+            if self._jobs[job_id]["status"] == QUEUED:
+                self._jobs[job_id]["status"] = CANCELLED
+                self._counters[CANCELLED] += 1
+                cancelled_now = True
+            else:
+                self._cancel_requested.add(job_id)
+                cancelled_now = False
+        if cancelled_now:
+            self._update(job_id, finished_at=time.time())
+        return self.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Position dans la file (0 = prochain à partir), None si le job n'attend pas"""
+        with self._lock:
+            waiting = [jid for jid in list(self._queue.queue) if self._jobs.get(jid, {}).get("status") == QUEUED]
+        return waiting.index(job_id) if job_id in waiting else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job["status"] == QUEUED)
+            running = self._running
+            counters = dict(self._counters)
+        return {
+            "workers": self.workers,
+            "queue_depth": queued,
+            "running": running,
+            **counters,
+            "wait_time": _percentiles(self._wait_times),
+            "run_time": _percentiles(self._run_times),
+        }
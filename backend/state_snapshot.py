@@ -0,0 +1,227 @@
+"""
+Snapshot des caches mémoire chauds (reprise après redémarrage)
+Les structures chaudes du processus (tarifs L1, index des aéroports, graphe des
+destinations, prix moyens des routes) sont écrites dans un fichier local à l'arrêt et
+périodiquement, puis relues au démarrage avant le warm-up : un redémarrage ne repart
+pas d'un cache vide (pas de pic de latence ni de rafale d'appels amont).
+
+Format : en-tête fixe (magic, version, taille de l'en-tête JSON), en-tête JSON
+(date de création, sections : position, taille, entrées, empreinte), puis une section
+JSON compressée (zlib) par structure. La relecture passe par mmap : seules les sections
+connues et valides sont décompressées.
+Fraîcheur : fichier ignoré au-delà de FLIGHTWATCHER_SNAPSHOT_MAX_AGE ; section ignorée
+si son empreinte a changé (ex. airports.csv modifié) ; chaque entrée garde son échéance
+d'origine et n'est réinsérée que si elle n'a pas expiré.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'data', 'state_snapshot.bin')
+SNAPSHOT_PATH = os.getenv("FLIGHTWATCHER_SNAPSHOT_FILE", DEFAULT_SNAPSHOT_PATH).strip()
+# Intervalle des sauvegardes périodiques (0 = seulement à l'arrêt)
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("FLIGHTWATCHER_SNAPSHOT_SECONDS", "300"))
+# Âge max d'un snapshot relu au démarrage (6h, durée de vie du graphe des destinations)
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("FLIGHTWATCHER_SNAPSHOT_MAX_AGE", "21600"))
+
+MAGIC = b"FWSNAP"
+FORMAT_VERSION = 1
+# magic, version, taille de l'en-tête JSON
+_PREFIX = struct.Struct("<6sHI")
+# Compression rapide : la sauvegarde périodique tourne dans le processus de l'API
+_COMPRESS_LEVEL = 1
+
+
+class _Section:
+    def __init__(self, export: Callable[[], Any], restore: Callable[[Any], int],
+                 fingerprint: Optional[Callable[[], Any]] = None):
+        self.export = export
+        self.restore = restore
+        self.fingerprint = fingerprint
+
+
+class StateSnapshot:
+    def __init__(self, path: str = SNAPSHOT_PATH, interval_seconds: int = SNAPSHOT_INTERVAL_SECONDS,
+                 max_age_seconds: int = SNAPSHOT_MAX_AGE_SECONDS):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self._sections: Dict[str, _Section] = {}
+        self._save_lock = threading.Lock()
+        self._started = False
+        self._last_save: Optional[Dict[str, Any]] = None
+        self._last_restore: Optional[Dict[str, Any]] = None
+        self._counters = {"saves": 0, "save_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.path.lower() not in ("", "none", "off", "0", "false")
+
+    def register(self, name: str, export: Callable[[], Any], restore: Callable[[Any], int],
+                 fingerprint: Optional[Callable[[], Any]] = None) -> None:
+        """
+        Enregistre une structure : export() -> données JSON (None = rien à écrire),
+        restore(données) -> nombre d'entrées reprises, fingerprint() -> empreinte de la
+        source (section ignorée à la relecture si elle a changé).
+        """
+        self._sections[name] = _Section(export, restore, fingerprint)
+
+    # ---------- Sauvegarde ----------
+
+    def save(self) -> Optional[Dict[str, Any]]:
+        """Écrit le snapshot (fichier temporaire puis remplacement atomique)"""
+        if not self.enabled:
+            return None
+        with self._save_lock:
+            start = time.perf_counter()
+            sections: Dict[str, Dict[str, Any]] = {}
+            blobs = []
+            offset = 0
+            for name, section in self._sections.items():
+                try:
+                    data = section.export()
+                    if data is None:
+                        continue
+                    blob = zlib.compress(
+                        json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8"),
+                        _COMPRESS_LEVEL,
+                    )
+                    fingerprint = section.fingerprint() if section.fingerprint else None
+                except Exception as e:
+                    print(f"⚠️ Snapshot: section '{name}' non sauvegardée: {e}")
+                    continue
+                sections[name] = {"offset": offset, "length": len(blob), "entries": len(data),
+                                  "fingerprint": fingerprint}
+                blobs.append(blob)
+                offset += len(blob)
+
+            header = json.dumps({"created_at": time.time(), "sections": sections}).encode("utf-8")
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+                    f.write(header)
+                    for blob in blobs:
+                        f.write(blob)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                self._counters["save_errors"] += 1
+                print(f"⚠️ Erreur écriture du snapshot {self.path}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return None
+
+            self._counters["saves"] += 1
+            self._last_save = {
+                "at": time.time(),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "bytes": _PREFIX.size + len(header) + offset,
+                "entries": {name: meta["entries"] for name, meta in sections.items()},
+            }
+            return self._last_save
+
+    def start(self) -> None:
+        """Lance la sauvegarde périodique en arrière-plan (FLIGHTWATCHER_SNAPSHOT_SECONDS)"""
+        if not self.enabled or self.interval_seconds <= 0 or self._started:
+            return
+        self._started = True
+
+        def loop():
+            while True:
+                time.sleep(self.interval_seconds)
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"⚠️ Erreur sauvegarde du snapshot: {e}")
+
+        threading.Thread(target=loop, name="state-snapshot", daemon=True).start()
+
+    # ---------- Relecture ----------
+
+    def restore(self) -> Dict[str, Any]:
+        """
+        Relit le snapshot et réinsère les sections valides (appelé au démarrage, avant le
+        warm-up). Un snapshot absent, illisible ou trop ancien est ignoré.
+        """
+        start = time.perf_counter()
+        report: Dict[str, Any] = {"status": "disabled", "restored": {}, "skipped": {}}
+        self._last_restore = report
+        if not self.enabled:
+            return report
+        if not os.path.exists(self.path):
+            report["status"] = "missing"
+            return report
+
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, header_len = _PREFIX.unpack_from(mm, 0)
+                if magic != MAGIC or version != FORMAT_VERSION:
+                    report["status"] = "incompatible"
+                    return report
+                header = json.loads(mm[_PREFIX.size:_PREFIX.size + header_len])
+                report["age_seconds"] = round(time.time() - header["created_at"], 1)
+                if report["age_seconds"] > self.max_age_seconds:
+                    report["status"] = "stale"
+                    return report
+
+                base = _PREFIX.size + header_len
+                view = memoryview(mm)
+                try:
+                    for name, meta in header["sections"].items():
+                        report["restored"][name], reason = self._restore_section(name, meta, view, base)
+                        if reason:
+                            report["skipped"][name] = reason
+                finally:
+                    view.release()
+            report["status"] = "ok"
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            report["status"] = "error"
+            report["error"] = str(e)
+            print(f"⚠️ Snapshot {self.path} illisible: {e}")
+        finally:
+            report["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        if report["status"] == "ok":
+            print(f"✅ Snapshot relu en {report['duration_ms']} ms "
+                  f"(âge {report['age_seconds']:.0f} s): {report['restored']}")
+        return report
+
+    def _restore_section(self, name: str, meta: Dict[str, Any], view: memoryview, base: int):
+        """(entrées reprises, raison du rejet ou None) d'une section du snapshot"""
+        section = self._sections.get(name)
+        if section is None:
+            return 0, "unknown"
+        if section.fingerprint is not None and section.fingerprint() != meta.get("fingerprint"):
+            return 0, "source_changed"
+        start = base + meta["offset"]
+        try:
+            data = json.loads(zlib.decompress(view[start:start + meta["length"]]))
+            return section.restore(data), None
+        except Exception as e:
+            print(f"⚠️ Snapshot: section '{name}' ignorée: {e}")
+            return 0, "error"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path if self.enabled else None,
+            "interval_seconds": self.interval_seconds,
+            "max_age_seconds": self.max_age_seconds,
+            "sections": list(self._sections),
+            "last_save": self._last_save,
+            "last_restore": self._last_restore,
+            **self._counters,
+        }
+
+
+snapshot = StateSnapshot()
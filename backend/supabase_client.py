@@ -2,10 +2,18 @@
 Client Supabase pour FlightWatcher
 """
 import os
+import threading
 from pathlib import Path
-from supabase import create_client, Client
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
+
+from lifecycle import lazy_import
+
+# Le SDK Supabase (httpx, gotrue, postgrest...) est lourd à importer :
+# il n'est chargé qu'à la création du premier client
+supabase_sdk = lazy_import("supabase")
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Charger le fichier .env depuis le répertoire du script
 env_path = Path(__file__).parent / '.env'
@@ -17,8 +25,21 @@ if not env_path.exists():
     print("   Créez un fichier .env avec SUPABASE_URL et SUPABASE_ANON_KEY")
     print("   Exécutez 'python backend/check_env.py' pour créer un fichier exemple")
 
-def get_supabase_client() -> Client:
-    """Crée et retourne un client Supabase avec la clé anon (pour opérations utilisateur)"""
+# Clients réutilisés pour toute la durée du processus
+_anon_client: Optional["Client"] = None
+_service_client: Optional["Client"] = None
+_service_key_warned = False
+_clients_lock = threading.Lock()
+
+def _create_client(url: str, key: str) -> "Client":
+    return supabase_sdk.create_client(url, key)
+
+def get_supabase_client() -> "Client":
+    """Retourne le client Supabase avec la clé anon (pour opérations utilisateur), créé au premier appel"""
+    global _anon_client
+    if _anon_client is not None:
+        return _anon_client
+    
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_ANON_KEY")
     
@@ -28,17 +49,24 @@ def get_supabase_client() -> Client:
             "Créez un fichier .env dans le dossier backend avec ces valeurs."
         )
     
-    return create_client(supabase_url, supabase_key)
+    with _clients_lock:
+        if _anon_client is None:
+            _anon_client = _create_client(supabase_url, supabase_key)
+    return _anon_client
 
-def get_supabase_service_client() -> Optional[Client]:
+def get_supabase_service_client() -> Optional["Client"]:
     """
-    Crée et retourne un client Supabase avec la clé service_role.
+    Retourne le client Supabase avec la clé service_role (créé au premier appel).
     Utilisé uniquement pour les opérations backend qui nécessitent de bypasser RLS :
     - Insertion dans price_history
     - Insertion/mise à jour dans search_results_cache
     
     IMPORTANT : Cette clé ne doit JAMAIS être exposée au frontend.
     """
+    global _service_client, _service_key_warned
+    if _service_client is not None:
+        return _service_client
+    
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
     
@@ -46,8 +74,13 @@ def get_supabase_service_client() -> Optional[Client]:
         raise ValueError("SUPABASE_URL est requis")
     
     if not supabase_service_key:
-        print("⚠️ SUPABASE_SERVICE_ROLE_KEY non configurée. Les fonctionnalités price_history et cache seront désactivées.")
+        if not _service_key_warned:
+            print("⚠️ SUPABASE_SERVICE_ROLE_KEY non configurée. Les fonctionnalités price_history et cache seront désactivées.")
+            _service_key_warned = True
         return None
     
-    return create_client(supabase_url, supabase_service_key)
+    with _clients_lock:
+        if _service_client is None:
+            _service_client = _create_client(supabase_url, supabase_service_key)
+    return _service_client
 
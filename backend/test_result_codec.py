@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script de test de l'encodage des résultats stockés (result_codec.py et
+frontend/src/utils/resultCodec.ts, même format "fw<version>:" + base64(zlib(JSON)))
+
+TS_FIXTURE a été produit par encodeResults() du frontend sur TRIPS : le backend doit
+le relire à l'identique, et produire lui-même les mêmes colonnes. En cas de
+modification du format, régénérer la fixture depuis le navigateur (console) :
+    (await import('/src/utils/resultCodec.ts')).encodeResults(<TRIPS>)
+"""
+import base64
+import json
+import sys
+import zlib
+
+from result_codec import decode_results, encode_results, encode_results_text
+
+TRIPS = [
+    {"aller": {"flightNumber": "FR1234", "origin": "BVA", "originFull": "Paris Beauvais", "destination": "BCN",
+               "destinationFull": "Barcelone", "departureTime": "2026-12-04T06:30:00", "price": 19.99, "currency": "EUR"},
+     "retour": {"flightNumber": "FR1235", "origin": "BCN", "originFull": "Barcelone", "destination": "BVA",
+                "destinationFull": "Paris Beauvais", "departureTime": "2026-12-06T21:15:00", "price": 24.5, "currency": "EUR"},
+     "prix_total": 44.49, "destination_code": "BCN"},
+    {"aller": {"flightNumber": "FR8010", "origin": "BVA", "originFull": "Paris Beauvais", "destination": "CIA",
+               "destinationFull": "Rome Ciampino", "departureTime": "2026-12-04T09:05:00", "price": 29.0, "currency": "EUR"},
+     "retour": {"flightNumber": "FR8011", "origin": "CIA", "originFull": "Rome Ciampino", "destination": "BVA",
+                "destinationFull": "Paris Beauvais", "departureTime": "2026-12-07T11:40:00", "price": 31.27, "currency": "EUR"},
+     "prix_total": 60.27, "destination_code": "ROM"},
+    {"aller": {"flightNumber": "FR2203", "origin": "BVA", "originFull": "Paris Beauvais", "destination": "DUB",
+               "destinationFull": "Dublin", "departureTime": "2026-12-05T07:00:00", "price": 14.99, "currency": "EUR"},
+     "retour": {"flightNumber": "FR2204", "origin": "DUB", "originFull": "Dublin", "destination": "BVA",
+                "destinationFull": "Paris Beauvais", "departureTime": "2026-12-07T18:20:00", "price": 17.99, "currency": "EUR"},
+     "prix_total": 32.98, "destination_code": "DUB"},
+]
+
+TS_FIXTURE = (
+    "fw1:eJxdjUtrg0AURv9K+NZXuPPSzOxq0kAXfSCkm2EWE+NCMBqMdhP872UEoXR3Od/lnCcinPcov19A+Ipj+9iVTZx/YvtAII/y8AFC"
+    "Gce66Ya+WdnhLT1Xw63ZHdp4u7f9sPLjuQThOF+6tkcIhHoe4TxezxUCYWI4aa2yWjHhPsF5rbUlYYo9ZbKQNhCuNdwTAg7V5zsWQuy6"
+    "ZkysT6pTJaTSIJyqPQteDylZJf8A55mYOGngvCBJKnVXLowhoYs03tNorSXLgjKhWYSFMDbTMP8rma0ktpLeSpv9+qeaSqrIDelcMRlW"
+    "W01qw5QXBWVCyX1Yll9ukV7B"
+)
+
+
+def _payload(text):
+    """Colonnes JSON d'une forme texte (comparaison indépendante de la compression)"""
+    return json.loads(zlib.decompress(base64.b64decode(text.split(":", 1)[1])))
+
+
+def test_decode_ts_fixture():
+    assert decode_results(TS_FIXTURE) == TRIPS, "fixture du frontend mal décodée"
+
+
+def test_same_columns_as_ts():
+    assert encode_results_text(TRIPS).startswith("fw1:"), "format colonnes (v1) attendu"
+    assert _payload(encode_results_text(TRIPS)) == _payload(TS_FIXTURE), "colonnes différentes du frontend"
+
+
+def test_round_trip():
+    assert decode_results(encode_results(TRIPS)) == TRIPS, "octets"
+    assert decode_results(encode_results_text(TRIPS)) == TRIPS, "texte"
+    assert decode_results(encode_results_text([])) == [], "liste vide"
+
+
+def test_compressed_only():
+    # Champ inattendu : seulement compressé (v0), restitué à l'identique
+    trips = [dict(TRIPS[0], deal_percentile=12.5)]
+    encoded = encode_results_text(trips)
+    assert encoded.startswith("fw0:"), encoded[:4]
+    assert decode_results(encoded) == trips
+
+
+def test_legacy_values():
+    assert decode_results(None) == []
+    assert decode_results(TRIPS) == TRIPS, "liste non encodée"
+    assert decode_results(json.dumps(TRIPS)) == TRIPS, "texte JSON non encodé"
+
+
+def test_unknown_version():
+    unknown = "fw9:" + TS_FIXTURE.split(":", 1)[1]
+    try:
+        decode_results(unknown)
+    except ValueError:
+        return
+    raise AssertionError("une version inconnue doit lever ValueError")
+
+
+def main():
+    """Fonction principale"""
+    print("=" * 60)
+    print("TEST DE L'ENCODAGE DES RÉSULTATS STOCKÉS")
+    print("=" * 60)
+
+    tests = [test_decode_ts_fixture, test_same_columns_as_ts, test_round_trip,
+             test_compressed_only, test_legacy_values, test_unknown_version]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"  {test.__name__}: PASSE")
+        except Exception as e:
+            failed += 1
+            print(f"  {test.__name__}: ECHOUE ({e})")
+
+    if failed:
+        print(f"\n{failed} test(s) échoué(s).")
+    else:
+        print("\nTous les tests sont passés !")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
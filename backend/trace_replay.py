@@ -0,0 +1,431 @@
+"""
+Rejeu d'une trace de requêtes (enregistrée avec FLIGHTWATCHER_TRACE_FILE)
+
+    python trace_replay.py TRACE [--speed 1] [--concurrency 32] [--target URL] [--output rapport.json]
+    python trace_replay.py TRACE --serve [--port 8765]
+
+Sans --target, une instance locale de l'API est démarrée dans le processus avec l'API
+Ryanair remplacée par un bouchon construit depuis la trace : un appel amont déjà vu
+est servi à l'identique (même réponse, même latence), un appel nouveau (cache ou
+planification différents) est reconstitué à partir des vols enregistrés au départ du
+même aéroport (vol le moins cher par destination dans la fenêtre demandée, latence
+tirée parmi les latences enregistrées). Cache local vide (fichier temporaire), sans
+Supabase ni budgets de requêtes (tous les clients rejoués partagent l'adresse locale).
+--serve démarre seulement cette instance (profilage avec un outil externe).
+
+Les requêtes sont envoyées à leur décalage d'origine divisé par --speed (0 = sans
+attente) ; les dates sont décalées d'un nombre entier de semaines pour tomber dans le
+futur en conservant les jours de la semaine. Le rapport compare, par route, latences,
+statuts, requêtes API et part des réponses sans requête API (cache) à l'enregistrement.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ryanair-py'))
+from ryanair import Ryanair
+
+import request_trace
+
+DEFAULT_PORT = 8765
+
+
+# ---------- Lecture de la trace ----------
+
+def _week_shift(recorded_day: str, today: date) -> int:
+    """Décalage (jours, multiple de 7) qui ramène le jour d'enregistrement à aujourd'hui ou après"""
+    days = (today - date.fromisoformat(recorded_day)).days
+    return max(0, -(-days // 7) * 7)
+
+
+def shift_dates(value: Any, days: int) -> Any:
+    """Décale les dates ISO (AAAA-MM-JJ, éventuellement suivies d'une heure) d'une valeur JSON"""
+    if not days:
+        return value
+    if isinstance(value, dict):
+        return {key: shift_dates(item, days) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shift_dates(item, days) for item in value]
+    if isinstance(value, str) and len(value) >= 10 and value[4] == "-" and value[7] == "-" \
+            and (len(value) == 10 or value[10] == "T"):
+        try:
+            day = date.fromisoformat(value[:10])
+        except ValueError:
+            return value
+        return (day + timedelta(days=days)).isoformat() + value[10:]
+    return value
+
+
+def load_trace(path: str, today: Optional[date] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    (requêtes, appels amont) triés par décalage "at" (secondes). Les segments (une ligne
+    header par démarrage du serveur) sont mis bout à bout, dates décalées dans le futur.
+    """
+    today = today or date.today()
+    requests_, upstream = [], []
+    base, last, shift = 0.0, 0.0, 0
+    with open(path, encoding="utf-8") as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # Dernière ligne tronquée (arrêt brutal)
+            kind = event.get("type")
+            if kind == "header":
+                base = last
+                shift = _week_shift(event["day"], today)
+                continue
+            event["at"] = base + float(event.get("t") or 0)
+            last = max(last, event["at"])
+            if kind == "request":
+                event["body"] = shift_dates(event.get("body"), shift)
+                requests_.append(event)
+            elif kind == "upstream":
+                for field in ("params", "fares", "days"):
+                    if event.get(field) is not None:
+                        event[field] = shift_dates(event[field], shift)
+                upstream.append(event)
+    requests_.sort(key=lambda e: e["at"])
+    upstream.sort(key=lambda e: e["at"])
+    return requests_, upstream
+
+
+# ---------- API Ryanair bouchonnée ----------
+
+def _params_key(url: str, params: Optional[Dict[str, Any]]) -> Tuple:
+    return (url, tuple(sorted((k, str(v)) for k, v in (params or {}).items() if k != "currency")))
+
+
+def _airport(code: str) -> Dict[str, str]:
+    try:
+        from airport_index import get_airport
+        airport = get_airport(code)
+    except Exception:
+        airport = None
+    if not airport:
+        return {"iataCode": code, "name": code, "countryName": ""}
+    return {"iataCode": code, "name": airport["city"], "countryName": airport["country"]}
+
+
+class UpstreamStub:
+    """Réponses amont reconstituées depuis les appels enregistrés"""
+
+    def __init__(self, upstream: List[Dict[str, Any]], latency_scale: float = 1.0, seed: int = 0):
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = defaultdict(list)
+        self._fares: Dict[str, List[list]] = defaultdict(list)  # départ -> vols enregistrés
+        self._days: Dict[Tuple[str, str], Dict[str, list]] = defaultdict(dict)  # (départ, arrivée) -> jour -> tarif
+        self._counters = {"exact": 0, "synthesized": 0, "errors": 0}
+
+        responses: Dict[Tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for event in upstream:
+            self._latencies[event["endpoint"]].append(event["ms"])
+            responses[_params_key(event["url"], event["params"])].append(event)
+            if event.get("fares"):
+                self._fares[event["params"].get("departureAirportIataCode")].extend(event["fares"])
+            if event.get("days"):
+                departure, arrival = event["url"].rstrip("/").split("/")[-3:-1]
+                for day in event["days"]:
+                    self._days[(departure, arrival)][day[0]] = day
+        # Un appel répété (rafraîchissement) reçoit les réponses enregistrées dans l'ordre
+        self._exact = {key: itertools.cycle(events) for key, events in responses.items()}
+
+    def _latency(self, endpoint: str) -> float:
+        latencies = self._latencies.get(endpoint)
+        with self._lock:
+            return self._random.choice(latencies) if latencies else 0.0
+
+    def respond(self, url: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        endpoint = request_trace.upstream_endpoint(url)
+        params = params or {}
+        with self._lock:
+            recorded = self._exact.get(_params_key(url, params))
+            event = next(recorded) if recorded is not None else None
+        if event is not None:
+            self._counters["exact"] += 1
+            time.sleep(event["ms"] / 1000 * self.latency_scale)
+            if event.get("error"):
+                self._counters["errors"] += 1
+                raise RuntimeError(f"Erreur amont enregistrée: {event['error']}")
+            if endpoint == "cheapestPerDay":
+                return self._calendar_response(event.get("days") or [])
+            if endpoint == "oneWayFares":
+                return self._fares_response(params.get("departureAirportIataCode"), event.get("fares") or [])
+            return {}
+
+        self._counters["synthesized"] += 1
+        time.sleep(self._latency(endpoint) / 1000 * self.latency_scale)
+        if endpoint == "cheapestPerDay":
+            departure, arrival = url.rstrip("/").split("/")[-3:-1]
+            month = str(params.get("outboundMonthOfDate", ""))[:7]
+            days = [day for key, day in sorted(self._days.get((departure, arrival), {}).items()) if key[:7] == month]
+            return self._calendar_response(days)
+        if endpoint == "oneWayFares":
+            return self._fares_response(params.get("departureAirportIataCode"), self._synthesize_fares(params))
+        return {}
+
+    def _synthesize_fares(self, params: Dict[str, Any]) -> List[list]:
+        """Vol enregistré le moins cher par destination dans la fenêtre (dates, horaires, prix max)"""
+        date_from = str(params.get("outboundDepartureDateFrom"))
+        date_to = str(params.get("outboundDepartureDateTo"))
+        time_from = str(params.get("outboundDepartureTimeFrom", "00:00"))
+        time_to = str(params.get("outboundDepartureTimeTo", "23:59"))
+        arrival = params.get("arrivalAirportIataCode")
+        max_price = params.get("priceValueTo")
+        cheapest: Dict[str, list] = {}
+        for fare in self._fares.get(params.get("departureAirportIataCode"), []):
+            destination, departure_time, price = fare[0], fare[1], fare[2]
+            if arrival and destination != arrival:
+                continue
+            if not (date_from <= departure_time[:10] <= date_to and time_from <= departure_time[11:16] <= time_to):
+                continue
+            if max_price and price > float(max_price):
+                continue
+            if destination not in cheapest or price < cheapest[destination][2]:
+                cheapest[destination] = fare
+        return sorted(cheapest.values(), key=lambda fare: fare[2])
+
+    @staticmethod
+    def _fares_response(departure: str, fares: List[list]) -> Dict[str, Any]:
+        origin = _airport(departure)
+        return {"fares": [
+            {"outbound": {
+                "departureAirport": origin,
+                "arrivalAirport": _airport(destination),
+                "departureDate": departure_time,
+                "flightNumber": flight_number,
+                "price": {"value": price, "currencyCode": currency},
+            }}
+            for destination, departure_time, price, currency, flight_number in fares
+        ]}
+
+    @staticmethod
+    def _calendar_response(days: List[list]) -> Dict[str, Any]:
+        return {"outbound": {"fares": [
+            {"day": day, "departureDate": departure_time, "price": {"value": price, "currencyCode": currency},
+             "unavailable": False, "soldOut": False}
+            for day, departure_time, price, currency in days
+        ]}}
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._counters)
+
+
+class ReplayRyanair(Ryanair):
+    """Client Ryanair servi par le bouchon (aucune connexion réseau)"""
+    stub: Optional[UpstreamStub] = None
+
+    def __init__(self, currency: Optional[str] = None):
+        self.currency = currency
+        self._num_queries = 0
+
+    def _retryable_query(self, url, params=None):
+        self._num_queries += 1
+        return ReplayRyanair.stub.respond(url, params)
+
+
+# ---------- Instance locale ----------
+
+def start_local_api(upstream: List[Dict[str, Any]], port: int = DEFAULT_PORT, store: Optional[str] = None,
+                    latency_scale: float = 1.0):
+    """Démarre l'API dans le processus (thread uvicorn) avec l'API Ryanair bouchonnée"""
+    import uvicorn
+
+    os.environ["FLIGHTWATCHER_LOCAL_STORE"] = store or os.path.join(tempfile.mkdtemp(prefix="flightwatcher-replay-"),
+                                                                   "fare_store.sqlite3")
+    os.environ.setdefault("FLIGHTWATCHER_WARMUP_TASKS", "none")
+    os.environ.setdefault("FLIGHTWATCHER_USER_QUERY_BUDGET", "100000000")
+    os.environ.setdefault("FLIGHTWATCHER_GLOBAL_QUERY_BUDGET", "100000000")
+    os.environ.setdefault("FLIGHTWATCHER_INSPIRE_ORIGINS", "")
+    os.environ.setdefault("FLIGHTWATCHER_PRICE_HISTORY_COMPACT_SECONDS", "0")
+    # Caches vides au départ : le snapshot du serveur local ne fausse pas le rejeu
+    os.environ.setdefault("FLIGHTWATCHER_SNAPSHOT_FILE", "none")
+    # Variables vides : load_dotenv ne les remplace pas, Supabase reste désactivé
+    for name in ("SUPABASE_URL", "SUPABASE_ANON_KEY", "SUPABASE_SERVICE_ROLE_KEY"):
+        os.environ[name] = ""
+    # Les requêtes rejouées ne sont pas elles-mêmes tracées
+    request_trace.recorder = request_trace.TraceRecorder(path="")
+
+    import ryanair_client
+    ReplayRyanair.stub = UpstreamStub(upstream, latency_scale=latency_scale)
+    ryanair_client.set_client_class(ReplayRyanair)
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="replay-api", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Impossible de démarrer l'API locale sur le port {port}")
+        time.sleep(0.05)
+    return server, thread
+
+
+# ---------- Rejeu ----------
+
+def _send(client: httpx.Client, event: Dict[str, Any], sent_at: float) -> Dict[str, Any]:
+    result = {"route": event["route"], "lag_ms": round((time.monotonic() - sent_at) * 1000, 1)}
+    started = time.perf_counter()
+    try:
+        response = client.request(event.get("method", "POST"), event["route"], json=event.get("body"))
+        result["status"] = response.status_code
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and isinstance(payload.get("nombre_requetes"), int):
+            result["queries"] = payload["nombre_requetes"]
+    except httpx.HTTPError as e:
+        result["status"] = type(e).__name__
+    result["ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def replay(requests_: List[Dict[str, Any]], target: str, speed: float = 1.0, concurrency: int = 32,
+           timeout: float = 120.0) -> Tuple[List[Dict[str, Any]], float]:
+    """Envoie les requêtes à leur décalage d'origine / speed ; retourne (résultats, durée en secondes)"""
+    if not requests_:
+        return [], 0.0
+    first = requests_[0]["at"]
+    futures = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(base_url=target, timeout=timeout, limits=limits) as client, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.monotonic()
+        for event in requests_:
+            if speed > 0:
+                delay = started + (event["at"] - first) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(_send, client, event, time.monotonic()))
+        results = [future.result() for future in futures]
+    return results, time.monotonic() - started
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 1)
+
+
+def build_report(requests_: List[Dict[str, Any]], results: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    """Comparaison par route : enregistrement (recorded) vs rejeu (replayed)"""
+    routes: Dict[str, Dict[str, Any]] = {}
+    for event, result in zip(requests_, results):
+        route = routes.setdefault(event["route"], {"recorded": defaultdict(list), "replayed": defaultdict(list)})
+        for side, source in (("recorded", event), ("replayed", result)):
+            values = route[side]
+            values["ms"].append(source.get("ms") or 0.0)
+            values["status"].append(str(source.get("status")))
+            if source.get("queries") is not None:
+                values["queries"].append(source["queries"])
+        route["replayed"]["lag_ms"].append(result["lag_ms"])
+
+    def summary(values: Dict[str, list]) -> Dict[str, Any]:
+        statuses: Dict[str, int] = defaultdict(int)
+        for status in values["status"]:
+            statuses[status] += 1
+        queries = values["queries"]
+        return {
+            "p50_ms": _percentile(values["ms"], 0.5),
+            "p95_ms": _percentile(values["ms"], 0.95),
+            "p99_ms": _percentile(values["ms"], 0.99),
+            "statuses": dict(statuses),
+            "api_queries": sum(queries),
+            # Réponses servies sans requête API (cache des scans, des tarifs, matrice découverte)
+            "no_query_ratio": round(sum(1 for q in queries if q == 0) / len(queries), 3) if queries else None,
+        }
+
+    report = {
+        "requests": len(results),
+        "duration_s": round(duration, 2),
+        "throughput_rps": round(len(results) / duration, 2) if duration else None,
+        "clients": len({event.get("client") for event in requests_}),
+        "routes": {},
+    }
+    for name, route in sorted(routes.items()):
+        report["routes"][name] = {
+            "count": len(route["replayed"]["ms"]),
+            "recorded": summary(route["recorded"]),
+            "replayed": summary(route["replayed"]),
+            # Retard d'envoi (client de rejeu saturé si élevé : augmenter --concurrency)
+            "send_lag_p95_ms": _percentile(route["replayed"]["lag_ms"], 0.95),
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"✅ {report['requests']} requête(s) rejouée(s) en {report['duration_s']}s "
+          f"({report['throughput_rps']} req/s, {report['clients']} client(s))")
+    for name, route in report["routes"].items():
+        recorded, replayed = route["recorded"], route["replayed"]
+        print(f"  {name} ×{route['count']}")
+        print(f"    latence p50/p95/p99 : {replayed['p50_ms']}/{replayed['p95_ms']}/{replayed['p99_ms']} ms "
+              f"(enregistré {recorded['p50_ms']}/{recorded['p95_ms']}/{recorded['p99_ms']} ms)")
+        print(f"    requêtes API : {replayed['api_queries']} (enregistré {recorded['api_queries']}), "
+              f"sans requête API : {replayed['no_query_ratio']} (enregistré {recorded['no_query_ratio']})")
+        print(f"    statuts : {replayed['statuses']} (enregistré {recorded['statuses']})")
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rejeu d'une trace de requêtes FlightWatcher")
+    parser.add_argument("trace", help="Fichier enregistré (FLIGHTWATCHER_TRACE_FILE)")
+    parser.add_argument("--target", help="URL d'une API déjà démarrée (défaut : instance locale bouchonnée)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Accélération (2 = deux fois plus vite, 0 = sans attente)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requêtes simultanées max côté rejeu")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplicateur des latences amont")
+    parser.add_argument("--limit", type=int, help="Rejouer seulement les N premières requêtes")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port de l'instance locale")
+    parser.add_argument("--store", help="Fichier SQLite de l'instance locale (défaut : temporaire, cache vide)")
+    parser.add_argument("--output", help="Écrit le rapport JSON dans ce fichier")
+    parser.add_argument("--serve", action="store_true", help="Démarre seulement l'instance locale bouchonnée")
+    args = parser.parse_args(argv)
+
+    requests_, upstream = load_trace(args.trace)
+    if args.limit:
+        requests_ = requests_[:args.limit]
+    print(f"📥 Trace {args.trace}: {len(requests_)} requête(s), {len(upstream)} appel(s) amont")
+
+    target = args.target
+    if not target:
+        start_local_api(upstream, args.port, args.store, args.latency_scale)
+        target = f"http://127.0.0.1:{args.port}"
+        print(f"✅ API locale bouchonnée sur {target}")
+        if args.serve:
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return 0
+
+    results, duration = replay(requests_, target, args.speed, args.concurrency)
+    report = build_report(requests_, results, duration)
+    if ReplayRyanair.stub is not None:
+        report["upstream_stub"] = ReplayRyanair.stub.stats()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
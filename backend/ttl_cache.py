@@ -0,0 +1,101 @@
+"""
+Cache mémoire borné avec expiration (TTL) pour FlightWatcher
+Utilisé pour les structures chaudes du processus (destinations, stats de routes...)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache LRU thread-safe avec durée de vie par entrée.
+    Les entrées expirées sont ignorées à la lecture et évincées paresseusement.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retourne la valeur si présente et non expirée, sinon default"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Ajoute ou remplace une entrée (TTL par défaut du cache si non précisé)"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any],
+                    ttl_seconds: Optional[float] = None) -> Any:
+        """Retourne la valeur en cache ou la charge via loader() puis la met en cache"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        self.set(key, value, ttl_seconds)
+        return value
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Copie des entrées non expirées : [(clé, valeur, expires_at)]"""
+        now = time.time()
+        with self._lock:
+            return [(k, v, exp) for k, (exp, v) in self._data.items() if exp >= now]
+
+    def restore(self, key: Hashable, value: Any, expires_at: float) -> bool:
+        """
+        Réinsère une entrée avec son échéance d'origine (snapshot relu au démarrage).
+        Ignorée si expirée, si la clé est déjà présente (valeur plus récente) ou si le
+        cache est plein : appelée dans l'ordre de items(), l'ordre LRU est conservé.
+        """
+        if expires_at < time.time():
+            return False
+        with self._lock:
+            if key in self._data or len(self._data) >= self.max_size:
+                return False
+            self._data[key] = (expires_at, value)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
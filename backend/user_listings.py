@@ -0,0 +1,90 @@
+"""
+Listes des recherches sauvegardées et des favoris d'un utilisateur
+- Pagination par curseur (created_at, id) : ordre du plus récent au plus ancien,
+  coût constant quelle que soit la page
+- Cache par utilisateur des pages déjà construites (corps JSON sérialisé + ETag),
+  invalidé à chaque sauvegarde ou suppression ; une requête avec If-None-Match
+  identique reçoit 304 sans corps
+L'invalidation est locale au processus : avec plusieurs workers, la durée de vie
+du cache (FLIGHTWATCHER_LISTING_CACHE_TTL) borne le retard d'une page.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from ttl_cache import TTLCache
+
+LISTING_CACHE_TTL = int(os.getenv("FLIGHTWATCHER_LISTING_CACHE_TTL", "300"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+SEARCHES = "searches"
+FAVORITES = "favorites"
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Curseur opaque désignant la dernière ligne d'une page"""
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) ; ValueError si le curseur est invalide"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Curseur invalide")
+    if not isinstance(created_at, str) or not isinstance(row_id, str):
+        raise ValueError("Curseur invalide")
+    return created_at, row_id
+
+
+def page_etag(body: bytes) -> str:
+    return '"' + hashlib.md5(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    # Comparaison faible : W/"x" équivaut à "x"
+    return "*" in candidates or etag in (value[2:] if value.startswith("W/") else value for value in candidates)
+
+
+class ListingCache:
+    """Pages par (type de liste, utilisateur) : {(limit, cursor): {"body", "etag", "next_cursor"}}"""
+
+    def __init__(self, ttl_seconds: int = LISTING_CACHE_TTL, max_users: int = 10000):
+        self._pages = TTLCache(max_size=max_users, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    def get(self, kind: str, user_id: str, page_key: Tuple[int, Optional[str]]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pages = self._pages.get(f"{kind}:{user_id}")
+            page = pages.get(page_key) if pages else None
+            self._counters["hits" if page else "misses"] += 1
+            return page
+
+    def put(self, kind: str, user_id: str, page_key: Tuple[int, Optional[str]], page: Dict[str, Any]) -> None:
+        with self._lock:
+            key = f"{kind}:{user_id}"
+            pages = self._pages.get(key)
+            if pages is None:
+                pages = {}
+                self._pages.set(key, pages)
+            pages[page_key] = page
+
+    def invalidate(self, kind: str, user_id: str) -> None:
+        with self._lock:
+            self._pages.delete(f"{kind}:{user_id}")
+            self._counters["invalidations"] += 1
+
+    def record_not_modified(self) -> None:
+        self._counters["not_modified"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"users": len(self._pages), "ttl_seconds": LISTING_CACHE_TTL, **self._counters}
@@ -1226,6 +1226,9 @@ function SavedTab({ loading, onLoadSearch, onCheckFavorite, onReloadSearch, form
         body: JSON.stringify({
           search_id: search.id,
           previous_results: search.lastCheckResults || [],
+          // Intervalle minimal : le backend espace les vérifications d'une recherche stable
+          // jusqu'à son maximum par défaut (4 x l'intervalle, 3 h au plus, voir CONFIGURATION.md)
+          interval_seconds: search.autoCheckIntervalSeconds || 300,
           ...search.request
         })
       })
@@ -1233,6 +1236,8 @@ function SavedTab({ loading, onLoadSearch, onCheckFavorite, onReloadSearch, form
       if (!response.ok) throw new Error('Erreur lors de la vérification')
 
       const data = await response.json()
+      // Vérification pas encore due côté backend : rien de nouveau
+      if (data.skipped) return
       
       // Mettre à jour les résultats
       updateSearchLastCheckResults(search.id, data.current_results)
@@ -1676,6 +1681,10 @@ function SavedTab({ loading, onLoadSearch, onCheckFavorite, onReloadSearch, form
                         {search.autoCheckEnabled ? '⏸️ Désactiver' : '▶️ Activer'}
                       </button>
                     </div>
+                    <p className="mt-2 text-xs text-gray-500">
+                      Tant que les résultats ne changent pas, le serveur espace les vérifications
+                      jusqu'à 4 fois cet intervalle (3 h au plus), et revient à cet intervalle dès qu'un prix change.
+                    </p>
                   </div>
                 )}
               </div>
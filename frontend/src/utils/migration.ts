@@ -6,6 +6,7 @@
 import { getSupabaseClient } from '../lib/supabase'
 import type { SavedSearch, SavedFavorite } from './storage'
 import { getSavedSearches, getFavorites } from './storage'
+import { encodeResults } from './resultCodec'
 
 /**
  * Migre les données localStorage vers Supabase
@@ -60,7 +61,7 @@ export const migrateLocalStorageToSupabase = async (userId: string): Promise<{
     // Migrer les recherches sauvegardées
     const localSearches = await getSavedSearches()
     if (localSearches.length > 0) {
-      const searchesToInsert = localSearches.map((search: SavedSearch) => ({
+      const searchesToInsert = await Promise.all(localSearches.map(async (search: SavedSearch) => ({
         user_id: userId,
         name: search.name,
         departure_airport: search.request.aeroport_depart || 'BVA',
@@ -73,10 +74,10 @@ export const migrateLocalStorageToSupabase = async (userId: string): Promise<{
         auto_check_enabled: search.autoCheckEnabled || false,
         check_interval_seconds: search.autoCheckIntervalSeconds || 3600,
         last_checked_at: search.lastCheckedAt || null,
-        last_check_results: search.lastCheckResults || null,
+        last_check_results: search.lastCheckResults ? await encodeResults(search.lastCheckResults) : null,
         times_used: 0,
         last_used: search.lastUsed || null
-      }))
+      })))
 
       const { error: searchesError } = await supabase
         .from('saved_searches')
@@ -0,0 +1,200 @@
+import { FlightResponse, TripResponse } from '../types'
+
+/**
+ * Encodage compact des résultats stockés (saved_searches.last_check_results)
+ * Même format que backend/result_codec.py : "fw<version>:" + base64(zlib(JSON)).
+ * v1 = colonnes (aéroports dédupliqués, horaires en minutes, prix en centimes codés en
+ * différence), v0 = JSON simplement compressé. Sans CompressionStream (ancien navigateur)
+ * ou pour des voyages hors format, les résultats sont stockés tels quels.
+ * Round-trip et compatibilité avec le backend : backend/test_result_codec.py.
+ */
+
+const TEXT_PREFIX = 'fw'
+const LEGS = ['aller', 'retour'] as const
+const TRIP_KEYS = ['aller', 'destination_code', 'prix_total', 'retour']
+const FLIGHT_KEYS = ['currency', 'departureTime', 'destination', 'destinationFull', 'flightNumber', 'origin', 'originFull', 'price']
+const TIME_PATTERN = /^(\d{4}-\d{2}-\d{2})T(\d{2}):(\d{2}):00$/
+
+interface LegColumns {
+  n: string[]
+  o: number[]
+  d: number[]
+  t: number[]
+  p: number[]
+  c?: number[]
+}
+
+interface ColumnsPayload {
+  a: [string, string][]
+  cur: string[]
+  t0: number
+  pt: number[]
+  dc: Record<string, string>
+  aller: LegColumns
+  retour: LegColumns
+}
+
+const compressionAvailable = () =>
+  typeof CompressionStream !== 'undefined' && typeof DecompressionStream !== 'undefined'
+
+const sameKeys = (value: object, keys: string[]) => {
+  const actual = Object.keys(value).sort()
+  return actual.length === keys.length && actual.every((key, index) => key === keys[index])
+}
+
+// Minutes depuis 1970 (heure locale de l'aéroport, sans fuseau) ; null si non restituable
+const toMinutes = (departureTime: string): number | null => {
+  const match = TIME_PATTERN.exec(departureTime)
+  if (!match) return null
+  const day = Date.parse(`${match[1]}T00:00:00Z`)
+  const hours = Number(match[2])
+  const minutes = Number(match[3])
+  if (Number.isNaN(day) || hours > 23 || minutes > 59) return null
+  if (new Date(day).toISOString().slice(0, 10) !== match[1]) return null
+  return day / 60000 + hours * 60 + minutes
+}
+
+const fromMinutes = (minutes: number) => new Date(minutes * 60000).toISOString().slice(0, 19)
+
+const toCents = (price: number): number | null => {
+  const cents = Math.round(price * 100)
+  return cents / 100 === price ? cents : null
+}
+
+const deltas = (values: number[]) => values.map((value, index) => value - (index ? values[index - 1] : 0))
+
+const undeltas = (values: number[]) => {
+  let total = 0
+  return values.map(delta => (total += delta))
+}
+
+const toColumns = (results: TripResponse[]): ColumnsPayload | null => {
+  const airports = new Map<string, number>()
+  const airportList: [string, string][] = []
+  const currencies = new Map<string, number>()
+  const airport = (code: string, name: string) => {
+    const key = `${code}\u0000${name}`
+    if (!airports.has(key)) {
+      airports.set(key, airportList.length)
+      airportList.push([code, name])
+    }
+    return airports.get(key)!
+  }
+  const legs: Record<'aller' | 'retour', Required<LegColumns>> = {
+    aller: { n: [], o: [], d: [], t: [], p: [], c: [] },
+    retour: { n: [], o: [], d: [], t: [], p: [], c: [] }
+  }
+  const totals: number[] = []
+  const destinationCodes: Record<string, string> = {}
+
+  for (const [index, trip] of results.entries()) {
+    if (!trip || typeof trip !== 'object' || !sameKeys(trip, TRIP_KEYS)) return null
+    const total = typeof trip.prix_total === 'number' ? toCents(trip.prix_total) : null
+    if (total === null || typeof trip.destination_code !== 'string') return null
+    totals.push(total)
+    for (const leg of LEGS) {
+      const flight: FlightResponse = trip[leg]
+      if (!flight || typeof flight !== 'object' || !sameKeys(flight, FLIGHT_KEYS)) return null
+      if ([flight.flightNumber, flight.origin, flight.originFull, flight.destination, flight.destinationFull,
+        flight.departureTime, flight.currency].some(value => typeof value !== 'string')) return null
+      const minutes = toMinutes(flight.departureTime)
+      const price = typeof flight.price === 'number' ? toCents(flight.price) : null
+      if (minutes === null || price === null) return null
+      const column = legs[leg]
+      column.n.push(flight.flightNumber)
+      column.o.push(airport(flight.origin, flight.originFull))
+      column.d.push(airport(flight.destination, flight.destinationFull))
+      column.t.push(minutes)
+      column.p.push(price)
+      if (!currencies.has(flight.currency)) currencies.set(flight.currency, currencies.size)
+      column.c.push(currencies.get(flight.currency)!)
+    }
+    if (trip.destination_code !== trip.aller.destination) destinationCodes[index] = trip.destination_code
+  }
+
+  const allMinutes = [...legs.aller.t, ...legs.retour.t]
+  const base = allMinutes.length ? Math.min(...allMinutes) : 0
+  const encodeLeg = (column: Required<LegColumns>): LegColumns => ({
+    n: column.n,
+    o: column.o,
+    d: column.d,
+    t: column.t.map(minutes => minutes - base),
+    p: deltas(column.p),
+    // Une seule devise (cas courant) : pas de colonne
+    ...(currencies.size > 1 ? { c: column.c } : {})
+  })
+  return {
+    a: airportList,
+    cur: [...currencies.keys()],
+    t0: base,
+    pt: deltas(totals),
+    dc: destinationCodes,
+    aller: encodeLeg(legs.aller),
+    retour: encodeLeg(legs.retour)
+  }
+}
+
+const fromColumns = (payload: ColumnsPayload): TripResponse[] => {
+  const flights = (column: LegColumns): FlightResponse[] => {
+    const prices = undeltas(column.p)
+    return prices.map((price, i) => ({
+      flightNumber: column.n[i],
+      origin: payload.a[column.o[i]][0],
+      originFull: payload.a[column.o[i]][1],
+      destination: payload.a[column.d[i]][0],
+      destinationFull: payload.a[column.d[i]][1],
+      departureTime: fromMinutes(payload.t0 + column.t[i]),
+      price: price / 100,
+      currency: payload.cur[column.c ? column.c[i] : 0]
+    }))
+  }
+  const allers = flights(payload.aller)
+  const retours = flights(payload.retour)
+  const totals = undeltas(payload.pt)
+  return allers.map((aller, i) => ({
+    aller,
+    retour: retours[i],
+    prix_total: totals[i] / 100,
+    destination_code: payload.dc[i] ?? aller.destination
+  }))
+}
+
+const streamBytes = async (data: Uint8Array, stream: CompressionStream | DecompressionStream) =>
+  new Uint8Array(await new Response(new Blob([data]).stream().pipeThrough(stream)).arrayBuffer())
+
+const toBase64 = (bytes: Uint8Array) => {
+  let binary = ''
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000))
+  }
+  return btoa(binary)
+}
+
+const fromBase64 = (text: string) => Uint8Array.from(atob(text), char => char.charCodeAt(0))
+
+/** Résultats -> forme stockée ("fw1:..." si possible, sinon la liste telle quelle) */
+export const encodeResults = async (results: TripResponse[]): Promise<TripResponse[] | string> => {
+  const payload = toColumns(results)
+  if (!payload || !compressionAvailable()) return results
+  const compressed = await streamBytes(new TextEncoder().encode(JSON.stringify(payload)), new CompressionStream('deflate'))
+  return `${TEXT_PREFIX}1:${toBase64(compressed)}`
+}
+
+/**
+ * Forme stockée -> résultats (accepte les listes et le texte JSON d'avant l'encodage).
+ * Lève une erreur si la valeur ne peut pas être décodée (navigateur sans
+ * DecompressionStream, version inconnue) : des résultats stockés ne sont jamais ignorés.
+ */
+export const decodeResults = async (stored: unknown): Promise<TripResponse[] | undefined> => {
+  if (stored === null || stored === undefined) return undefined
+  if (Array.isArray(stored)) return stored as TripResponse[]
+  if (typeof stored !== 'string') throw new Error(`Résultats stockés dans une forme inattendue: ${typeof stored}`)
+  if (!stored.startsWith(TEXT_PREFIX)) return JSON.parse(stored) as TripResponse[]
+  const separator = stored.indexOf(':')
+  const version = Number(stored.slice(TEXT_PREFIX.length, separator))
+  if (version !== 0 && version !== 1) throw new Error(`Version d'encodage des résultats inconnue: ${version}`)
+  if (!compressionAvailable()) throw new Error('DecompressionStream indisponible : résultats encodés illisibles')
+  const data = await streamBytes(fromBase64(stored.slice(separator + 1)), new DecompressionStream('deflate'))
+  const decoded = JSON.parse(new TextDecoder().decode(data))
+  return version === 0 ? decoded as TripResponse[] : fromColumns(decoded as ColumnsPayload)
+}
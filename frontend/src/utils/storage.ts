@@ -1,5 +1,6 @@
 import { ScanRequest, TripResponse } from '../types'
 import { getSupabaseClient, getCurrentUser } from '../lib/supabase'
+import { decodeResults, encodeResults } from './resultCodec'
 
 export interface SavedSearch {
   id: string
@@ -32,6 +33,17 @@ const STORAGE_KEYS = {
   AUTO_EXPORT_ENABLED: 'flightwatcher_auto_export_enabled'
 }
 
+// Résultats stockés illisibles dans ce navigateur : la recherche reste listée et l'erreur
+// est signalée ; la valeur stockée n'est réécrite qu'à la prochaine vérification
+const decodeStoredResults = async (searchId: string, stored: unknown): Promise<TripResponse[] | undefined> => {
+  try {
+    return await decodeResults(stored)
+  } catch (error) {
+    console.error(`Résultats de la recherche ${searchId} illisibles:`, error)
+    return undefined
+  }
+}
+
 export interface NewResult {
   searchId: string
   searchName: string
@@ -102,7 +114,7 @@ export const saveSearch = async (search: Omit<SavedSearch, 'id' | 'createdAt'>):
           destinations_incluses: search.request.destinations_incluses || null,
           auto_check_enabled: search.autoCheckEnabled || false,
           check_interval_seconds: search.autoCheckIntervalSeconds || 3600,
-          last_check_results: search.lastCheckResults || null,
+          last_check_results: search.lastCheckResults ? await encodeResults(search.lastCheckResults) : null,
           last_checked_at: search.lastCheckedAt || null
         })
         .select()
@@ -126,7 +138,7 @@ export const saveSearch = async (search: Omit<SavedSearch, 'id' | 'createdAt'>):
         lastUsed: data.last_used,
         autoCheckEnabled: data.auto_check_enabled,
         autoCheckIntervalSeconds: data.check_interval_seconds,
-        lastCheckResults: data.last_check_results,
+        lastCheckResults: await decodeStoredResults(data.id, data.last_check_results),
         lastCheckedAt: data.last_checked_at
       }
       
@@ -167,7 +179,7 @@ export const getSavedSearches = async (): Promise<SavedSearch[]> => {
       
       if (error) throw error
       
-      return (data || []).map((item: any) => ({
+      return await Promise.all((data || []).map(async (item: any) => ({
         id: item.id,
         name: item.name,
         request: {
@@ -183,9 +195,9 @@ export const getSavedSearches = async (): Promise<SavedSearch[]> => {
         lastUsed: item.last_used,
         autoCheckEnabled: item.auto_check_enabled,
         autoCheckIntervalSeconds: item.check_interval_seconds,
-        lastCheckResults: item.last_check_results,
+        lastCheckResults: await decodeStoredResults(item.id, item.last_check_results),
         lastCheckedAt: item.last_checked_at
-      }))
+      })))
     } catch (error) {
       console.error('Erreur récupération Supabase, fallback localStorage:', error)
       // Fallback localStorage
@@ -315,7 +327,7 @@ export const updateSearchLastCheckResults = async (
       const { error } = await supabase
         .from('saved_searches')
         .update({
-          last_check_results: results,
+          last_check_results: await encodeResults(results),
           last_checked_at: new Date().toISOString()
         })
         .eq('id', id)
@@ -0,0 +1,37 @@
+-- ============================================
+-- FlightWatcher - Revalidation groupée des favoris
+-- ============================================
+-- Déjà inclus dans supabase_schema_v2.sql : à exécuter une fois sur une base créée avec
+-- une version antérieure du schéma (sans favorites.current_price). Tant que la colonne
+-- manque, le backend ne la lit pas et ne lance pas la revalidation.
+-- Le backend (clé service_role) revalide périodiquement tous les favoris actifs et
+-- écrit disponibilité et prix courant en un appel par lot via update_favorites_availability().
+
+-- Prix courant du voyage (aller + retour) lors de la dernière vérification
+ALTER TABLE favorites ADD COLUMN IF NOT EXISTS current_price DECIMAL(10,2);
+
+-- Lecture des favoris actifs à revalider (vols à venir, pagination par id)
+CREATE INDEX IF NOT EXISTS idx_favorites_revalidation ON favorites(outbound_date, id) WHERE is_archived = FALSE;
+
+-- Mise à jour groupée : p_updates = [{"id", "is_available", "current_price", "last_availability_check"}, ...]
+CREATE OR REPLACE FUNCTION update_favorites_availability(p_updates JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE favorites f
+        SET is_available = u.is_available,
+            current_price = u.current_price,
+            last_availability_check = u.last_availability_check
+        FROM jsonb_to_recordset(p_updates) AS u(
+            id UUID,
+            is_available BOOLEAN,
+            current_price DECIMAL(10,2),
+            last_availability_check TIMESTAMPTZ
+        )
+        WHERE f.id = u.id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$ LANGUAGE SQL;
+
+-- Réservée au backend
+REVOKE EXECUTE ON FUNCTION update_favorites_availability(JSONB) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,294 @@
+-- ============================================
+-- FlightWatcher - Cycle de vie de price_history
+-- ============================================
+-- À exécuter une fois après supabase_schema_v2.sql (éditeur SQL Supabase).
+--
+-- - price_history devient une table partitionnée par mois (recorded_at) : les index
+--   restent à la taille d'un mois et la suppression d'un mois est un DROP instantané
+-- - price_history_daily : agrégats par route, date de vol et jour d'observation
+--   (min, max, somme, nombre) qui remplacent les observations brutes anciennes
+-- - compact_price_history() : agrège puis supprime les partitions plus anciennes que
+--   la rétention brute, purge les agrégats au-delà de leur rétention et crée les
+--   partitions des mois à venir (à appeler périodiquement, ex: pg_cron quotidien)
+-- - get_avg_price_last_30_days() combine observations brutes et agrégats
+
+-- ============================================
+-- 1. TABLE price_history partitionnée
+-- ============================================
+-- Seule une table non partitionnée est renommée pour reprise : le script peut être
+-- ré-exécuté sans détacher les partitions existantes ni supprimer leurs données
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class
+        WHERE oid = to_regclass('public.price_history') AND relkind <> 'p'
+    ) THEN
+        ALTER TABLE price_history RENAME TO price_history_legacy;
+        ALTER INDEX IF EXISTS idx_price_route_date RENAME TO idx_price_legacy_route_date;
+        ALTER INDEX IF EXISTS idx_price_recorded RENAME TO idx_price_legacy_recorded;
+        ALTER INDEX IF EXISTS idx_price_route RENAME TO idx_price_legacy_route;
+    END IF;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS price_history (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    recorded_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+
+    -- Route
+    departure_airport TEXT NOT NULL,
+    destination_code TEXT NOT NULL,
+    flight_date DATE NOT NULL,
+
+    -- Prix
+    price DECIMAL(10,2) NOT NULL,
+    currency TEXT DEFAULT 'EUR',
+
+    -- Metadata
+    airline TEXT DEFAULT 'Ryanair',
+    source TEXT DEFAULT 'api_scan', -- 'api_scan', 'auto_check', etc.
+    flight_number TEXT,
+
+    -- La clé primaire d'une table partitionnée doit contenir la clé de partition
+    PRIMARY KEY (id, recorded_at),
+    CONSTRAINT valid_price_history CHECK (price > 0)
+) PARTITION BY RANGE (recorded_at);
+
+-- Filet de sécurité : lignes hors des partitions mensuelles existantes (déplacées dans
+-- la partition du mois quand ensure_price_history_partitions la crée)
+CREATE TABLE IF NOT EXISTS price_history_default PARTITION OF price_history DEFAULT;
+
+-- Index déclarés sur la table mère (créés sur chaque partition).
+-- idx_price_recorded disparaît (le partitionnement élimine les mois hors plage) et
+-- idx_price_route est couvert par le préfixe de idx_price_route_recorded.
+CREATE INDEX IF NOT EXISTS idx_price_route_date ON price_history(departure_airport, destination_code, flight_date);
+CREATE INDEX IF NOT EXISTS idx_price_route_recorded ON price_history(departure_airport, destination_code, recorded_at);
+
+-- Crée les partitions mensuelles de p_from_month à p_months_ahead mois après le mois courant.
+-- Les lignes du mois déjà tombées dans price_history_default (partition absente au moment
+-- de l'insertion) y sont déplacées : une partition ne peut pas être créée tant que la
+-- partition par défaut contient des lignes de sa plage.
+CREATE OR REPLACE FUNCTION ensure_price_history_partitions(
+    p_months_ahead INTEGER DEFAULT 2,
+    p_from_month DATE DEFAULT date_trunc('month', NOW())::DATE
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_month DATE := date_trunc('month', p_from_month)::DATE;
+    v_last DATE := (date_trunc('month', NOW()) + make_interval(months => p_months_ahead))::DATE;
+    v_next DATE;
+    v_name TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        v_name := 'price_history_' || to_char(v_month, 'YYYY_MM');
+        v_next := (v_month + INTERVAL '1 month')::DATE;
+        IF to_regclass(v_name) IS NULL THEN
+            -- Table autonome, remplie depuis la partition par défaut, puis rattachée
+            -- (les index de price_history sont créés au rattachement)
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE price_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                v_name
+            );
+            EXECUTE format(
+                'WITH moved AS (
+                     DELETE FROM price_history_default
+                     WHERE recorded_at >= %L AND recorded_at < %L
+                     RETURNING *
+                 )
+                 INSERT INTO %I SELECT * FROM moved',
+                v_month, v_next, v_name
+            );
+            EXECUTE format(
+                'ALTER TABLE price_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_next
+            );
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_next;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Reprise des données existantes : partitions couvrant tout l'historique, puis copie
+DO $$
+DECLARE
+    v_oldest TIMESTAMPTZ;
+BEGIN
+    IF to_regclass('price_history_legacy') IS NOT NULL THEN
+        SELECT MIN(recorded_at) INTO v_oldest FROM price_history_legacy;
+        PERFORM ensure_price_history_partitions(2, COALESCE(v_oldest, NOW())::DATE);
+        INSERT INTO price_history
+            (id, recorded_at, departure_airport, destination_code, flight_date, price,
+             currency, airline, source, flight_number)
+        SELECT id, COALESCE(recorded_at, NOW()), departure_airport, destination_code, flight_date, price,
+               currency, airline, source, flight_number
+        FROM price_history_legacy;
+        DROP TABLE price_history_legacy;
+    ELSE
+        PERFORM ensure_price_history_partitions(2);
+    END IF;
+END;
+$$;
+
+-- ============================================
+-- 2. TABLE price_history_daily (agrégats)
+-- ============================================
+CREATE TABLE IF NOT EXISTS price_history_daily (
+    departure_airport TEXT NOT NULL,
+    destination_code TEXT NOT NULL,
+    flight_date DATE NOT NULL,
+    recorded_day DATE NOT NULL,
+
+    min_price DECIMAL(10,2) NOT NULL,
+    max_price DECIMAL(10,2) NOT NULL,
+    sum_price DECIMAL(14,2) NOT NULL,
+    observations INTEGER NOT NULL,
+
+    PRIMARY KEY (departure_airport, destination_code, recorded_day, flight_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_price_daily_recorded ON price_history_daily(recorded_day);
+
+-- ============================================
+-- 3. Compaction et rétention
+-- ============================================
+-- Agrège puis supprime les partitions entièrement plus anciennes que p_raw_days,
+-- purge les agrégats plus anciens que p_daily_days. Retourne le nombre de partitions supprimées.
+CREATE OR REPLACE FUNCTION compact_price_history(
+    p_raw_days INTEGER DEFAULT 30,
+    p_daily_days INTEGER DEFAULT 730
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_cutoff TIMESTAMPTZ := NOW() - make_interval(days => p_raw_days);
+    v_partition RECORD;
+    v_dropped INTEGER := 0;
+BEGIN
+    PERFORM ensure_price_history_partitions(2);
+
+    FOR v_partition IN
+        SELECT child.relname AS name,
+               to_date(substring(child.relname FROM '(\d{4}_\d{2})$'), 'YYYY_MM') AS month
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'price_history'
+          AND child.relname ~ '^price_history_\d{4}_\d{2}$'
+    LOOP
+        -- Partition entièrement sortie de la fenêtre brute
+        IF (v_partition.month + INTERVAL '1 month') <= v_cutoff THEN
+            EXECUTE format($sql$
+                INSERT INTO price_history_daily AS d
+                    (departure_airport, destination_code, flight_date, recorded_day,
+                     min_price, max_price, sum_price, observations)
+                SELECT departure_airport, destination_code, flight_date, recorded_at::DATE,
+                       MIN(price), MAX(price), SUM(price), COUNT(*)
+                FROM %I
+                GROUP BY departure_airport, destination_code, flight_date, recorded_at::DATE
+                ON CONFLICT (departure_airport, destination_code, recorded_day, flight_date) DO UPDATE SET
+                    min_price = LEAST(d.min_price, EXCLUDED.min_price),
+                    max_price = GREATEST(d.max_price, EXCLUDED.max_price),
+                    sum_price = d.sum_price + EXCLUDED.sum_price,
+                    observations = d.observations + EXCLUDED.observations
+            $sql$, v_partition.name);
+            EXECUTE format('DROP TABLE %I', v_partition.name);
+            v_dropped := v_dropped + 1;
+        END IF;
+    END LOOP;
+
+    DELETE FROM price_history_daily
+    WHERE recorded_day < (NOW() - make_interval(days => p_daily_days))::DATE;
+
+    RETURN v_dropped;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Réservées au backend (clé service_role) : DDL et suppressions de partitions
+REVOKE EXECUTE ON FUNCTION ensure_price_history_partitions(INTEGER, DATE) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION compact_price_history(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION ensure_price_history_partitions(INTEGER, DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION compact_price_history(INTEGER, INTEGER) TO service_role;
+
+-- ============================================
+-- 4. Lectures
+-- ============================================
+-- Moyenne 30 jours : observations brutes + agrégats (disjoints après compaction)
+CREATE OR REPLACE FUNCTION get_avg_price_last_30_days(
+    p_departure TEXT,
+    p_destination TEXT
+)
+RETURNS DECIMAL AS $$
+    SELECT (SUM(total) / NULLIF(SUM(n), 0))::DECIMAL(10,2)
+    FROM (
+        SELECT SUM(price) AS total, COUNT(*) AS n
+        FROM price_history
+        WHERE departure_airport = p_departure
+          AND destination_code = p_destination
+          AND recorded_at > NOW() - INTERVAL '30 days'
+        UNION ALL
+        SELECT SUM(sum_price), SUM(observations)
+        FROM price_history_daily
+        WHERE departure_airport = p_departure
+          AND destination_code = p_destination
+          AND recorded_day > (NOW() - INTERVAL '30 days')::DATE
+    ) parts
+$$ LANGUAGE SQL STABLE;
+
+-- Tendance quotidienne d'une route (min, max, moyenne par jour d'observation)
+CREATE OR REPLACE FUNCTION get_daily_price_trend(
+    p_departure TEXT,
+    p_destination TEXT,
+    p_days INTEGER DEFAULT 365
+)
+RETURNS TABLE (day DATE, min_price DECIMAL, max_price DECIMAL, avg_price DECIMAL, observations BIGINT) AS $$
+    SELECT day, MIN(lo), MAX(hi), (SUM(total) / SUM(n))::DECIMAL(10,2), SUM(n)::BIGINT
+    FROM (
+        SELECT recorded_at::DATE AS day, MIN(price) AS lo, MAX(price) AS hi, SUM(price) AS total, COUNT(*) AS n
+        FROM price_history
+        WHERE departure_airport = p_departure
+          AND destination_code = p_destination
+          AND recorded_at > NOW() - make_interval(days => p_days)
+        GROUP BY recorded_at::DATE
+        UNION ALL
+        SELECT recorded_day, MIN(min_price), MAX(max_price), SUM(sum_price), SUM(observations)
+        FROM price_history_daily
+        WHERE departure_airport = p_departure
+          AND destination_code = p_destination
+          AND recorded_day > (NOW() - make_interval(days => p_days))::DATE
+        GROUP BY recorded_day
+    ) parts
+    GROUP BY day
+    ORDER BY day
+$$ LANGUAGE SQL STABLE;
+
+-- ============================================
+-- 5. RLS (identiques à l'ancienne table)
+-- ============================================
+ALTER TABLE price_history ENABLE ROW LEVEL SECURITY;
+ALTER TABLE price_history_daily ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Anyone can read price history" ON price_history;
+CREATE POLICY "Anyone can read price history"
+    ON price_history FOR SELECT
+    USING (true);
+
+DROP POLICY IF EXISTS "Only service role can insert price history" ON price_history;
+CREATE POLICY "Only service role can insert price history"
+    ON price_history FOR INSERT
+    WITH CHECK (auth.role() = 'service_role');
+
+DROP POLICY IF EXISTS "Anyone can read daily price history" ON price_history_daily;
+CREATE POLICY "Anyone can read daily price history"
+    ON price_history_daily FOR SELECT
+    USING (true);
+
+-- ============================================
+-- NOTES
+-- ============================================
+-- 1. Le backend appelle compact_price_history() périodiquement (clé service_role) ;
+--    avec pg_cron : SELECT cron.schedule('compact-price-history', '15 3 * * *',
+--                   'SELECT compact_price_history(30, 730)');
+-- 2. Une partition n'est supprimée qu'une fois le mois entier sorti de la fenêtre brute :
+--    les observations brutes restent disponibles entre p_raw_days et p_raw_days + 1 mois
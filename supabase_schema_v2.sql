@@ -87,6 +87,7 @@ CREATE TABLE IF NOT EXISTS favorites (
     -- Statut
     is_archived BOOLEAN DEFAULT FALSE,
     is_available BOOLEAN DEFAULT TRUE,
+    current_price DECIMAL(10,2), -- Prix du voyage à la dernière revalidation
     last_availability_check TIMESTAMPTZ,
     
     -- Booking
@@ -101,6 +102,31 @@ CREATE INDEX IF NOT EXISTS idx_favorites_user ON favorites(user_id);
 CREATE INDEX IF NOT EXISTS idx_favorites_active ON favorites(user_id, is_archived) WHERE is_archived = FALSE;
 CREATE INDEX IF NOT EXISTS idx_favorites_search_id ON favorites(search_id);
 CREATE INDEX IF NOT EXISTS idx_favorites_created_at ON favorites(created_at DESC);
+-- Lecture des favoris actifs à revalider (vols à venir, pagination par id)
+CREATE INDEX IF NOT EXISTS idx_favorites_revalidation ON favorites(outbound_date, id) WHERE is_archived = FALSE;
+
+-- Revalidation groupée par le backend (clé service_role) :
+-- p_updates = [{"id", "is_available", "current_price", "last_availability_check"}, ...]
+CREATE OR REPLACE FUNCTION update_favorites_availability(p_updates JSONB)
+RETURNS INTEGER AS $$
+    WITH updated AS (
+        UPDATE favorites f
+        SET is_available = u.is_available,
+            current_price = u.current_price,
+            last_availability_check = u.last_availability_check
+        FROM jsonb_to_recordset(p_updates) AS u(
+            id UUID,
+            is_available BOOLEAN,
+            current_price DECIMAL(10,2),
+            last_availability_check TIMESTAMPTZ
+        )
+        WHERE f.id = u.id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$ LANGUAGE SQL;
+
+REVOKE EXECUTE ON FUNCTION update_favorites_availability(JSONB) FROM PUBLIC, anon, authenticated;
 
 -- ============================================
 -- 4. TABLE price_history (VOTRE MOAT)